@@ -0,0 +1,99 @@
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+
+from benchmarks.batch_game import scalarActions, setup
+from game.game import Game
+from game.state import PlayerExternal, PlayerInternal, StateView
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
+from util.card_definitions import CardDefinitions
+from util.helpers import getValidActionsInState
+from util.q_table import QTable
+from util.state_key import statusCodes
+
+'''
+Checks that ActionMasks gives the same valid actions as getValidActionsInState,
+and compares how fast each of them is on the states of random games.
+
+Run from the repository root, with data/cards.json and data/characters.json:
+	python -m benchmarks.action_masks --games 200
+'''
+
+'''
+Play random games, returning a copy of the acting player's view for every
+action that was chosen. Only the fields valid actions depend on are copied
+'''
+def collectStates(num_games, deck_params, character_params):
+	states = []
+	for _ in range(num_games):
+		game = Game(QTable(), {}, {}, deck_params, character_params)
+		for p, _ in scalarActions(game):
+			internal = game.internals[p]
+			external = game.externals[p]
+			states.append(StateView(
+				None,
+				PlayerInternal(internal.status, list(internal.cards)),
+				PlayerExternal(external.hp, external.hp_until_max, external.sp, external.max_sp),
+				None,
+				None
+			))
+	return states
+
+def runCheck(states):
+	expected = [Counter([ActionCatalog.getId(action) for action in getValidActionsInState(state)]) for state in states]
+	for i, state in enumerate(states):
+		if Counter(ActionMasks.validActionIds(state)) != expected[i]:
+			raise Exception("State {} differs".format(i))
+
+	hands = np.zeros((len(states), len(CardDefinitions.definitions)), dtype=np.int64)
+	for i, state in enumerate(states):
+		hands[i] = state.internal.hand
+	masks = ActionMasks.masks(
+		[statusCodes[state.internal.status] for state in states],
+		[state.external.sp for state in states],
+		hands
+	)
+	ids = np.array([ActionCatalog.getId(action) for action in ActionCatalog.actions])
+	for i in range(len(states)):
+		if set(ids[masks[i]]) != set(expected[i]):
+			raise Exception("Mask {} differs".format(i))
+
+def benchmarkHelpers(states):
+	start = time.perf_counter()
+	for state in states:
+		[ActionCatalog.getId(action) for action in getValidActionsInState(state)]
+	return time.perf_counter() - start
+
+def benchmarkMasks(states):
+	ActionMasks.build()
+	start = time.perf_counter()
+	for state in states:
+		ActionMasks.validActionIds(state)
+	return time.perf_counter() - start
+
+def main():
+	parser = argparse.ArgumentParser(description = "Check and benchmark memoized action masks")
+	parser.add_argument("--games", type = int, default = 200)
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	np.random.seed(args.seed)
+	deck_params, character_params = setup()
+	# ids as they would be on a fresh database
+	ActionCatalog.setIds(range(1, len(ActionCatalog.actions) + 1))
+	ActionMasks.build()
+
+	states = collectStates(args.games, deck_params, character_params)
+	runCheck(states)
+	print("valid actions match over {} states".format(len(states)))
+
+	seconds = benchmarkHelpers(states)
+	print("getValidActionsInState: {:.0f} states/s".format(len(states) / seconds))
+	seconds = benchmarkMasks(states)
+	print("ActionMasks: {:.0f} states/s, hit rate {:.3f}".format(len(states) / seconds, ActionMasks.hits / len(states)))
+
+if __name__ == "__main__":
+	main()
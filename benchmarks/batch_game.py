@@ -0,0 +1,90 @@
+import argparse
+import time
+
+import numpy as np
+
+from game.batch_game import BatchGame
+from game.game import Game
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
+from util.card_definitions import CardDefinitions
+from util.helpers import getValidActionsInState, loadCardDefinitions, loadCharacterDefinitions
+from util.q_table import QTable
+
+'''
+Compares how many random actions per second Game and BatchGame can play. Both
+only count actions which were actually played, so games which finished early in
+a batch don't count while the rest of the batch plays on. That BatchGame follows
+the same rules as Game is checked by tests/test_batch_game.py.
+
+Run from the repository root, with data/cards.json and data/characters.json:
+	python -m benchmarks.batch_game --batch-size 1000
+'''
+
+def setup():
+	cards = loadCardDefinitions()
+	CardDefinitions.setDefinitions(cards["main"], cards["treasures"], cards["answers"])
+	ActionCatalog.build()
+	ActionMasks.build()
+	deck_params = {
+		"main_cards": CardDefinitions.cards["main"],
+		"treasure_cards": CardDefinitions.cards["treasures"],
+		"answer_cards": CardDefinitions.cards["answers"]
+	}
+	character_params = {
+		"characters": loadCharacterDefinitions()
+	}
+	return deck_params, character_params
+
+'''
+Play a scalar game with random actions, yielding (player, action) before each
+action is executed
+'''
+def scalarActions(game):
+	while game.g.turn < game.max_turns:
+		for p in range(len(game.players)):
+			external = game.externals[p]
+			external.sp = external.max_sp
+			view = game.views[p]
+			while True:
+				actions = getValidActionsInState(view)
+				action = actions[np.random.randint(len(actions))]
+				yield p, action
+				if not game._executeActionForP(action, p):
+					break
+				if game.winning_player != None:
+					return
+		game.g.turn += 1
+
+def benchmarkScalar(num_games, deck_params, character_params):
+	steps = 0
+	start = time.perf_counter()
+	for _ in range(num_games):
+		game = Game(QTable(), {}, {}, deck_params, character_params)
+		for _ in scalarActions(game):
+			steps += 1
+	return steps, time.perf_counter() - start
+
+def benchmarkBatch(num_games, deck_params, character_params):
+	start = time.perf_counter()
+	batch = BatchGame(num_games, {}, deck_params, character_params, seed=0)
+	actions = batch.run()
+	return actions, time.perf_counter() - start
+
+def main():
+	parser = argparse.ArgumentParser(description = "Benchmark the batched game engine")
+	parser.add_argument("--scalar-games", type = int, default = 100)
+	parser.add_argument("--batch-size", type = int, default = 1000)
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	np.random.seed(args.seed)
+	deck_params, character_params = setup()
+
+	steps, seconds = benchmarkScalar(args.scalar_games, deck_params, character_params)
+	print("scalar: {} games, {:.0f} actions/s".format(args.scalar_games, steps / seconds))
+	actions, seconds = benchmarkBatch(args.batch_size, deck_params, character_params)
+	print("batch: {} games, {:.0f} actions/s".format(args.batch_size, actions / seconds))
+
+if __name__ == "__main__":
+	main()
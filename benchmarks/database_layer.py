@@ -0,0 +1,217 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.q_snapshot import randomKeys
+from util.database import Database
+from util.helpers import DatabaseHelpers
+from util.state_key import keyToBlob, statuses, unpackKey
+
+'''
+Times each database operation with the current statements and schema against
+the layer they replaced, where statements had their values formatted in and
+the hand and status of states were stored as text. Both run the same
+operations on their own fresh database, and must read back the same ids.
+
+Run from the repository root:
+	python -m benchmarks.database_layer --states 100000
+'''
+
+'''
+The replaced layer, as it was: text columns, unique constraints instead of
+named indexes, and values formatted into action statements
+'''
+class LegacyLayer:
+	def __init__(self, path):
+		self.connection = sqlite3.connect(path)
+		self.c = self.connection.cursor()
+		self.c.execute("""CREATE TABLE state(
+			id INTEGER PRIMARY KEY,
+			key BLOB NOT NULL UNIQUE,
+			turn TINYINT NOT NULL,card_ids VARCHAR(64) NOT NULL,status VARCHAR(8) NOT NULL,{}
+		)""".format(",".join(["{} TINYINT NOT NULL".format(field) for field in DatabaseHelpers.stateFieldsList[3:]])))
+		self.c.execute("""CREATE TABLE action(
+			id INTEGER PRIMARY KEY,
+			action VARCHAR(4) NOT NULL,card_id TINYINT NOT NULL,target VARCHAR(1) NOT NULL,
+			UNIQUE(action,card_id,target)
+		)""")
+		self.c.execute("""CREATE TABLE q(
+			id INTEGER PRIMARY KEY,
+			state_id INTEGER NOT NULL,
+			action_id INTEGER NOT NULL,
+			q REAL NOT NULL,
+			UNIQUE(state_id, action_id)
+		)""")
+		self.connection.commit()
+
+	@staticmethod
+	def keyToParams(key):
+		# keys only hold a fingerprint of the hand, which stands in for its card
+		# ids as text
+		(turn, status, *externals), hand_key = unpackKey(key)
+		return [keyToBlob(key), turn, str(hand_key), statuses[status], *externals]
+
+	@staticmethod
+	def actionToRow(action):
+		return [
+			"\"{}\"".format(action["action"]),
+			str(action["card_id"]) if action.get("card_id") != None else "\"-1\"",
+			"\"{}\"".format(action["target"]) if action.get("target") != None else "\"\"",
+		]
+
+	def insertStates(self, rows):
+		self.c.executemany("INSERT INTO state (id,key,{}) VALUES (?,?,{})".format(
+			",".join(DatabaseHelpers.legacyStateFieldsList),
+			",".join(["?" for _ in DatabaseHelpers.legacyStateFieldsList])
+		), [(s_id, *self.keyToParams(key)) for s_id, key in rows])
+
+	def selectStateId(self, key):
+		self.c.execute("SELECT id FROM state WHERE key = ?", (keyToBlob(key),))
+		return self.c.fetchone()[0]
+
+	def upsertAction(self, action):
+		row_values = self.actionToRow(action)
+		self.c.execute("""INSERT OR IGNORE INTO action ({}) VALUES ({})""".format(
+			DatabaseHelpers.actionFieldsListString,
+			",".join(row_values),
+		))
+		self.c.execute("""SELECT id FROM action WHERE {} LIMIT 1""".format(
+			" AND ".join(["{}={}".format(DatabaseHelpers.actionFieldsList[i], val) for i, val in enumerate(row_values)])
+		))
+		return self.c.fetchone()[0]
+
+	def selectAction(self, a_id):
+		self.c.execute("SELECT {} FROM action WHERE id = {}".format(DatabaseHelpers.actionFieldsListString, a_id))
+		return DatabaseHelpers.rowToAction(self.c.fetchone())
+
+	def upsertQ(self, rows):
+		self.c.executemany("INSERT OR REPLACE INTO q (state_id, action_id, q) VALUES (?, ?, ?)", rows)
+
+	def loadQ(self):
+		self.c.execute("SELECT state_id, action_id, q FROM q ORDER BY id")
+		return self.c.fetchall()
+
+'''
+The current layer, running the statements and helpers of Database on its own
+connection
+'''
+class CurrentLayer:
+	def __init__(self, path):
+		self.connection = sqlite3.connect(path)
+		self.c = self.connection.cursor()
+		Database.c = self.c
+		Database._createTables()
+		self.connection.commit()
+
+	def insertStates(self, rows):
+		self.c.executemany(Database._insertState, ((s_id, *DatabaseHelpers.keyToParams(key)) for s_id, key in rows))
+
+	def selectStateId(self, key):
+		self.c.execute(Database._selectStateIdByKey, (keyToBlob(key),))
+		return self.c.fetchone()[0]
+
+	def upsertAction(self, action):
+		params = DatabaseHelpers.actionToParams(action)
+		self.c.execute(Database._insertAction, params)
+		self.c.execute(Database._selectActionId, params)
+		return self.c.fetchone()[0]
+
+	def selectAction(self, a_id):
+		self.c.execute(Database._selectAction, (a_id,))
+		return DatabaseHelpers.rowToAction(self.c.fetchone())
+
+	def upsertQ(self, rows):
+		self.c.executemany(Database._upsertQ, rows)
+
+	def loadQ(self):
+		self.c.execute("SELECT state_id, action_id, q FROM q ORDER BY id")
+		return self.c.fetchall()
+
+'''
+Run every operation on a layer. Returns ({operation: microseconds per item},
+what was read back)
+'''
+def runLayer(layer, keys, actions, q_rows, lookups, batch_size):
+	times = {}
+	results = {}
+
+	start = time.perf_counter()
+	for i in range(0, len(keys), batch_size):
+		layer.insertStates([(s_id, key) for s_id, key in enumerate(keys[i:i + batch_size], 1 + i)])
+	layer.connection.commit()
+	times["insert state"] = (time.perf_counter() - start) / len(keys)
+
+	start = time.perf_counter()
+	results["state ids"] = [layer.selectStateId(keys[i]) for i in lookups]
+	times["state id by key"] = (time.perf_counter() - start) / len(lookups)
+
+	start = time.perf_counter()
+	for _ in range(10):
+		results["action ids"] = [layer.upsertAction(action) for action in actions]
+	layer.connection.commit()
+	times["upsert action"] = (time.perf_counter() - start) / (10 * len(actions))
+
+	start = time.perf_counter()
+	for _ in range(10):
+		results["actions"] = [layer.selectAction(a_id) for a_id in results["action ids"]]
+	times["action by id"] = (time.perf_counter() - start) / (10 * len(actions))
+
+	start = time.perf_counter()
+	for i in range(0, len(q_rows), batch_size):
+		layer.upsertQ(q_rows[i:i + batch_size])
+	layer.connection.commit()
+	times["upsert q"] = (time.perf_counter() - start) / len(q_rows)
+
+	start = time.perf_counter()
+	results["q"] = layer.loadQ()
+	times["load q"] = (time.perf_counter() - start) / max(len(results["q"]), 1)
+
+	layer.connection.close()
+	return {operation: seconds * 1e6 for operation, seconds in times.items()}, results
+
+def main():
+	parser = argparse.ArgumentParser(description = "Benchmark each database operation against the replaced data layer")
+	parser.add_argument("--states", type = int, default = 100000)
+	parser.add_argument("--q-rows", type = int, default = 400000)
+	parser.add_argument("--lookups", type = int, default = 50000)
+	parser.add_argument("--batch-size", type = int, default = 1000)
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(args.seed)
+	keys = randomKeys(args.states, rng)
+	actions = [{"action": "pass", "card_id": None, "target": None}, {"action": "draw", "card_id": None, "target": None}]
+	actions.extend([{"action": "card", "card_id": card_id, "target": target} for card_id in range(40) for target in ["l", "r", "s"]])
+	q_rows = list(zip(
+		rng.integers(1, args.states + 1, args.q_rows).tolist(),
+		rng.integers(1, len(actions) + 1, args.q_rows).tolist(),
+		rng.normal(0, 50, args.q_rows).tolist()
+	))
+	lookups = rng.integers(0, args.states, args.lookups).tolist()
+
+	directory = tempfile.mkdtemp(prefix = "cardai_benchmark_")
+	try:
+		results = {}
+		times = {}
+		sizes = {}
+		for name, layer_class in [("legacy", LegacyLayer), ("current", CurrentLayer)]:
+			path = os.path.join(directory, name + ".db")
+			times[name], results[name] = runLayer(layer_class(path), keys, actions, q_rows, lookups, args.batch_size)
+			sizes[name] = os.path.getsize(path)
+		if results["legacy"] != results["current"]:
+			raise Exception("The layers read back different results")
+
+		print("{:>16} {:>12} {:>12} {:>9}".format("operation", "legacy us", "current us", "speedup"))
+		for operation in times["legacy"]:
+			print("{:>16} {:>12.2f} {:>12.2f} {:>8.2f}x".format(operation, times["legacy"][operation], times["current"][operation], times["legacy"][operation] / times["current"][operation]))
+		print("{:>16} {:>12.1f} {:>12.1f}".format("file MB", sizes["legacy"] / 1024 / 1024, sizes["current"] / 1024 / 1024))
+	finally:
+		shutil.rmtree(directory, ignore_errors = True)
+
+if __name__ == "__main__":
+	main()
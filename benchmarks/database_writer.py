@@ -0,0 +1,107 @@
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.q_snapshot import randomKeys
+from util.database import Database
+
+'''
+Compares writing through Database on the calling thread against writing on
+the background DatabaseWriter. A stream of states and q updates is written in
+both modes into fresh databases, which must end up the same. Reports how long
+upsertStateKey and updateQ calls take on the calling thread, which is what
+games wait on. Games do other work between updates, which --work-us stands in
+for. Without it, updates come faster than any writer can keep up with, and
+async calls mostly measure waiting on the full queue.
+
+Run from the repository root:
+	python -m benchmarks.database_writer --updates 200000
+'''
+
+def tableDigest():
+	digest = hashlib.md5()
+	for clause in ["SELECT * FROM state ORDER BY id", "SELECT * FROM q ORDER BY id"]:
+		Database.c.execute(clause)
+		digest.update(repr(Database.c.fetchall()).encode())
+	return digest.hexdigest()
+
+'''
+Write the updates, returning (latency of every call, seconds including the
+final commit, digest of the tables)
+'''
+def run(keys, updates, work, params):
+	if os.path.exists("data/data.db"):
+		os.remove("data/data.db")
+	Database.initialize(params)
+	Database.createDatabase()
+
+	latencies = np.zeros(len(updates), dtype=np.float64)
+	start = time.perf_counter()
+	for i, (key_index, a_id, q) in enumerate(updates):
+		call_start = time.perf_counter()
+		Database.updateQ(Database.upsertStateKey(keys[key_index]), a_id, q)
+		latencies[i] = time.perf_counter() - call_start
+		while time.perf_counter() - call_start < work:
+			pass
+	Database.commit()
+	total = time.perf_counter() - start
+
+	digest = tableDigest()
+	Database.destroy()
+	return latencies, total, digest
+
+def main():
+	parser = argparse.ArgumentParser(description = "Check and benchmark the background database writer")
+	parser.add_argument("--states", type = int, default = 50000)
+	parser.add_argument("--updates", type = int, default = 200000)
+	parser.add_argument("--actions", type = int, default = 100)
+	parser.add_argument("--q-flush-size", type = int, default = 1000)
+	parser.add_argument("--write-queue-size", type = int, default = 16)
+	parser.add_argument("--work-us", type = float, default = 20,
+		help = "microseconds of busy work between updates, like a game playing out")
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(args.seed)
+	keys = randomKeys(args.states, rng)
+	updates = list(zip(
+		rng.integers(0, args.states, args.updates).tolist(),
+		(rng.integers(0, args.actions, args.updates) + 1).tolist(),
+		rng.normal(0, 50, args.updates).tolist()
+	))
+
+	root = os.getcwd()
+	directory = tempfile.mkdtemp(prefix = "cardai_benchmark_")
+	try:
+		os.chdir(directory)
+		os.makedirs("data")
+		print("{:>6} {:>9} {:>9} {:>9} {:>9} {:>9}".format("mode", "total s", "p50 us", "p99 us", "p99.9 us", "max ms"))
+		digests = {}
+		for mode in ["sync", "async"]:
+			latencies, total, digests[mode] = run(keys, updates, args.work_us / 1e6, {
+				"q_flush_size": args.q_flush_size,
+				"q_flush_interval": float("inf"),
+				"async_writes": mode == "async",
+				"write_queue_size": args.write_queue_size,
+			})
+			print("{:>6} {:>9.2f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.2f}".format(
+				mode,
+				total,
+				np.percentile(latencies, 50) * 1e6,
+				np.percentile(latencies, 99) * 1e6,
+				np.percentile(latencies, 99.9) * 1e6,
+				latencies.max() * 1e3
+			))
+		if digests["sync"] != digests["async"]:
+			raise Exception("The databases differ")
+	finally:
+		os.chdir(root)
+		shutil.rmtree(directory, ignore_errors = True)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,122 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.q_snapshot import randomKeys
+from player.agent import Agent
+from util.database import Database
+
+'''
+Compares an agent learning with dyna replays against one learning through an
+eligibility trace, on a corridor standing in for a long game. Each episode
+starts at one end, moving right or left one state per step, and is rewarded at
+the other end. Both modes see the same states and draw their random actions
+from the same seed. Reports how many learning steps per second each mode takes,
+which is what long games pay for, and how many episodes it takes until every
+state in the corridor recommends moving right. Dyna replays every memory at the
+end of an episode, so its steps get slower the longer episodes run.
+
+Run from the repository root:
+	python -m benchmarks.eligibility_trace --length 50 --episodes 200
+'''
+
+left = 1
+right = 2
+
+'''
+Learn from episodes in one mode on a fresh database. Returns (seconds spent
+learning, learning steps, the first episode after which every state recommends
+moving right or None, mean steps of the last tenth of episodes)
+'''
+def run(keys, params, episodes, max_steps, win_reward, seed):
+	if os.path.exists("data/data.db"):
+		os.remove("data/data.db")
+	Database.initialize()
+	Database.createDatabase()
+	s_ids = np.array([Database.upsertStateKey(key) for key in keys], dtype=np.int64)
+	q = Database.getQTable()
+
+	rng = np.random.default_rng(seed)
+	learn_time = 0
+	learn_steps = 0
+	converged = None
+	episode_steps = []
+	for episode in range(episodes):
+		agent = Agent(q, params)
+		position = 0
+		a_id = int(rng.choice([left, right]))
+		for step in range(1, max_steps + 1):
+			new_position = max(position + (1 if a_id == right else -1), 0)
+			game_ended = new_position == len(keys) - 1 or step == max_steps
+			reward = win_reward if new_position == len(keys) - 1 else 0
+
+			start = time.perf_counter()
+			recommended_a_id = agent._learn(int(s_ids[position]), a_id, reward, int(s_ids[new_position]), game_ended)
+			learn_time += time.perf_counter() - start
+			learn_steps += 1
+
+			position = new_position
+			if game_ended:
+				break
+			if recommended_a_id == None or rng.random() < agent.random_action_rate:
+				a_id = int(rng.choice([left, right]))
+			else:
+				a_id = recommended_a_id
+		episode_steps.append(step)
+
+		best_a_ids, _ = q.bestMany(s_ids[:-1])
+		if converged == None and (best_a_ids == right).all():
+			converged = episode + 1
+
+	Database.destroy()
+	return learn_time, learn_steps, converged, np.mean(episode_steps[-max(episodes // 10, 1):])
+
+def main():
+	parser = argparse.ArgumentParser(description = "Benchmark eligibility traces against dyna replays")
+	parser.add_argument("--length", type = int, default = 50,
+		help = "states in the corridor")
+	parser.add_argument("--episodes", type = int, default = 200)
+	parser.add_argument("--max-steps", type = int, default = 500,
+		help = "steps before an episode ends anyway, like max_turns")
+	parser.add_argument("--win-reward", type = float, default = 500)
+	parser.add_argument("--dyna-steps", type = int, default = 10)
+	parser.add_argument("--trace-decay", type = float, default = 0.9)
+	parser.add_argument("--random-action-rate", type = float, default = 0.1)
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	keys = randomKeys(args.length, np.random.default_rng(args.seed))
+	modes = {
+		"dyna": {"learning_mode": "dyna", "dyna_steps": args.dyna_steps},
+		"trace": {"learning_mode": "trace", "trace_decay": args.trace_decay},
+	}
+
+	root = os.getcwd()
+	directory = tempfile.mkdtemp(prefix = "cardai_benchmark_")
+	try:
+		os.chdir(directory)
+		os.makedirs("data")
+		print("{:>6} {:>9} {:>10} {:>9} {:>10} {:>11}".format("mode", "learn s", "steps", "steps/s", "converged", "last steps"))
+		for mode, mode_params in modes.items():
+			learn_time, learn_steps, converged, last_steps = run(keys, {
+				"random_action_rate": args.random_action_rate,
+				**mode_params,
+			}, args.episodes, args.max_steps, args.win_reward, args.seed)
+			print("{:>6} {:>9.2f} {:>10} {:>9.0f} {:>10} {:>11.1f}".format(
+				mode,
+				learn_time,
+				learn_steps,
+				learn_steps / learn_time,
+				converged if converged != None else "never",
+				last_steps
+			))
+	finally:
+		os.chdir(root)
+		shutil.rmtree(directory, ignore_errors = True)
+
+if __name__ == "__main__":
+	main()
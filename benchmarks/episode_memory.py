@@ -0,0 +1,112 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from util.episode_memory import EpisodeMemory
+
+'''
+Compares remembering transitions as a dict each, which is how agents used to
+keep their memory, against an EpisodeMemory. Both remember the same games of
+random transitions, read the dyna window back every so many steps and sweep
+everything at the end, like Agent does, and must read back the same values.
+Reports the time per step, the memory held per agent at the end of a game, and
+how many garbage collections remembering the games sets off.
+
+Run from the repository root:
+	python -m benchmarks.episode_memory --steps 5000 --games 50
+'''
+
+class DictMemory:
+	def __init__(self):
+		self.memory = []
+
+	def __len__(self):
+		return len(self.memory)
+
+	def append(self, s_id, a_id, new_s_id, reward):
+		self.memory.append({
+			"s": s_id,
+			"a": a_id,
+			"s'": new_s_id,
+			"r": reward
+		})
+
+	def window(self, end):
+		return [(self.memory[i]["s"], self.memory[i]["a"], self.memory[i]["s'"], self.memory[i]["r"]) for i in range(end - 1, -1, -1)]
+
+class ColumnMemory(EpisodeMemory):
+	def window(self, end):
+		return list(zip(*[column[::-1].tolist() for column in self.slice(0, end)]))
+
+'''
+Play games into new memories of a kind. Returns (seconds per step, bytes held
+by a memory at the end of a game, garbage collections, what the first game read
+back)
+'''
+def run(memory_class, games, dyna_steps, window_every):
+	read = []
+	start = time.perf_counter()
+	for game in games:
+		memory = memory_class()
+		for step, transition in enumerate(zip(*game)):
+			if step % window_every == 0:
+				window = memory.window(len(memory) - min(dyna_steps, len(memory)))
+				if game is games[0]:
+					read.append(window)
+			memory.append(*transition)
+		window = memory.window(len(memory))
+		if game is games[0]:
+			read.append(window)
+	step_time = (time.perf_counter() - start) / sum([len(game[0]) for game in games])
+
+	# collections set off by remembering alone, since reading windows back
+	# allocates the same tuples for both kinds
+	gc.collect()
+	collections = sum([stats["collections"] for stats in gc.get_stats()])
+	for game in games:
+		memory = memory_class()
+		for transition in zip(*game):
+			memory.append(*transition)
+	collections = sum([stats["collections"] for stats in gc.get_stats()]) - collections
+
+	# measured apart from the timing, which tracemalloc slows down
+	tracemalloc.start()
+	memory = memory_class()
+	for transition in zip(*games[0]):
+		memory.append(*transition)
+	held = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return step_time, held, collections, read
+
+def main():
+	parser = argparse.ArgumentParser(description = "Check and benchmark episode memory against a list of dicts")
+	parser.add_argument("--steps", type = int, default = 500,
+		help = "transitions per game, like max_turns")
+	parser.add_argument("--games", type = int, default = 200)
+	parser.add_argument("--dyna-steps", type = int, default = 10)
+	parser.add_argument("--window-every", type = int, default = 50,
+		help = "read the dyna window back every this many steps. reading it every step takes as long as the game is, for both kinds")
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(args.seed)
+	games = [(
+		rng.integers(1, 1000000, args.steps).tolist(),
+		rng.integers(1, 200, args.steps).tolist(),
+		rng.integers(1, 1000000, args.steps).tolist(),
+		rng.normal(0, 50, args.steps).tolist(),
+	) for _ in range(args.games)]
+
+	results = {}
+	print("{:>8} {:>9} {:>14} {:>12}".format("memory", "step us", "KB per agent", "collections"))
+	for name, memory_class in [("dicts", DictMemory), ("columns", ColumnMemory)]:
+		step_time, held, collections, results[name] = run(memory_class, games, args.dyna_steps, args.window_every)
+		print("{:>8} {:>9.2f} {:>14.1f} {:>12}".format(name, step_time * 1e6, held / 1024, collections))
+	if results["dicts"] != results["columns"]:
+		raise Exception("The memories read back different transitions")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,112 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.database_writer import tableDigest
+from benchmarks.q_snapshot import randomKeys
+from util.database import Database
+
+'''
+Compares training against data/data.db on disk, with a few journal and
+synchronous pragmas, against training against a copy in memory which is backed
+up to disk. A stream of states and q updates is written in every mode, with a
+commit every --commit-every updates standing in for checkpoints, which in
+memory is also when the database is backed up. The databases left on disk must
+all be the same.
+
+Run from the repository root:
+	python -m benchmarks.in_memory_database --updates 200000
+'''
+
+modes = {
+	"disk": {},
+	"disk wal": {"journal_mode": "WAL", "synchronous": "NORMAL"},
+	"memory": {"in_memory": True},
+	"memory wal": {"in_memory": True, "journal_mode": "WAL", "synchronous": "NORMAL"},
+}
+
+'''
+Write the updates, returning (seconds to open, seconds to write including
+commits, seconds per commit, digest of what ended up on disk)
+'''
+def run(keys, updates, commit_every, params):
+	for path in ["data/data.db", "data/data.db-wal", "data/data.db-shm"]:
+		if os.path.exists(path):
+			os.remove(path)
+	Database.initialize({"in_memory": False})
+	Database.createDatabase()
+	Database.destroy()
+
+	start = time.perf_counter()
+	Database.initialize(params)
+	open_time = time.perf_counter() - start
+
+	commit_times = []
+	start = time.perf_counter()
+	for i, (key_index, a_id, q) in enumerate(updates, 1):
+		Database.updateQ(Database.upsertStateKey(keys[key_index]), a_id, q)
+		if i % commit_every == 0:
+			commit_start = time.perf_counter()
+			Database.commit()
+			commit_times.append(time.perf_counter() - commit_start)
+	Database.commit()
+	total = time.perf_counter() - start
+	Database.destroy()
+
+	# read back from disk, to check what the backups left there
+	Database.initialize({"in_memory": False})
+	digest = tableDigest()
+	Database.destroy()
+	return open_time, total, np.mean(commit_times) if commit_times else 0, digest
+
+def main():
+	parser = argparse.ArgumentParser(description = "Check and benchmark training against an in-memory copy of the database")
+	parser.add_argument("--states", type = int, default = 50000)
+	parser.add_argument("--updates", type = int, default = 200000)
+	parser.add_argument("--actions", type = int, default = 100)
+	parser.add_argument("--commit-every", type = int, default = 20000,
+		help = "updates between commits, like games between checkpoints")
+	parser.add_argument("--q-flush-size", type = int, default = 1000)
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(args.seed)
+	keys = randomKeys(args.states, rng)
+	updates = list(zip(
+		rng.integers(0, args.states, args.updates).tolist(),
+		(rng.integers(0, args.actions, args.updates) + 1).tolist(),
+		rng.normal(0, 50, args.updates).tolist()
+	))
+
+	root = os.getcwd()
+	directory = tempfile.mkdtemp(prefix = "cardai_benchmark_")
+	try:
+		os.chdir(directory)
+		os.makedirs("data")
+		print("{:>11} {:>9} {:>9} {:>11} {:>9}".format("mode", "open s", "total s", "commit ms", "file MB"))
+		digests = {}
+		for mode, mode_params in modes.items():
+			open_time, total, commit_time, digests[mode] = run(keys, updates, args.commit_every, {
+				"q_flush_size": args.q_flush_size,
+				"q_flush_interval": float("inf"),
+				**mode_params,
+			})
+			print("{:>11} {:>9.3f} {:>9.2f} {:>11.1f} {:>9.1f}".format(
+				mode,
+				open_time,
+				total,
+				commit_time * 1e3,
+				os.path.getsize("data/data.db") / 1024 / 1024
+			))
+		if len(set(digests.values())) != 1:
+			raise Exception("The databases differ")
+	finally:
+		os.chdir(root)
+		shutil.rmtree(directory, ignore_errors = True)
+
+if __name__ == "__main__":
+	main()
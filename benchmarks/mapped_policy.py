@@ -0,0 +1,107 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.q_snapshot import randomKeys
+from util.mapped_policy import MappedPolicy
+from util.policy_snapshot import PolicySnapshot
+from util.q_table import QTable
+
+'''
+Compares the memory of processes which each load a PolicySnapshot against
+processes which all map the same MappedPolicy. A random policy is saved in both
+formats, checked to give the same answers, and opened by several processes at
+once. Each process reports how much private memory it gained, which is what
+adds up as processes are added. Pages of a mapped file are shared between
+processes, and don't count towards it.
+
+Linux only, since memory is read from /proc. Run from the repository root:
+	python -m benchmarks.mapped_policy --states 100000 --processes 4
+'''
+
+def privateMemory():
+	with open("/proc/self/status") as file:
+		for line in file:
+			if line.startswith("RssAnon:"):
+				return int(line.split()[1]) * 1024
+	return 0
+
+'''
+Open a policy in a fresh process and answer queries from it. Returns (seconds to
+open, bytes of private memory gained)
+'''
+def _openAndQuery(kind, path, keys):
+	before = privateMemory()
+	start = time.perf_counter()
+	policy = MappedPolicy.load(path) if kind == "mapped" else PolicySnapshot.load(path)
+	load_time = time.perf_counter() - start
+	for key in keys:
+		policy.recommendAction(key)
+	return load_time, privateMemory() - before
+
+def buildSnapshot(num_states, actions_per_state, num_actions, rng):
+	keys = randomKeys(num_states, rng)
+	q = QTable(num_states + 1, num_actions + 1)
+	s_ids = np.repeat(np.arange(1, num_states + 1), actions_per_state)
+	a_ids = np.concatenate([rng.choice(num_actions, actions_per_state, replace = False) + 1 for _ in range(num_states)])
+	q.setMany(s_ids, a_ids, rng.normal(0, 50, len(s_ids)))
+	return PolicySnapshot(q, {s_id: key for s_id, key in enumerate(keys, 1)}, action_ids = list(range(1, num_actions + 1)))
+
+def runCheck(snapshot, policy, rng, num_queries):
+	keys = list(snapshot.state_ids.keys())
+	for i in rng.choice(len(keys), min(num_queries, len(keys)), replace = False).tolist():
+		if snapshot.recommendAction(keys[i]) != policy.recommendAction(keys[i]):
+			raise Exception("Recommendations differ for a known state")
+	for key in randomKeys(num_queries, rng):
+		if snapshot.closestStateId(key) != policy.closestStateId(key):
+			raise Exception("Closest states differ for an unknown state")
+
+def main():
+	parser = argparse.ArgumentParser(description = "Check and benchmark memory mapped policies shared between processes")
+	parser.add_argument("--states", type = int, default = 100000)
+	parser.add_argument("--actions-per-state", type = int, default = 4)
+	parser.add_argument("--actions", type = int, default = 100)
+	parser.add_argument("--processes", type = int, nargs = "+", default = [1, 2, 4])
+	parser.add_argument("--queries", type = int, default = 200)
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(args.seed)
+	directory = tempfile.mkdtemp(prefix = "cardai_benchmark_")
+	try:
+		snapshot = buildSnapshot(args.states, args.actions_per_state, args.actions, rng)
+		snapshot_path = os.path.join(directory, "snapshot")
+		policy_path = os.path.join(directory, "policy.qmap")
+		snapshot.save(snapshot_path)
+		MappedPolicy.write(policy_path, snapshot)
+		runCheck(snapshot, MappedPolicy.load(policy_path), rng, args.queries)
+		print("{} states, policy file {:.1f} MB".format(args.states, os.path.getsize(policy_path) / 1024 / 1024))
+
+		# queries are known states, so both formats do the same amount of work
+		keys = list(snapshot.state_ids.keys())
+		queries = [keys[i] for i in rng.choice(len(keys), args.queries).tolist()]
+		# spawned processes start empty, instead of sharing this one's memory
+		context = multiprocessing.get_context("spawn")
+		print("{:>9} {:>9} {:>11} {:>18} {:>16}".format("format", "processes", "open s", "private MB each", "private MB total"))
+		for kind, path in [("snapshot", snapshot_path), ("mapped", policy_path)]:
+			for num_processes in args.processes:
+				with context.Pool(num_processes) as pool:
+					results = pool.starmap(_openAndQuery, [(kind, path, queries)] * num_processes)
+				load_times, memory = zip(*results)
+				print("{:>9} {:>9} {:>11.3f} {:>18.1f} {:>16.1f}".format(
+					kind,
+					num_processes,
+					np.mean(load_times),
+					np.mean(memory) / 1024 / 1024,
+					np.sum(memory) / 1024 / 1024
+				))
+	finally:
+		shutil.rmtree(directory, ignore_errors = True)
+
+if __name__ == "__main__":
+	main()
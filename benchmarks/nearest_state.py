@@ -0,0 +1,77 @@
+import argparse
+import time
+
+import numpy as np
+
+from util.constants import state_adjacency_constants
+from util.helpers import DatabaseHelpers
+from util.state_index import BucketStateIndex, StateIndex
+
+'''
+Compares the approximate bucket index against the exact state index on random
+states. Reports build time, query latency and recall, where recall is how often
+the bucket index finds a state as similar as the exact best match.
+
+Run from the repository root:
+	python -m benchmarks.nearest_state --sizes 10000 100000 1000000
+'''
+
+'''
+Generate n random, plausible state feature rows
+'''
+def randomFeatures(n, rng):
+	columns = {}
+	columns["turn"] = rng.integers(1, 500, n)
+	columns["status"] = rng.integers(0, len(DatabaseHelpers.stateStatuses), n)
+	for prefix in ["", "left_", "right_"]:
+		max_hp = rng.integers(10, 31, n)
+		columns[prefix + "hp"] = rng.integers(0, max_hp + 1)
+		columns[prefix + "hp_until_max"] = max_hp - columns[prefix + "hp"]
+		columns[prefix + "max_sp"] = rng.integers(4, 11, n)
+		columns[prefix + "sp"] = rng.integers(0, columns[prefix + "max_sp"] + 1)
+	return np.column_stack([columns[field] for field in DatabaseHelpers.stateFeatureFields]).astype(np.float32)
+
+def timeQueries(index, queries):
+	results = []
+	latencies = []
+	for features in queries:
+		start = time.perf_counter()
+		results.append(index.closestToFeatures(features))
+		latencies.append(time.perf_counter() - start)
+	return results, np.array(latencies)
+
+def main():
+	parser = argparse.ArgumentParser(description = "Benchmark nearest state search")
+	parser.add_argument("--sizes", type = int, nargs = "+", default = [10000, 100000, 1000000])
+	parser.add_argument("--queries", type = int, default = 100)
+	parser.add_argument("--bucket-width", type = int, default = state_adjacency_constants["bucket_width"])
+	parser.add_argument("--probe-radius", type = int, nargs = "+", default = [0, 1, 2])
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	weights = state_adjacency_constants["weights"]
+	rng = np.random.default_rng(args.seed)
+	print("{:>9} {:>8} {:>9} {:>11} {:>11} {:>8}".format("states", "index", "build s", "mean ms", "p99 ms", "recall"))
+	for size in args.sizes:
+		features = randomFeatures(size, rng)
+		s_ids = np.arange(1, size + 1)
+		queries = randomFeatures(args.queries, rng)
+
+		exact = StateIndex(weights, only_states_with_q = False)
+		start = time.perf_counter()
+		exact.addMany(s_ids, features)
+		build = time.perf_counter() - start
+		exact_results, latencies = timeQueries(exact, queries)
+		print("{:>9} {:>8} {:>9.2f} {:>11.3f} {:>11.3f} {:>8.3f}".format(size, "exact", build, latencies.mean() * 1000, np.percentile(latencies, 99) * 1000, 1))
+
+		for probe_radius in args.probe_radius:
+			bucket = BucketStateIndex(weights, only_states_with_q = False, bucket_width = args.bucket_width, probe_radius = probe_radius)
+			start = time.perf_counter()
+			bucket.addMany(s_ids, features)
+			build = time.perf_counter() - start
+			results, latencies = timeQueries(bucket, queries)
+			recall = np.mean([similarity >= exact_similarity - 1e-6 for (_, similarity), (_, exact_similarity) in zip(results, exact_results)])
+			print("{:>9} {:>8} {:>9.2f} {:>11.3f} {:>11.3f} {:>8.3f}".format(size, "bucket r{}".format(probe_radius), build, latencies.mean() * 1000, np.percentile(latencies, 99) * 1000, recall))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,115 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from util.database import Database
+from util.policy_snapshot import PolicySnapshot
+from util.state_key import handKey, numericFields, packKey
+
+'''
+Compares how long it takes to get a playable PolicySnapshot from the database,
+like --eval does, against loading a saved snapshot. Databases of random states
+and q values are built in a temporary directory, and the snapshot loaded from
+disk is checked against the one taken from the database.
+
+The operating system's file cache is warm for both, so this measures parsing
+and building, not reading the disk.
+
+Run from the repository root:
+	python -m benchmarks.q_snapshot --states 10000 100000
+'''
+
+'''
+Generate n distinct random state keys
+'''
+def randomKeys(n, rng, num_cards = 40, hand_size = 5):
+	keys = set()
+	while len(keys) < n:
+		values = [int(rng.integers(1, 500))] + [int(rng.integers(0, 3))] + rng.integers(0, 31, len(numericFields) - 2).tolist()
+		keys.add(packKey(values, handKey(rng.integers(0, num_cards, hand_size).tolist())))
+	return list(keys)
+
+'''
+Fill a fresh database with num_states states, each with q values for
+actions_per_state random actions
+'''
+def buildDatabase(num_states, actions_per_state, num_actions, rng):
+	Database.initialize()
+	Database.createDatabase()
+	for key in randomKeys(num_states, rng):
+		s_id = Database.upsertStateKey(key)
+		for a_id in rng.choice(num_actions, actions_per_state, replace = False).tolist():
+			Database.updateQ(s_id, a_id + 1, float(rng.normal(0, 50)))
+	Database.commit()
+	Database.destroy()
+
+def loadFromDatabase():
+	Database.initialize()
+	q = Database.getQTable()
+	snapshot = PolicySnapshot.fromDatabase(q)
+	Database.destroy()
+	return snapshot
+
+def timed(function, repeats):
+	times = []
+	for _ in range(repeats):
+		start = time.perf_counter()
+		result = function()
+		times.append(time.perf_counter() - start)
+	return result, min(times)
+
+def runCheck(expected, loaded):
+	if expected.state_ids != loaded.state_ids:
+		raise Exception("State keys differ")
+	expected_entries = sorted(zip(*[array.tolist() for array in expected.q.entries()]))
+	loaded_entries = sorted(zip(*[array.tolist() for array in loaded.q.entries()]))
+	if expected_entries != loaded_entries:
+		raise Exception("Q values differ")
+	for key in list(expected.state_ids.keys())[:1000]:
+		if expected.recommendAction(key) != loaded.recommendAction(key):
+			raise Exception("Recommendations differ")
+
+def main():
+	parser = argparse.ArgumentParser(description = "Check and benchmark loading saved policy snapshots")
+	parser.add_argument("--states", type = int, nargs = "+", default = [10000, 100000])
+	parser.add_argument("--actions-per-state", type = int, default = 4)
+	parser.add_argument("--actions", type = int, default = 100)
+	parser.add_argument("--repeats", type = int, default = 3)
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(args.seed)
+	root = os.getcwd()
+	directory = tempfile.mkdtemp(prefix = "cardai_benchmark_")
+	print("{:>9} {:>10} {:>10} {:>12} {:>12} {:>9}".format("states", "q rows", "db MB", "database s", "snapshot s", "speedup"))
+	try:
+		os.chdir(directory)
+		os.makedirs("data")
+		for num_states in args.states:
+			if os.path.exists("data/data.db"):
+				os.remove("data/data.db")
+			buildDatabase(num_states, args.actions_per_state, args.actions, rng)
+
+			expected, database_time = timed(loadFromDatabase, args.repeats)
+			expected.save("data/snapshot")
+			loaded, snapshot_time = timed(lambda: PolicySnapshot.load("data/snapshot"), args.repeats)
+			runCheck(expected, loaded)
+
+			print("{:>9} {:>10} {:>10.1f} {:>12.3f} {:>12.3f} {:>8.1f}x".format(
+				num_states,
+				expected.q.count(),
+				os.path.getsize("data/data.db") / 1024 / 1024,
+				database_time,
+				snapshot_time,
+				database_time / snapshot_time
+			))
+	finally:
+		os.chdir(root)
+		shutil.rmtree(directory, ignore_errors = True)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.training_loop import gitCommit, populate
+from game.game import Game
+from game.self_play import runSelfPlay
+from player.agent import Agent
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
+from util.card_definitions import CardDefinitions
+from util.constants import agent_constants
+from util.database import Database
+from util.helpers import loadCardDefinitions, loadCharacterDefinitions
+from util.policy_snapshot import PolicySnapshot
+
+'''
+Benchmarks parallel self-play. Every run starts from a fresh database in a
+temporary directory, filled with random states with q values, and reports:
+	the seconds per game spent by actors playing from a snapshot, and by the
+		learner replaying their transitions, both measured in this process.
+		the learner is a single process, so one game per learner second is
+		the most self-play can reach with any number of workers
+	games per second of runSelfPlay for every worker count
+Helpful notes:
+	worker counts beyond the machine's cores can't go faster than one worker,
+		so the number of cores is reported with the results
+	card and character definitions are copied from data/, which has to exist
+	results are printed as JSON, or written to --output with a summary printed
+		instead
+
+Run from the repository root:
+	python -m benchmarks.self_play --workers 1 2 4 --output results.json
+'''
+
+'''
+Fill a fresh database with num_states random states and return its q table
+'''
+def prepare(num_states, seed):
+	if os.path.exists("data/data.db"):
+		os.remove("data/data.db")
+	populate(num_states, np.random.default_rng(seed))
+
+	Database.initialize()
+	q = Database.getQTable()
+	Database.syncActionCatalog()
+	ActionMasks.build()
+	return q
+
+def agentParams(learning_mode):
+	return {
+		"learning_rate": agent_constants["learning_rate"],
+		"learning_mode": learning_mode,
+	}
+
+'''
+Time actors and the learner separately, in this process. Returns (actor
+seconds per game, learner seconds per game)
+'''
+def phases(num_states, num_games, characters, learning_mode, seed):
+	q = prepare(num_states, seed)
+	agent_params = agentParams(learning_mode)
+	deck_params = {
+		"main_cards": CardDefinitions.cards["main"],
+		"treasure_cards": CardDefinitions.cards["treasures"],
+		"answer_cards": CardDefinitions.cards["answers"]
+	}
+	snapshot = PolicySnapshot.fromDatabase(q)
+	rng = np.random.RandomState(seed)
+
+	start = time.perf_counter()
+	episodes = []
+	for _ in range(num_games):
+		game = Game(snapshot, {"agent_mode": "act"}, agent_params, deck_params, {"characters": list(characters)}, rng = rng)
+		game.run()
+		episodes.extend([player.transitions for player in game.players])
+	actor_seconds = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for episode in episodes:
+		Agent(q, agent_params).replay(episode)
+	Database.commit()
+	learner_seconds = time.perf_counter() - start
+
+	Database.destroy()
+	return actor_seconds / num_games, learner_seconds / num_games
+
+'''
+Time runSelfPlay with num_workers workers. Returns games per second
+'''
+def selfPlay(num_states, num_games, num_workers, cards, characters, learning_mode, seed):
+	q = prepare(num_states, seed)
+	np.random.seed(seed)
+
+	start = time.perf_counter()
+	runSelfPlay(q, num_games, num_workers, cards, {}, agentParams(learning_mode), {"characters": list(characters)})
+	Database.commit()
+	seconds = time.perf_counter() - start
+
+	Database.destroy()
+	return num_games / seconds
+
+def main():
+	parser = argparse.ArgumentParser(description = "Benchmark actors, the learner and parallel self-play on fresh databases")
+	parser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4],
+		help = "worker counts to run self-play with")
+	parser.add_argument("--q-states", type = int, default = 10000,
+		help = "random states with q values to fill the database with before each run")
+	parser.add_argument("--games", type = int, default = 40,
+		help = "games to play in each run")
+	parser.add_argument("--learning-mode", choices = ["dyna", "trace"], default = agent_constants["learning_mode"])
+	parser.add_argument("--seed", type = int, default = 0)
+	parser.add_argument("--output", default = None,
+		help = "write the results here as JSON, instead of printing them")
+	args = parser.parse_args()
+
+	root = os.getcwd()
+	for name in ["cards.json", "characters.json"]:
+		if not os.path.exists(os.path.join(root, "data", name)):
+			raise Exception("data/{} is needed to play games".format(name))
+
+	results = {
+		"commit": gitCommit(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+		"python": platform.python_version(),
+		"numpy": np.__version__,
+		"cores": os.cpu_count(),
+		"seed": args.seed,
+		"learning_mode": args.learning_mode,
+		"q_states": args.q_states,
+		"games": args.games,
+		"runs": [],
+	}
+	directory = tempfile.mkdtemp(prefix = "cardai_benchmark_")
+	try:
+		os.chdir(directory)
+		os.makedirs("data")
+		for name in ["cards.json", "characters.json"]:
+			shutil.copy(os.path.join(root, "data", name), os.path.join("data", name))
+
+		cards = loadCardDefinitions()
+		characters = loadCharacterDefinitions()
+		CardDefinitions.setDefinitions(cards["main"], cards["treasures"], cards["answers"])
+		ActionCatalog.build()
+
+		# games print as they go, which is kept out of the results
+		stdout = sys.stdout
+		sys.stdout = open(os.devnull, "w")
+		try:
+			actor_seconds, learner_seconds = phases(args.q_states, args.games, characters, args.learning_mode, args.seed)
+			results["actor_seconds_per_game"] = actor_seconds
+			results["learner_seconds_per_game"] = learner_seconds
+			results["learner_games_per_second"] = 1 / learner_seconds
+			for num_workers in args.workers:
+				results["runs"].append({
+					"workers": num_workers,
+					"games_per_second": selfPlay(args.q_states, args.games, num_workers, cards, characters, args.learning_mode, args.seed),
+				})
+		finally:
+			sys.stdout.close()
+			sys.stdout = stdout
+	finally:
+		os.chdir(root)
+		shutil.rmtree(directory, ignore_errors = True)
+
+	if args.output == None:
+		print(json.dumps(results, indent = 2))
+		return
+
+	with open(args.output, "w") as file:
+		json.dump(results, file, indent = 2)
+	print("{} cores, actors {:.1f} ms/game, learner {:.1f} ms/game ({:.2f} games/s at most)".format(
+		results["cores"],
+		results["actor_seconds_per_game"] * 1000,
+		results["learner_seconds_per_game"] * 1000,
+		results["learner_games_per_second"],
+	))
+	print("{:>8} {:>8}".format("workers", "games/s"))
+	for result in results["runs"]:
+		print("{:>8} {:>8.2f}".format(result["workers"], result["games_per_second"]))
+
+if __name__ == "__main__":
+	main()
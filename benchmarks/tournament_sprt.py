@@ -0,0 +1,69 @@
+import argparse
+
+import numpy as np
+
+from game.tournament import Matchup
+from util.constants import tournament_constants
+
+'''
+Simulates matchups between two characters with a known win rate, in batches
+like runTournament plays them, to check how matchups stop. An even matchup
+should almost never be stopped by the sprt, since that would call it uneven,
+and uneven matchups should be stopped by it in favour of the stronger
+character. Fails if even matchups are stopped by the sprt more than
+--max-even-sprt of the time, or if the sprt ever favours the weaker character
+more often than --max-wrong of the time.
+
+Run from the repository root:
+	python -m benchmarks.tournament_sprt --matchups 1000
+'''
+
+'''
+Play one simulated matchup until it stops. Returns the Matchup
+'''
+def simulate(win_rate, params, rng):
+	matchup = Matchup([{"name": "a"}, {"name": "b"}])
+	while matchup.decision == None:
+		games = min(params["games_per_task"], params["max_games"] - matchup.games)
+		wins = int(rng.binomial(games, win_rate))
+		matchup.add({
+			"games": games,
+			"timeouts": 0,
+			"turns": np.zeros(games),
+			"characters": {"a": {"wins": wins}, "b": {"wins": games - wins}},
+		})
+		matchup.update(params)
+	return matchup
+
+def main():
+	parser = argparse.ArgumentParser(description = "Check how simulated matchups stop")
+	parser.add_argument("--matchups", type = int, default = 1000,
+		help = "simulated matchups per win rate")
+	parser.add_argument("--win-rates", type = float, nargs = "+", default = [0.5, 0.55, 0.6, 0.7])
+	parser.add_argument("--max-even-sprt", type = float, default = 0.1)
+	parser.add_argument("--max-wrong", type = float, default = 0.01)
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+
+	params = dict(tournament_constants)
+	rng = np.random.default_rng(args.seed)
+	print("{:>9} {:>7} {:>9} {:>10} {:>12} {:>13}".format("win rate", "sprt", "interval", "max games", "wrong side", "median games"))
+	for win_rate in args.win_rates:
+		matchups = [simulate(win_rate, params, rng) for _ in range(args.matchups)]
+		decisions = {decision: np.mean([matchup.decision == decision for matchup in matchups]) for decision in ["sprt", "interval", "max_games"]}
+		wrong = np.mean([matchup.favoured == ("b" if win_rate > 0.5 else "a") for matchup in matchups]) if win_rate != 0.5 else 0
+		print("{:>9.2f} {:>7.3f} {:>9.3f} {:>10.3f} {:>12.3f} {:>13.0f}".format(
+			win_rate,
+			decisions["sprt"],
+			decisions["interval"],
+			decisions["max_games"],
+			wrong,
+			np.median([matchup.games for matchup in matchups])
+		))
+		if win_rate == 0.5 and decisions["sprt"] > args.max_even_sprt:
+			raise Exception("Even matchups were stopped by the sprt {:.1%} of the time".format(decisions["sprt"]))
+		if wrong > args.max_wrong:
+			raise Exception("The sprt favoured the weaker character {:.1%} of the time".format(wrong))
+
+if __name__ == "__main__":
+	main()
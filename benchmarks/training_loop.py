@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.database_writer import tableDigest
+from benchmarks.q_snapshot import randomKeys
+from game.game import Game
+from player.agent import Agent
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
+from util.card_definitions import CardDefinitions
+from util.constants import agent_constants
+from util.database import Database
+from util.helpers import loadCardDefinitions, loadCharacterDefinitions
+
+'''
+Benchmarks the training loop, to compare commits and catch regressions. For
+every q table size, a fresh database in a temporary directory is filled with
+that many random states with q values, and then the same seeded games are
+played against it, like main.py plays them. Reports games and agent queries
+per second, and the p50 and p99 latency of the database calls games wait on.
+Helpful notes:
+	every run plays its games with its own np.random.RandomState seeded with
+		--seed, passed to Game and from there to decks and agents, so runs
+		don't share a random stream with each other or with np.random. states
+		and q values are drawn from their own generator too
+	the digest of the tables after each run only changes when what is
+		learned changes, so two commits with the same digests played the same
+		games
+	card and character definitions are copied from data/, which has to exist
+	results are printed as JSON, or written to --output with a summary printed
+		instead
+
+Run from the repository root:
+	python -m benchmarks.training_loop --q-states 0 10000 100000 --output results.json
+'''
+
+timed_calls = [
+	(Database, "upsertState"),
+	(Database, "getClosestObservedStateId"),
+	(Database, "updateQ"),
+	(Database, "updateQMany"),
+]
+counted_calls = [
+	(Agent, "initialQuery"),
+	(Agent, "query"),
+]
+
+'''
+Replace a method with one which records how long every call takes into
+latencies, or only counts calls if latencies is None. Returns a function which
+puts the method back
+'''
+def instrument(owner, name, latencies, counts):
+	original = owner.__dict__[name]
+	method = getattr(owner, name)
+	counts[name] = 0
+
+	if latencies == None:
+		def wrapper(*args, **kwargs):
+			counts[name] += 1
+			return method(*args, **kwargs)
+		setattr(owner, name, wrapper)
+	else:
+		latencies[name] = []
+		# classmethods are fetched bound, and stay bound inside a plain function
+		def wrapper(*args, **kwargs):
+			start = time.perf_counter()
+			result = method(*args, **kwargs)
+			latencies[name].append(time.perf_counter() - start)
+			return result
+		setattr(owner, name, wrapper)
+
+	return lambda: setattr(owner, name, original)
+
+'''
+Fill a fresh database with num_states random states, each with q values for
+a few random actions
+'''
+def populate(num_states, rng):
+	Database.initialize()
+	Database.createDatabase()
+	Database.syncActionCatalog()
+	num_actions = len(ActionCatalog.actions)
+	for key in randomKeys(num_states, rng):
+		s_id = Database.upsertStateKey(key)
+		for a_id in rng.choice(num_actions, 4, replace = False).tolist():
+			Database.updateQ(s_id, a_id + 1, float(rng.normal(0, 50)))
+	Database.commit()
+	Database.destroy()
+
+'''
+Play num_games training games against a database with num_states states.
+Returns the results of the run
+'''
+def run(num_states, num_games, characters, learning_mode, seed):
+	if os.path.exists("data/data.db"):
+		os.remove("data/data.db")
+	populate(num_states, np.random.default_rng(seed))
+
+	Database.initialize()
+	q = Database.getQTable()
+	Database.syncActionCatalog()
+	ActionMasks.build()
+
+	agent_params = {
+		"learning_rate": agent_constants["learning_rate"],
+		"learning_mode": learning_mode,
+	}
+	deck_params = {
+		"main_cards": CardDefinitions.cards["main"],
+		"treasure_cards": CardDefinitions.cards["treasures"],
+		"answer_cards": CardDefinitions.cards["answers"]
+	}
+	# games shuffle the characters in place, so every run starts from a copy
+	character_params = {
+		"characters": list(characters)
+	}
+
+	latencies = {}
+	counts = {}
+	restores = [instrument(owner, name, latencies, counts) for owner, name in timed_calls]
+	restores += [instrument(owner, name, None, counts) for owner, name in counted_calls]
+	rng = np.random.RandomState(seed)
+	try:
+		start = time.perf_counter()
+		for _ in range(num_games):
+			Game(q, {}, agent_params, deck_params, character_params, rng = rng).run()
+			agent_params["learning_rate"] *= 1 - agent_constants["learning_rate_decay"]
+		Database.commit()
+		seconds = time.perf_counter() - start
+	finally:
+		for restore in restores:
+			restore()
+
+	digest = tableDigest()
+	Database.destroy()
+
+	queries = sum([counts[name] for _, name in counted_calls])
+	return {
+		"q_states": num_states,
+		"games": num_games,
+		"seconds": seconds,
+		"games_per_second": num_games / seconds,
+		"queries": queries,
+		"queries_per_second": queries / seconds,
+		"latency_us": {
+			name: {
+				"calls": len(values),
+				"p50": float(np.percentile(values, 50)) * 1e6 if values else None,
+				"p99": float(np.percentile(values, 99)) * 1e6 if values else None,
+			}
+			for name, values in latencies.items()
+		},
+		"digest": digest,
+	}
+
+def gitCommit(root):
+	try:
+		return subprocess.run(["git", "rev-parse", "HEAD"], cwd = root, capture_output = True, text = True, check = True).stdout.strip()
+	except Exception:
+		return None
+
+def main():
+	parser = argparse.ArgumentParser(description = "Benchmark the training loop with seeded games on fresh databases")
+	parser.add_argument("--q-states", type = int, nargs = "+", default = [0, 10000, 100000],
+		help = "random states with q values to fill the database with before each run")
+	parser.add_argument("--games", type = int, default = 20,
+		help = "games to play in each run")
+	parser.add_argument("--learning-mode", choices = ["dyna", "trace"], default = agent_constants["learning_mode"])
+	parser.add_argument("--seed", type = int, default = 0)
+	parser.add_argument("--output", default = None,
+		help = "write the results here as JSON, instead of printing them")
+	args = parser.parse_args()
+
+	root = os.getcwd()
+	for name in ["cards.json", "characters.json"]:
+		if not os.path.exists(os.path.join(root, "data", name)):
+			raise Exception("data/{} is needed to play games".format(name))
+
+	results = {
+		"commit": gitCommit(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+		"python": platform.python_version(),
+		"numpy": np.__version__,
+		"seed": args.seed,
+		"learning_mode": args.learning_mode,
+		"runs": [],
+	}
+	directory = tempfile.mkdtemp(prefix = "cardai_benchmark_")
+	try:
+		os.chdir(directory)
+		os.makedirs("data")
+		for name in ["cards.json", "characters.json"]:
+			shutil.copy(os.path.join(root, "data", name), os.path.join("data", name))
+
+		cards = loadCardDefinitions()
+		characters = loadCharacterDefinitions()
+		CardDefinitions.setDefinitions(cards["main"], cards["treasures"], cards["answers"])
+		ActionCatalog.build()
+
+		for num_states in args.q_states:
+			# games print as they go, which is kept out of the results
+			stdout = sys.stdout
+			sys.stdout = open(os.devnull, "w")
+			try:
+				results["runs"].append(run(num_states, args.games, characters, args.learning_mode, args.seed))
+			finally:
+				sys.stdout.close()
+				sys.stdout = stdout
+	finally:
+		os.chdir(root)
+		shutil.rmtree(directory, ignore_errors = True)
+
+	if args.output == None:
+		print(json.dumps(results, indent = 2))
+		return
+
+	with open(args.output, "w") as file:
+		json.dump(results, file, indent = 2)
+	names = [name for _, name in timed_calls]
+	print("{:>9} {:>8} {:>10} {}".format("q states", "games/s", "queries/s", " ".join(["{:>28}".format(name + " p50/p99 us") for name in names])))
+	for result in results["runs"]:
+		print("{:>9} {:>8.2f} {:>10.0f} {}".format(
+			result["q_states"],
+			result["games_per_second"],
+			result["queries_per_second"],
+			" ".join(["{:>28}".format(
+				"{:.1f}/{:.1f}".format(latency["p50"], latency["p99"]) if latency["calls"] else "-"
+			) for latency in [result["latency_us"][name] for name in names]])
+		))
+
+if __name__ == "__main__":
+	main()
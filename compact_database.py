@@ -0,0 +1,18 @@
+import argparse
+
+from util.database import Database
+
+parser = argparse.ArgumentParser(description = "Shrink data/data.db, dropping states without q values and renumbering the rest")
+parser.add_argument("--min-abs-q", type = float, default = 0,
+	help = "also drop q values closer to 0 than this")
+parser.add_argument("--max-states", type = int, default = 0,
+	help = "also keep only this many states, those with the largest |q| values")
+args = parser.parse_args()
+
+Database.initialize()
+states_before, states_after = Database.compact({
+	"min_abs_q": args.min_abs_q,
+	"max_states": args.max_states,
+})
+print("Database compacted from {} to {} states".format(states_before, states_after))
+Database.destroy()
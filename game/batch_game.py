@@ -0,0 +1,214 @@
+import numpy as np
+
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
+from util.card_definitions import CardDefinitions
+from util.constants import game_constants, param_or_default
+
+# status codes, ordered like util/state_key.py
+WAIT = 0
+DRAW = 1
+PLAY = 2
+
+# action kinds
+PASS = 0
+DRAW_CARD = 1
+PLAY_CARD = 2
+
+'''
+A BatchGame plays many games at once in lockstep, following the same rules as
+Game._executeActionForP. Every game's state is held in numpy arrays indexed by
+(game, player), and each step applies one action per unfinished game as masked
+array operations. This is meant for bulk rollouts, where Python overhead per
+step dominates. Helpful notes:
+	`b` typically refers to a game index, `p` to a player index
+	actions are indices into ActionCatalog.actions, not action ids
+	hands are count vectors over card ids
+	rewards accumulate per player until takeRewards is called, like
+		Game.rewards does until a player is queried
+	ActionCatalog and ActionMasks must be built before creating a BatchGame
+'''
+class BatchGame:
+	'''
+	Initialize num_games new games.
+	game_params: as in game/game.py. num_agents players play each game
+	deck_params: as in game/game.py. only main_cards are used
+	character_params: as in game/game.py
+	seed: a seed for this batch's numpy Generator
+	'''
+	def __init__(self, num_games, game_params, deck_params, character_params, seed = None):
+		self.rng = np.random.default_rng(seed)
+		self.num_games = num_games
+		self.num_players = param_or_default(game_params, game_constants, "num_agents")
+		self.max_turns = param_or_default(game_params, game_constants, "max_turns")
+
+		# card properties, indexed by card id
+		table = CardDefinitions.table
+		self.card_sp = table["sp"]
+		self.card_has_heal = table["has_heal"]
+		self.card_heal = table["heal"]
+		self.card_has_damage = table["has_damage"]
+		self.card_damage = table["damage"]
+
+		# action properties, indexed by catalog index
+		self.action_kind = np.array([{"pass": PASS, "draw": DRAW_CARD, "card": PLAY_CARD}[action["action"]] for action in ActionCatalog.actions], dtype=np.int64)
+		self.action_card = np.array([action["card_id"] if action["card_id"] != None else 0 for action in ActionCatalog.actions], dtype=np.int64)
+		# damage goes to the left for "l", and to the right otherwise
+		self.action_target = np.array([-1 if action["target"] == "l" else 1 for action in ActionCatalog.actions], dtype=np.int64)
+
+		shape = (num_games, self.num_players)
+		# randomly distribute characters
+		characters = character_params["characters"]
+		assignment = self.rng.permuted(np.tile(np.arange(len(characters)), (num_games, 1)), axis=1)[:, :self.num_players]
+		self.hp = np.array([character["max_hp"] for character in characters], dtype=np.int64)[assignment]
+		self.hp_until_max = np.zeros(shape, dtype=np.int64)
+		self.max_sp = np.array([character["max_sp"] for character in characters], dtype=np.int64)[assignment]
+		self.sp = self.max_sp.copy()
+		self.status = np.full(shape, WAIT, dtype=np.int64)
+		self.hands = np.zeros((*shape, len(table)), dtype=np.int64)
+
+		# every game has its own main deck, drawn from the cursor onwards
+		self.deck_cards = np.array([card["id"] for card in deck_params["main_cards"]], dtype=np.int64)
+		self.decks = np.zeros((num_games, len(self.deck_cards)), dtype=np.int64)
+		self.deck_cursor = np.full(num_games, len(self.deck_cards), dtype=np.int64)
+
+		initial_draw_amount = np.array([character["initial_draw_amount"] for character in characters], dtype=np.int64)[assignment]
+		for p in range(self.num_players):
+			for k in range(initial_draw_amount[:, p].max(initial=0)):
+				games = np.flatnonzero(initial_draw_amount[:, p] > k)
+				self.hands[games, p, self._draw(games)] += 1
+
+		self.turn = np.ones(num_games, dtype=np.int64)
+		self.current_player = np.zeros(num_games, dtype=np.int64)
+		self.done = self.turn >= self.max_turns
+		self.winner = np.full(num_games, -1, dtype=np.int64)
+		self.rewards = np.zeros(shape, dtype=np.float64)
+
+	'''
+	Return a (games, actions) mask of which catalog actions the current player of
+	each game may take, matching getValidActionsInState
+	'''
+	def validActions(self):
+		b = np.arange(self.num_games)
+		p = self.current_player
+		return ActionMasks.masks(self.status[b, p], self.sp[b, p], self.hands[b, p])
+
+	'''
+	Choose a uniformly random valid action for every game
+	'''
+	def randomActions(self):
+		mask = self.validActions()
+		# pick the k-th valid action of each game
+		k = (self.rng.random(self.num_games) * mask.sum(axis=1)).astype(np.int64)
+		return np.argmax(np.cumsum(mask, axis=1) > k[:, None], axis=1)
+
+	'''
+	Apply one action per game for each game's current player. actions is an
+	array of catalog indices, and is ignored for finished games
+	'''
+	def step(self, actions):
+		games = np.flatnonzero(~self.done)
+		actions = np.asarray(actions)[games]
+		kinds = self.action_kind[actions]
+
+		b = games[kinds == PASS]
+		p = self.current_player[b]
+		self.status[b, p] = WAIT
+		# small constant penalty for passing
+		self.rewards[b, p] -= 10
+
+		b = games[kinds == DRAW_CARD]
+		p = self.current_player[b]
+		self.status[b, p] = DRAW
+		self.hands[b, p, self._draw(b)] += 1
+		self.sp[b, p] -= game_constants["sp_per_card"]
+		# reward a tiny bit for how much sp is left after the draw
+		self.rewards[b, p] += self.sp[b, p] - self.max_sp[b, p] / 2
+
+		card_actions = actions[kinds == PLAY_CARD]
+		self._playCards(games[kinds == PLAY_CARD], self.action_card[card_actions], self.action_target[card_actions])
+
+		# passing ends the player's turn
+		self._nextPlayer(games[kinds == PASS])
+
+	'''
+	Play random actions until every game is finished. Returns the number of
+	actions played, which is one per unfinished game on each step
+	'''
+	def run(self):
+		actions = 0
+		while not self.done.all():
+			actions += int((~self.done).sum())
+			self.step(self.randomActions())
+		return actions
+
+	'''
+	Return and reset the accumulated rewards
+	'''
+	def takeRewards(self):
+		rewards = self.rewards
+		self.rewards = np.zeros_like(rewards)
+		return rewards
+
+	def _playCards(self, b, cards, targets):
+		p = self.current_player[b]
+		self.status[b, p] = PLAY
+		self.sp[b, p] -= self.card_sp[cards]
+		self.hands[b, p, cards] -= 1
+
+		# for now, cards can only heal themselves or damage others
+		heal = self.card_has_heal[cards]
+		hb, hp, hcards = b[heal], p[heal], cards[heal]
+		# player can only heal if they aren't already dead
+		alive = self.hp[hb, hp] > 0
+		actual_healing = np.where(alive, np.minimum(self.card_heal[hcards], self.hp_until_max[hb, hp]), 0)
+		self.hp[hb, hp] += actual_healing
+		self.hp_until_max[hb, hp] -= actual_healing
+		# reward healing, penalize for trying to heal while dead
+		self.rewards[hb, hp] += np.where(alive, actual_healing * 3, -self.card_heal[hcards] * 3)
+
+		damage = self.card_has_damage[cards]
+		db, dp, dcards = b[damage], p[damage], cards[damage]
+		target = (dp + targets[damage]) % self.num_players
+		actual_damage = np.minimum(self.card_damage[dcards], self.hp[db, target])
+		self.hp[db, target] -= actual_damage
+		self.hp_until_max[db, target] += actual_damage
+		# reward damage like healing, but proportionally to how many players are
+		# playing the game, with a bonus if the action killed the other player
+		self.rewards[db, dp] += actual_damage * 3 / (self.num_players - 1)
+		self.rewards[db, dp] += np.where(self.hp[db, target] == 0, 50, 0)
+
+		# check if this ended the game
+		alive = self.hp[db] > 0
+		won = alive.sum(axis=1) == 1
+		self._finishGames(db[won], np.argmax(alive[won], axis=1))
+
+	def _finishGames(self, b, winners):
+		self.done[b] = True
+		self.winner[b] = winners
+		# the winner is given a reward for winning, the negative of that reward is
+		# distributed amongst the losers
+		won = np.arange(self.num_players)[None, :] == winners[:, None]
+		self.rewards[b] += np.where(won, game_constants["win_reward"], -game_constants["win_reward"] / (self.num_players - 1))
+
+	def _nextPlayer(self, b):
+		self.current_player[b] += 1
+		wrapped = b[self.current_player[b] == self.num_players]
+		self.current_player[wrapped] = 0
+		self.turn[wrapped] += 1
+		self.done[wrapped] |= self.turn[wrapped] >= self.max_turns
+
+		# refill player sp before running actions
+		b = b[~self.done[b]]
+		p = self.current_player[b]
+		self.sp[b, p] = self.max_sp[b, p]
+
+	def _draw(self, b):
+		# refill and shuffle decks which have run out
+		empty = b[self.deck_cursor[b] >= len(self.deck_cards)]
+		if len(empty):
+			self.decks[empty] = self.rng.permuted(np.tile(self.deck_cards, (len(empty), 1)), axis=1)
+			self.deck_cursor[empty] = 0
+		cards = self.decks[b, self.deck_cursor[b]]
+		self.deck_cursor[b] += 1
+		return cards
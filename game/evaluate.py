@@ -0,0 +1,53 @@
+import numpy as np
+
+from game.game import Game
+
+'''
+Evaluation plays games between GreedyAgents which share one frozen
+PolicySnapshot, and aggregates who won and how long games took. Nothing is
+learned and the database is never touched, so the snapshot should be loaded
+before calling runEvaluation. Helpful notes:
+	characters are identified by their "name", or by their index in
+		character_params["characters"] if they have none
+	a game which reaches max_turns is a timeout, and has no winner
+'''
+
+'''
+Play num_games evaluation games. game_params, agent_params, deck_params and
+character_params are as in game/game.py, agent_mode is always "eval". Returns
+an object with the following fields:
+	games: how many games were played
+	timeouts: how many games reached max_turns
+	turns: an array of the number of turns each game went to
+	characters: an object per character name, with how many games the character
+		played and won
+'''
+def runEvaluation(snapshot, num_games, game_params, agent_params, deck_params, character_params):
+	game_params = dict(game_params, agent_mode = "eval", verbose = False)
+	agent_params = dict(agent_params, verbose = False)
+
+	# games shuffle the character list in place, so names are found by identity
+	names = {id(character): character.get("name", str(i)) for i, character in enumerate(character_params["characters"])}
+	characters = {name: {"games": 0, "wins": 0} for name in names.values()}
+	turns = np.zeros(num_games, dtype=np.int64)
+	timeouts = 0
+
+	for game_number in range(num_games):
+		game = Game(snapshot, game_params, agent_params, deck_params, character_params)
+		game.run()
+		turns[game_number] = game.g.turn
+
+		for p in range(len(game.players)):
+			characters[names[id(game.characters[p])]]["games"] += 1
+		if game.winning_player == None:
+			timeouts += 1
+		else:
+			winner = game.players.index(game.winning_player)
+			characters[names[id(game.characters[winner])]]["wins"] += 1
+
+	return {
+		"games": num_games,
+		"timeouts": timeouts,
+		"turns": turns,
+		"characters": characters,
+	}
@@ -1,6 +1,9 @@
 import numpy as np
 
+from game.state import GlobalState, PlayerExternal, PlayerInternal, StateView
+from player.actor import ActorAgent
 from player.agent import Agent
+from player.greedy import GreedyAgent
 from util.card_definitions import CardDefinitions
 from util.constants import game_constants, param_or_default
 from util.deck import Deck
@@ -14,11 +17,18 @@ A Game sets up and handles state and actions for players. Helpful notes:
 class Game:
 	'''
 	Initialize a new game.
-	q: the q table agents should use
+	q: the q table agents should use, a util.q_table.QTable. when agent_mode is
+		"act" or "eval", this is a util.policy_snapshot.PolicySnapshot or a
+		util.mapped_policy.MappedPolicy instead
 	game_params: an object with the following fields:
 		num_agents: the number of agents playing the game
 		num_humans: TODO the number of players playing the game
 		max_turns: essentially a timeout
+		shuffle_pool_size: how many deck shuffles to generate at a time
+		agent_mode: "learn" for agents which update q as they play, "act" for
+			agents which play from a snapshot and record their transitions, or
+			"eval" for agents which only play from a snapshot. eval games don't
+			record stats or print, so many of them can be played quickly
 		verbose: TODO make the game talkative :)
 	agent_params: an object specifying which params to use for agents. detailed in
 		agent/agent.py
@@ -28,29 +38,36 @@ class Game:
 		answer_cards: the cards in the answer deck
 	character_params: an object specifying the characters to use in the game:
 		characters: a list of characters
+	rng: a np.random.RandomState the game shuffles players, decks and characters
+		with, and agents choose random actions from. by default this is
+		np.random, so that games follow np.random.seed
 	'''
-	def __init__(self, q, game_params, agent_params, deck_params, character_params):
+	def __init__(self, q, game_params, agent_params, deck_params, character_params, rng = None):
+		self.rng = rng if rng != None else np.random
 		self.verbose = param_or_default(game_params, game_constants, "verbose")
 		num_agents = param_or_default(game_params, game_constants, "num_agents")
 		num_humans = param_or_default(game_params, game_constants, "num_humans")
+		self.agent_mode = param_or_default(game_params, game_constants, "agent_mode")
 
 		# create and shuffle players
 		self.players = [self._createAgent(q, agent_params) for _ in range(num_agents)] + [self._createHuman() for _ in range(num_humans)]
-		np.random.shuffle(self.players)
+		self.rng.shuffle(self.players)
 
-		# create and shuffle decks
+		# create decks. they are shuffled when first drawn from
+		shuffle_pool_size = param_or_default(game_params, game_constants, "shuffle_pool_size")
 		self.decks = {
-			"main": Deck(deck_params["main_cards"]),
-			"treasure": Deck(deck_params["treasure_cards"]),
-			"answer": Deck(deck_params["answer_cards"]),
+			"main": Deck(deck_params["main_cards"], shuffle_pool_size, seed = self.rng.randint(2 ** 31)),
+			"treasure": Deck(deck_params["treasure_cards"], shuffle_pool_size, seed = self.rng.randint(2 ** 31)),
+			"answer": Deck(deck_params["answer_cards"], shuffle_pool_size, seed = self.rng.randint(2 ** 31)),
 		}
 
 		# randomly distribute characters. correspond to each player by their index
 		self.characters = character_params["characters"]
-		np.random.shuffle(self.characters)
+		self.rng.shuffle(self.characters)
 
 		# set initial player states
-		self.state = self._createInitialGlobalState()
+		self._createInitialGlobalState()
+		self.views = [self._createInitialStateForP(p) for p in range(len(self.players))]
 		self.max_turns = param_or_default(game_params, game_constants, "max_turns")
 		self.winning_player = None
 		self.rewards = [0 for p in range(len(self.players))]
@@ -60,55 +77,50 @@ class Game:
 	'''
 	def _createAgent(self, q, agent_params):
 		# initialize agents with fresh memory, but the same q
-		return Agent(q, agent_params)
+		if self.agent_mode == "act":
+			return ActorAgent(q, agent_params, rng = self.rng)
+		if self.agent_mode == "eval":
+			return GreedyAgent(q, agent_params, rng = self.rng)
+		return Agent(q, agent_params, rng = self.rng)
  
 	def _createHuman(self):
 		# maybe ill do this someday lol
 		raise Exception("Human players not implemented")
 
 	'''
-	Initialize the global state
+	Initialize the global state, and the internal and external state of every
+	player, indexed by player
 	'''
 	def _createInitialGlobalState(self):
-		state = {
-			"g": { # global state
-				"turn": 1,
-				# "musician": None,
-			}
-		}
+		self.g = GlobalState(turn = 1)
+		self.internals = []
+		self.externals = []
 		for p in range(len(self.players)):
 			# interal properties are properties which are only visible or relevant
 			# to the player
-			state["player_{}_internal".format(p)] = {
-				"status": "wait", # draw, wait, or play
-				"cards": [self.decks["main"].draw() for _ in range(self.characters[p]["initial_draw_amount"])] # TODO consider musicians
-			}
-			state["player_{}_external".format(p)] = {
-				"hp": self.characters[p]["max_hp"],
-				"hp_until_max": 0,
-				"sp": self.characters[p]["max_sp"],
-				"max_sp": self.characters[p]["max_sp"],
-				# "treasures": 0,
-				# "answers": 0,
-				# "has_secrets_in_hand": any([card["type"] == "secret" for card in state["player_{}_internal".format(p)]["cards"]]),
-				# "has_facedown_cards": False,
-				# "num_cards": len(state["player_{}_internal".format(p)]["cards"]),
-				# "is_friend": False
-			}
-		return state
+			self.internals.append(PlayerInternal(
+				status = "wait",
+				cards = self.decks["main"].draw(self.characters[p]["initial_draw_amount"]) # TODO consider musicians
+			))
+			self.externals.append(PlayerExternal(
+				hp = self.characters[p]["max_hp"],
+				hp_until_max = 0,
+				sp = self.characters[p]["max_sp"],
+				max_sp = self.characters[p]["max_sp"],
+			))
 
 	'''
 	Create a permanent state object to give to a player. This object should never
 	have to be recreated, ie never change the shallow references
 	'''
 	def _createInitialStateForP(self, p):
-		return {
-			"g": self.state["g"],
-			"internal": self.state["player_{}_internal".format(p)],
-			"external": self.state["player_{}_external".format(p)],
-			"left": self.state["player_{}_external".format((p - 1) % len(self.players))], # the player or friend to the left
-			"right": self.state["player_{}_external".format((p + 1) % len(self.players))] # the player or friend to the right
-		}
+		return StateView(
+			self.g,
+			self.internals[p],
+			self.externals[p],
+			self.externals[(p - 1) % len(self.players)], # the player or friend to the left
+			self.externals[(p + 1) % len(self.players)] # the player or friend to the right
+		)
 
 
 	'''
@@ -116,10 +128,11 @@ class Game:
 	'''
 	def run(self):
 		# kick things off
-		while self.state["g"]["turn"] < self.max_turns:
+		while self.g.turn < self.max_turns:
 			self._runTurn()
 			if self.winning_player != None:
-				print("Game went to turn {}".format(self.state["g"]["turn"]))
+				if self.agent_mode != "eval":
+					print("Game went to turn {}".format(self.g.turn))
 				return "Player won"
 		return "Game reached maximum number of turns"
 
@@ -129,14 +142,16 @@ class Game:
 	def _runTurn(self):
 		for p in range(len(self.players)):
 			# refill player sp before running actions
-			self.state["player_{}_external".format(p)]["sp"] = self.state["player_{}_external".format(p)]["max_sp"]
+			e = self.externals[p]
+			e.sp = e.max_sp
 
 			self._runActionsForP(p)
 			if self.winning_player != None:
 				return
 
-		Stats.recordStat("turns")
-		self.state["g"]["turn"] += 1
+		if self.agent_mode != "eval":
+			Stats.recordStat("turns")
+		self.g.turn += 1
 
 	'''
 	Runs through a players actions for a turn.
@@ -144,9 +159,9 @@ class Game:
 	def _runActionsForP(self, p):
 		player = self.players[p]
 		action = None
-		if self.state["g"]["turn"] == 1:
+		if self.g.turn == 1:
 			# get initial action
-			action = player.initialQuery(self._createInitialStateForP(p))
+			action = player.initialQuery(self.views[p])
 		else:
 			# update player with last reward and get a new action
 			action = self._queryP(p)
@@ -165,38 +180,37 @@ class Game:
 	'''
 	def _executeActionForP(self, action, p):
 		# cache refs to P's internal and external states
-		i = self.state["player_{}_internal".format(p)]
-		e = self.state["player_{}_external".format(p)]
+		i = self.internals[p]
+		e = self.externals[p]
 
 		if action["action"] == "pass":
-			i["status"] = "wait"
+			i.status = "wait"
 			# small constant penalty for passing
 			self.rewards[p] -= 10
 			return False
 
 		if action["action"] == "draw":
-			i["status"] = "draw"
-			i["cards"].append(self.decks["main"].draw())
-			e["sp"] -= game_constants["sp_per_card"]
+			i.status = "draw"
+			i.addCard(self.decks["main"].draw())
+			e.sp -= game_constants["sp_per_card"]
 			# reward a tiny bit for how much sp is left after the draw
-			self.rewards[p] += e["sp"] - e["max_sp"] / 2
+			self.rewards[p] += e.sp - e.max_sp / 2
 			return True
 
 		if action["action"] == "card":
-			i["status"] = "play"
+			i.status = "play"
 			card = CardDefinitions.getCardById(action["card_id"])
-			e["sp"] -= card["sp"]
-			
-			# this works because agents have identical references to cards
-			i["cards"].remove(card)
+			e.sp -= card["sp"]
+
+			i.removeCard(card)
 
 			# for now, cards can only heal themselves or damage others
 			if "heal" in card:
 				# player can only heal if they aren't already dead
-				if e["hp"] > 0:
-					actual_healing = min(card["heal"], e["hp_until_max"])
-					e["hp"] += actual_healing
-					e["hp_until_max"] -= actual_healing
+				if e.hp > 0:
+					actual_healing = min(card["heal"], e.hp_until_max)
+					e.hp += actual_healing
+					e.hp_until_max -= actual_healing
 
 					# reward healing
 					self.rewards[p] += actual_healing * 3
@@ -206,21 +220,21 @@ class Game:
 
 			if "damage" in card:
 				targetP = (p - 1 if action["target"] == "l" else p - len(self.players) + 1) % len(self.players)
-				targetE = self.state["player_{}_external".format(targetP)]
-				actual_damage = min(card["damage"], targetE["hp"])
-				targetE["hp"] -= actual_damage
-				targetE["hp_until_max"] += actual_damage
+				targetE = self.externals[targetP]
+				actual_damage = min(card["damage"], targetE.hp)
+				targetE.hp -= actual_damage
+				targetE.hp_until_max += actual_damage
 
 				# reward damage like healing, but proportionally to how many
 				# players are playing the game
 				self.rewards[p] += actual_damage * 3 / (len(self.players) - 1)
 
 				# bonus reward if the action killed the other player
-				if targetE["hp"] == 0:
+				if targetE.hp == 0:
 					self.rewards[p] += 50
 
 				# check if this ended the game
-				alive = [self.players[other_p] for other_p in range(len(self.players)) if self.state["player_{}_external".format(other_p)]["hp"] > 0]
+				alive = [self.players[other_p] for other_p in range(len(self.players)) if self.externals[other_p].hp > 0]
 				if len(alive) == 1:
 					self.winning_player = alive[0]
 
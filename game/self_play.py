@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import deque
+
+import numpy as np
+
+from game.game import Game
+from player.agent import Agent
+from util.action_catalog import ActionCatalog
+from util.constants import agent_constants, run_constants
+from util.policy_snapshot import PolicySnapshot
+from util.stats import Stats
+from util.worker import initializeWorker
+
+'''
+Parallel self-play, split into actors and a learner. Worker processes play
+games with ActorAgents against a read-only PolicySnapshot of q and send back
+the transitions each player made. The calling process is the only learner: it
+replays those transitions into q with regular Agents, owns the Database, and
+periodically writes a fresh snapshot for the workers to pick up.
+
+Helpful notes:
+	results are learned from in the order tasks were submitted, so a run is
+		repeatable for a given numpy seed and number of workers
+	snapshots are saved in a temporary directory, passed to workers by path
+	actors look up closest states in their snapshot and send them along with
+		their transitions, so the learner only replays q updates
+'''
+
+# state which lives in each worker process
+_worker = {}
+
+def _initializeWorker(cards, action_ids, game_params, agent_params, character_params):
+	initializeWorker(_worker, cards, action_ids, dict(game_params, agent_mode = "act"), agent_params)
+	_worker["character_params"] = character_params
+	_worker["snapshot_version"] = None
+
+'''
+Play games in a worker. Returns a list with an object per game, containing the
+transitions of each player and the number of turns the game went to
+'''
+def _playGames(snapshot_path, snapshot_version, seed, num_games):
+	if _worker["snapshot_version"] != snapshot_version:
+		_worker["snapshot"] = PolicySnapshot.load(snapshot_path)
+		_worker["snapshot_version"] = snapshot_version
+	np.random.seed(seed)
+
+	results = []
+	for _ in range(num_games):
+		game = Game(_worker["snapshot"], _worker["game_params"], _worker["agent_params"], _worker["deck_params"], _worker["character_params"])
+		game.run()
+		results.append({
+			"episodes": [player.transitions for player in game.players],
+			"turns": game.g.turn,
+		})
+	return results
+
+'''
+Play and learn from num_games games using num_workers worker processes.
+q: the q table to learn into. the Database must be initialized
+cards: the card definitions, as passed to CardDefinitions.setDefinitions
+game_params, agent_params, character_params: as in game/game.py.
+	agent_params["learning_rate"] decays after every game, like in main.py
+checkpoint: an optional util.checkpoint.Checkpoint, updated after every game
+	which is learned from. games still being played by workers are lost if the
+	run stops, and are played again with new seeds on resume
+first_game: how many games the run had already finished, for checkpoints
+'''
+def runSelfPlay(q, num_games, num_workers, cards, game_params, agent_params, character_params, checkpoint = None, first_game = 0):
+	games_per_task = run_constants["games_per_task"]
+	refresh_games = run_constants["snapshot_refresh_games"]
+
+	directory = tempfile.mkdtemp(prefix = "cardai_snapshots_")
+	snapshot = {"version": 0}
+	def refreshSnapshot():
+		snapshot["version"] += 1
+		snapshot["path"] = os.path.join(directory, "snapshot_{}".format(snapshot["version"]))
+		PolicySnapshot.fromDatabase(q).save(snapshot["path"])
+	refreshSnapshot()
+
+	action_ids = [ActionCatalog.getId(action) for action in ActionCatalog.actions]
+	pool = multiprocessing.Pool(num_workers, _initializeWorker, (cards, action_ids, game_params, dict(agent_params), character_params))
+
+	# keep every worker busy, with a task queued up behind it
+	pending = deque()
+	games_submitted = 0
+	games_learned = 0
+	try:
+		while games_learned < num_games:
+			while len(pending) < 2 * num_workers and games_submitted < num_games:
+				task_games = min(games_per_task, num_games - games_submitted)
+				pending.append((snapshot["version"], pool.apply_async(_playGames, (snapshot["path"], snapshot["version"], np.random.randint(2 ** 31), task_games))))
+				games_submitted += task_games
+
+			_, task = pending.popleft()
+			for result in task.get():
+				for episode in result["episodes"]:
+					Agent(q, agent_params).replay(episode)
+				for _ in range(result["turns"] - 1):
+					Stats.recordStat("turns")
+				Stats.recordStat("games")
+				games_learned += 1
+				print("Learned from game {}".format(first_game + games_learned))
+
+				agent_params["learning_rate"] *= 1 - agent_constants["learning_rate_decay"]
+				if checkpoint != None:
+					checkpoint.update(first_game + games_learned, agent_params, character_params)
+
+				if games_learned % refresh_games == 0 and games_learned < num_games:
+					refreshSnapshot()
+					# remove snapshots which no queued task still needs
+					oldest = min([version for version, _ in pending], default = snapshot["version"])
+					for version in range(1, oldest):
+						shutil.rmtree(os.path.join(directory, "snapshot_{}".format(version)), ignore_errors = True)
+	finally:
+		pool.terminate()
+		pool.join()
+		shutil.rmtree(directory, ignore_errors = True)
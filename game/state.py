@@ -0,0 +1,102 @@
+'''
+Compact records for game state. Each record has fixed fields, so that state is
+cheap to update in place and cheap to turn into a hashable key. Helpful notes:
+	a StateView is what an agent is given. it is created once per player and
+		references the game's records, so it always reflects the current state
+	hands are count vectors over card ids, kept in sync with their fingerprint
+		in the state key, so that keys never need to walk the hand
+'''
+import numpy as np
+
+from util.card_definitions import CardDefinitions
+from util.state_key import cardKey, handMask, packKey, statusCodes
+
+'''
+State which is shared by all players
+'''
+class GlobalState:
+	__slots__ = ["turn"]
+
+	def __init__(self, turn = 1):
+		self.turn = turn
+		# self.musician = None
+
+'''
+Properties which are only visible or relevant to the player
+'''
+class PlayerInternal:
+	__slots__ = ["status", "hand", "hand_key"]
+
+	def __init__(self, status, cards):
+		self.status = status # draw, wait, or play
+		# how many of each card id the player holds
+		self.hand = np.zeros(CardDefinitions.size(), dtype=np.int64)
+		self.hand_key = 0
+		for card in cards:
+			self.addCard(card)
+
+	'''
+	The cards in hand as card definitions, ordered by id. This builds a new list,
+	so prefer hand where counts are enough
+	'''
+	@property
+	def cards(self):
+		return [CardDefinitions.definitions[card_id] for card_id in np.repeat(np.arange(len(self.hand)), self.hand).tolist()]
+
+	def addCard(self, card):
+		self.hand[card["id"]] += 1
+		self.hand_key = (self.hand_key + cardKey(card["id"])) & handMask
+
+	def removeCard(self, card):
+		if self.hand[card["id"]] == 0:
+			raise Exception("Card {} is not in hand".format(card["id"]))
+		self.hand[card["id"]] -= 1
+		self.hand_key = (self.hand_key - cardKey(card["id"])) & handMask
+
+'''
+Properties which are visible to every player
+'''
+class PlayerExternal:
+	__slots__ = ["hp", "hp_until_max", "sp", "max_sp"]
+
+	def __init__(self, hp, hp_until_max, sp, max_sp):
+		self.hp = hp
+		self.hp_until_max = hp_until_max
+		self.sp = sp
+		self.max_sp = max_sp
+		# self.treasures = 0
+		# self.answers = 0
+		# self.has_secrets_in_hand = False
+		# self.has_facedown_cards = False
+		# self.num_cards = 0
+		# self.is_friend = False
+
+'''
+A player's view of the game: the global state, their own state, and the
+external state of the players to their left and right
+'''
+class StateView:
+	__slots__ = ["g", "internal", "external", "left", "right"]
+
+	def __init__(self, g, internal, external, left, right):
+		self.g = g
+		self.internal = internal
+		self.external = external
+		self.left = left # the player or friend to the left
+		self.right = right # the player or friend to the right
+
+	'''
+	The packed integer identity of the current state, see util/state_key.py.
+	Building it doesn't depend on the hand size
+	'''
+	def key(self):
+		external = self.external
+		left = self.left
+		right = self.right
+		return packKey((
+			self.g.turn,
+			statusCodes[self.internal.status],
+			external.hp, external.hp_until_max, external.sp, external.max_sp,
+			left.hp, left.hp_until_max, left.sp, left.max_sp,
+			right.hp, right.hp_until_max, right.sp, right.max_sp,
+		), self.internal.hand_key)
@@ -0,0 +1,216 @@
+import itertools
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import deque
+from statistics import NormalDist
+
+import numpy as np
+
+from game.evaluate import runEvaluation
+from util.action_catalog import ActionCatalog
+from util.constants import game_constants, param_or_default, tournament_constants
+from util.mapped_policy import MappedPolicy
+from util.worker import initializeWorker
+
+'''
+A tournament plays every pairing of characters against each other with a frozen
+policy, and estimates how often each character wins its matchups. Games are
+played in batches, and each matchup stops as soon as its result is clear, so
+close matchups get most of the games. Helpful notes:
+	a matchup stops when a sequential probability ratio test decides which
+		character is favoured by at least sprt_delta, when the confidence
+		interval of its win rate is narrow enough, or at max_games
+	the sprt only applies to matchups of 2 players. with more players,
+		matchups stop on their intervals
+	win rates only count games with a winner, timeouts are reported separately
+	batches are played by worker processes, like in game/self_play.py, and
+		results are counted in the order they were submitted, so a tournament is
+		repeatable for a given numpy seed and number of workers
+	workers share one memory mapped util.mapped_policy.MappedPolicy, so adding
+		workers doesn't add copies of q
+'''
+
+# state which lives in each worker process
+_worker = {}
+
+def _initializeWorker(cards, action_ids, snapshot_path, game_params, agent_params):
+	initializeWorker(_worker, cards, action_ids, game_params, agent_params)
+	_worker["snapshot"] = MappedPolicy.load(snapshot_path)
+
+'''
+Play num_games games of a matchup in a worker. Returns the results of
+runEvaluation
+'''
+def _playMatchup(characters, seed, num_games):
+	np.random.seed(seed)
+	return runEvaluation(_worker["snapshot"], num_games, _worker["game_params"], _worker["agent_params"], _worker["deck_params"], {"characters": list(characters)})
+
+'''
+Return the Wilson score interval for a win rate, as (low, high)
+'''
+def winRateInterval(wins, games, confidence):
+	if games == 0:
+		return 0.0, 1.0
+	z = NormalDist().inv_cdf(0.5 + confidence / 2)
+	p = wins / games
+	center = (p + z * z / (2 * games)) / (1 + z * z / games)
+	half_width = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+	return max(0.0, center - half_width), min(1.0, center + half_width)
+
+'''
+Two one-sided sequential probability ratio tests of an even matchup, H0:
+p = 0.5, against H1: p = 0.5 + delta and against H1: p = 0.5 - delta, after
+wins out of games. Returns 1 if p = 0.5 + delta is accepted, -1 if
+p = 0.5 - delta is accepted, or 0 otherwise. Helpful notes:
+	only an imbalance is ever accepted. accepting H0 doesn't stop anything, so
+		an even matchup is left to the interval rule instead of being called
+	each side is tested at alpha / 2, so an even matchup is called uneven at
+		most about alpha of the time. beta is the chance of missing an imbalance
+		of delta
+'''
+def sprt(wins, games, delta, alpha, beta):
+	upper = math.log((1 - beta) / (alpha / 2))
+	losses = games - wins
+	if wins * math.log(1 + 2 * delta) + losses * math.log(1 - 2 * delta) >= upper:
+		return 1
+	if losses * math.log(1 + 2 * delta) + wins * math.log(1 - 2 * delta) >= upper:
+		return -1
+	return 0
+
+'''
+A single pairing of characters, and everything counted about it so far
+'''
+class Matchup:
+	def __init__(self, characters):
+		self.characters = characters
+		self.names = [character["name"] for character in characters]
+		self.games = 0
+		self.timeouts = 0
+		self.wins = {name: 0 for name in self.names}
+		self.turns = 0
+		self.decision = None
+		# the character the sprt found stronger, if it stopped the matchup
+		self.favoured = None
+		self.pending_games = 0
+
+	def add(self, results):
+		self.games += results["games"]
+		self.timeouts += results["timeouts"]
+		self.turns += int(results["turns"].sum())
+		for name in self.names:
+			self.wins[name] += results["characters"][name]["wins"]
+
+	'''
+	Decide whether this matchup can stop, setting decision to why it stopped
+	'''
+	def update(self, params):
+		decided = self.games - self.timeouts
+		if decided < params["min_games"] and self.games < params["max_games"]:
+			return
+		intervals = [winRateInterval(self.wins[name], decided, params["confidence"]) for name in self.names]
+		favoured = sprt(self.wins[self.names[0]], decided, params["sprt_delta"], params["sprt_alpha"], params["sprt_beta"]) if len(self.names) == 2 else 0
+		if favoured != 0:
+			self.decision = "sprt"
+			self.favoured = self.names[0] if favoured == 1 else self.names[1]
+		elif max([high - low for low, high in intervals]) <= 2 * params["interval_half_width"]:
+			self.decision = "interval"
+		elif self.games >= params["max_games"]:
+			self.decision = "max_games"
+
+	def result(self, confidence):
+		decided = self.games - self.timeouts
+		return {
+			"characters": self.names,
+			"games": self.games,
+			"timeouts": self.timeouts,
+			"mean_turns": self.turns / max(self.games, 1),
+			"wins": dict(self.wins),
+			"win_rates": {name: self.wins[name] / max(decided, 1) for name in self.names},
+			"intervals": {name: winRateInterval(self.wins[name], decided, confidence) for name in self.names},
+			"decision": self.decision,
+			"favoured": self.favoured,
+		}
+
+'''
+Run a tournament between every pairing of characters.
+snapshot: the util.policy_snapshot.PolicySnapshot or
+	util.mapped_policy.MappedPolicy agents play from
+num_workers: how many worker processes to play games in. 0 plays every game in
+	this process
+cards: the card definitions, as passed to CardDefinitions.setDefinitions
+game_params, agent_params, deck_params, character_params: as in game/game.py.
+	game_params["num_agents"] characters play each matchup
+params: an optional object with any field of tournament_constants
+Returns a list with an object per matchup, see Matchup.result
+'''
+def runTournament(snapshot, num_workers, cards, game_params, agent_params, deck_params, character_params, params = {}):
+	params = {name: param_or_default(params, tournament_constants, name) for name in tournament_constants}
+	num_agents = param_or_default(game_params, game_constants, "num_agents")
+
+	# characters are identified by name, or their index if they have none
+	characters = [dict(character, name = character.get("name", str(i))) for i, character in enumerate(character_params["characters"])]
+	matchups = [Matchup(pairing) for pairing in itertools.combinations(characters, num_agents)]
+
+	directory = None
+	pool = None
+	if num_workers > 0:
+		if isinstance(snapshot, MappedPolicy):
+			snapshot_path = snapshot.path
+		else:
+			directory = tempfile.mkdtemp(prefix = "cardai_tournament_")
+			snapshot_path = os.path.join(directory, "policy.qmap")
+			MappedPolicy.write(snapshot_path, snapshot)
+		action_ids = [ActionCatalog.getId(action) for action in ActionCatalog.actions]
+		pool = multiprocessing.Pool(num_workers, _initializeWorker, (cards, action_ids, snapshot_path, game_params, agent_params))
+
+	'''
+	Queue a batch of games for the open matchup with the fewest games queued or
+	played, returning False if every matchup is decided
+	'''
+	def submit():
+		open_matchups = [matchup for matchup in matchups if matchup.decision == None and matchup.games + matchup.pending_games < params["max_games"]]
+		if not open_matchups:
+			return False
+		matchup = min(open_matchups, key = lambda matchup: matchup.games + matchup.pending_games)
+		num_games = min(params["games_per_task"], params["max_games"] - matchup.games - matchup.pending_games)
+		seed = seeds.randint(2 ** 31)
+		if pool != None:
+			task = pool.apply_async(_playMatchup, (matchup.characters, seed, num_games))
+		else:
+			np.random.seed(seed)
+			task = runEvaluation(snapshot, num_games, game_params, agent_params, deck_params, {"characters": list(matchup.characters)})
+		matchup.pending_games += num_games
+		pending.append((matchup, num_games, task))
+		return True
+
+	# batches reseed np.random when they are played in this process, so their
+	# seeds come from a separate generator
+	seeds = np.random.RandomState(np.random.randint(2 ** 31))
+	pending = deque()
+	try:
+		while True:
+			while len(pending) < max(2 * num_workers, 1) and submit():
+				pass
+			if not pending:
+				break
+
+			matchup, num_games, task = pending.popleft()
+			matchup.pending_games -= num_games
+			if matchup.decision != None:
+				# decided while this batch was being played
+				continue
+			matchup.add(task.get() if pool != None else task)
+			matchup.update(params)
+			if matchup.decision != None:
+				print("{} decided by {} after {} games".format(" vs ".join(matchup.names), matchup.decision, matchup.games))
+	finally:
+		if pool != None:
+			pool.terminate()
+			pool.join()
+		if directory != None:
+			shutil.rmtree(directory, ignore_errors = True)
+
+	return [matchup.result(params["confidence"]) for matchup in matchups]
@@ -1,18 +1,49 @@
 
+import argparse
+import os
+
+from game.evaluate import runEvaluation
 from game.game import Game
+from game.self_play import runSelfPlay
+from game.tournament import runTournament
 
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
 from util.card_definitions import CardDefinitions
-from util.constants import agent_constants, run_constants
+from util.checkpoint import Checkpoint
+from util.constants import agent_constants, database_constants, run_constants
 from util.database import Database
 from util.helpers import loadCardDefinitions, loadCharacterDefinitions
+from util.mapped_policy import MappedPolicy
+from util.policy_snapshot import PolicySnapshot
 from util.stats import Stats
 
 def main():
-	# TODO implement command-line args
-
-	# initialize database
-	Database.initialize()
-	q = Database.getQTable()
+	parser = argparse.ArgumentParser(description = "Train agents by playing games against each other")
+	parser.add_argument("--workers", type = int, default = run_constants["num_workers"],
+		help = "play games in this many worker processes. 0 plays every game in this process, which is reproducible")
+	parser.add_argument("--games", type = int, default = run_constants["num_games"],
+		help = "how many games to play")
+	parser.add_argument("--eval", action = "store_true",
+		help = "play a frozen copy of q without learning, and print win and turn stats")
+	parser.add_argument("--resume", action = "store_true",
+		help = "continue training from the last checkpoint instead of starting over")
+	parser.add_argument("--tournament", action = "store_true",
+		help = "play a frozen copy of q in every pairing of characters until each matchup's win rate is clear")
+	parser.add_argument("--random-action-rate", type = float, default = 0.0,
+		help = "how often agents act randomly with --eval or --tournament")
+	parser.add_argument("--snapshot", nargs = "?", const = run_constants["snapshot_path"], default = None,
+		help = "with --eval or --tournament, play the snapshot saved at the end of training (or the snapshot directory or policy file at the given path) without opening the database")
+	parser.add_argument("--learning-mode", choices = ["dyna", "trace"], default = agent_constants["learning_mode"],
+		help = "how agents learn from past steps: dyna replays them, trace updates them through an eligibility trace")
+	parser.add_argument("--in-memory", action = "store_true",
+		help = "train against a copy of the database in memory, backed up to disk at every checkpoint and when done")
+	parser.add_argument("--journal-mode", default = database_constants["journal_mode"],
+		help = "journal_mode pragma for the database, such as WAL")
+	parser.add_argument("--synchronous", default = database_constants["synchronous"],
+		help = "synchronous pragma for the database, such as NORMAL")
+	args = parser.parse_args()
+	from_snapshot = args.snapshot != None and (args.eval or args.tournament)
 
 	cards = loadCardDefinitions()
 	characters = loadCharacterDefinitions()
@@ -20,8 +51,24 @@ def main():
 	# initialize card definitions for querying
 	CardDefinitions.setDefinitions(cards["main"], cards["treasures"], cards["answers"])
 
+	# build every possible action once, so actions never have to be queried
+	ActionCatalog.build()
+	if from_snapshot:
+		snapshot = MappedPolicy.load(args.snapshot) if os.path.isfile(args.snapshot) else PolicySnapshot.load(args.snapshot)
+		ActionCatalog.setIds(snapshot.action_ids)
+	else:
+		# initialize database
+		Database.initialize({
+			"in_memory": args.in_memory or database_constants["in_memory"],
+			"journal_mode": args.journal_mode,
+			"synchronous": args.synchronous,
+		})
+		q = Database.getQTable()
+		Database.syncActionCatalog()
+	ActionMasks.build()
+
 	# how many games to play per run
-	num_games = run_constants["num_games"]
+	num_games = args.games
 	# every nth game will be verbose
 	verbose_mod = run_constants["verbose_mod"]
 
@@ -34,7 +81,8 @@ def main():
 
 	# agent params as defined in player/agent.py
 	agent_params = {
-		"learning_rate": agent_constants["learning_rate"]
+		"learning_rate": agent_constants["learning_rate"],
+		"learning_mode": args.learning_mode,
 		# "discount_factor"
 		# "endgame_discount_factor"
 		# "random_action_rate"
@@ -53,25 +101,62 @@ def main():
 		"characters": characters
 	}
 
-	for game_number in range(num_games):
-		verbose = game_number % verbose_mod == verbose_mod - 1
-		game_params["verbose"] = verbose
-		agent_params["verbose"] = verbose
-
-		print("Running game {}".format(game_number + 1))
-		game = Game(q, game_params, agent_params, deck_params, character_params)
-		game.run()
-		Stats.recordStat("games")
-
-		agent_params["learning_rate"] *= 1 - agent_constants["learning_rate_decay"]
-
-	Database.commit()
+	if args.eval:
+		# play from a snapshot of q. the database is closed before any games are
+		# played, so evaluation never waits on it
+		if not from_snapshot:
+			snapshot = PolicySnapshot.fromDatabase(q)
+			Database.destroy()
+		agent_params["random_action_rate"] = args.random_action_rate
+		Stats.printEvaluationStats(runEvaluation(snapshot, num_games, game_params, agent_params, deck_params, character_params))
+		return
+
+	if args.tournament:
+		# like --eval, the database is only used to take the snapshot
+		if not from_snapshot:
+			snapshot = PolicySnapshot.fromDatabase(q)
+			Database.destroy()
+		agent_params["random_action_rate"] = args.random_action_rate
+		Stats.printTournamentStats(runTournament(snapshot, args.workers, cards, game_params, agent_params, deck_params, character_params))
+		return
+
+	# commit and save progress every so often, so that a stopped run can resume
+	checkpoint = Checkpoint()
+	first_game = 0
+	if args.resume:
+		first_game = checkpoint.load(agent_params, character_params)
+		print("Resuming after game {}".format(first_game))
+	else:
+		checkpoint.clear()
+
+	if args.workers > 0:
+		runSelfPlay(q, num_games - first_game, args.workers, cards, game_params, agent_params, character_params, checkpoint, first_game)
+	else:
+		for game_number in range(first_game, num_games):
+			verbose = game_number % verbose_mod == verbose_mod - 1
+			game_params["verbose"] = verbose
+			agent_params["verbose"] = verbose
+
+			print("Running game {}".format(game_number + 1))
+			game = Game(q, game_params, agent_params, deck_params, character_params)
+			game.run()
+			Stats.recordStat("games")
+
+			agent_params["learning_rate"] *= 1 - agent_constants["learning_rate_decay"]
+			checkpoint.update(game_number + 1, agent_params, character_params)
+
+	checkpoint.save(num_games, agent_params, character_params)
+	snapshot = PolicySnapshot.fromDatabase(q)
+	snapshot.save(run_constants["snapshot_path"])
+	MappedPolicy.write(run_constants["policy_path"], snapshot)
 
 	# deinitialize database
 	Database.destroy()
 
 	Stats.printStats()
 	Stats.printQStats(q)
+	Stats.printStateCacheStats(Database.state_cache)
+	Stats.printActionMaskStats(ActionMasks)
 	Stats.graphChosenActionUsage()
 	Stats.graphTurnCountPerGame()
 
@@ -0,0 +1,66 @@
+from player.agent import Agent
+from util.helpers import DatabaseHelpers
+
+'''
+An ActorAgent plays from a read-only PolicySnapshot instead of learning. It
+never touches the database, and records every transition it makes so that a
+learner can replay them later with Agent.replay. This is what lets games be
+played in worker processes while a single process owns the q table.
+
+Helpful notes:
+    transitions are (state key, action id, reward, next state key, game ended,
+        closest state id, similarity)
+    actions are recommended from the current state, or the closest state in
+    the snapshot if the current state has no q values
+    the closest state in a transition is the one the learner bootstraps from:
+        the state key in dyna mode, the next state key in trace mode. looking
+        it up here, in the snapshot that is already needed to pick actions,
+        keeps the learner from searching for it again
+'''
+class ActorAgent(Agent):
+    '''
+    Initialize a new actor.
+    snapshot: a util.policy_snapshot.PolicySnapshot or
+        util.mapped_policy.MappedPolicy to choose actions from
+    params: the same params as Agent. only random_action_rate and verbose are
+        used
+    rng: the same as Agent
+    '''
+    def __init__(self, snapshot, params, rng = None):
+        super().__init__(snapshot.q, params, rng = rng)
+        self.snapshot = snapshot
+        self.transitions = []
+
+        # Current state key, and its snapshot lookup
+        self.s_key = None
+        self.s_lookup = None
+
+    def initialQuery(self, s):
+        self.s = s
+        self.s_key = DatabaseHelpers.stateKey(self.s)
+        self.s_lookup = self.snapshot.lookup(self.s_key)
+
+        recommended_a_id, _ = self.s_lookup[2:]
+
+        self.a_id, self.a = self._selectAction(recommended_a_id)
+
+        return self.a
+
+    def query(self, reward, game_ended = False):
+        # its possible that another player won before initialQuery is called, just
+        # return in this case
+        if not self.s:
+            return
+
+        new_s_key = DatabaseHelpers.stateKey(self.s)
+        new_s_lookup = self.snapshot.lookup(new_s_key)
+        closest_s_id, similarity = (new_s_lookup if self.learning_mode == "trace" else self.s_lookup)[:2]
+        self.transitions.append((self.s_key, self.a_id, reward, new_s_key, game_ended, closest_s_id, similarity))
+        self.s_key = new_s_key
+        self.s_lookup = new_s_lookup
+
+        recommended_a_id, _ = self.s_lookup[2:]
+
+        self.a_id, self.a = self._selectAction(recommended_a_id)
+
+        return self.a
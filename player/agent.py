@@ -1,8 +1,10 @@
 import numpy as np
 
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
 from util.constants import agent_constants, param_or_default
 from util.database import Database
-from util.helpers import getValidActionsInState
+from util.episode_memory import EpisodeMemory
 from util.stats import Stats
 
 '''
@@ -20,6 +22,8 @@ tables.
 
 Helpful notes:
     Indexing into the q table should always be done with object ids
+    The q table is a util.q_table.QTable, rows are state ids and columns are
+    action ids
 '''
 class Agent:
     '''
@@ -31,11 +35,17 @@ class Agent:
         endgame_discount_factor: discount factor, but at the end of a game
         random_action_rate: how often an agent chooses an action randomly
         dyna_steps: how many "planning" steps the agent should take
+        learning_mode: "dyna" to replay past steps, or "trace" to update them
+            through an eligibility trace
+        trace_decay: with "trace", how quickly past steps stop being updated
+        trace_cutoff: with "trace", the smallest trace a step is kept with
         verbose: TODO make the agent talkative :)
+    rng: a np.random.RandomState to choose random actions from. by default this
+        is np.random
     '''
-    def __init__(self, q, params):
+    def __init__(self, q, params, rng = None):
 
-        self.memory = []
+        self.memory = EpisodeMemory()
         self.q = q
 
         self.learning_rate = param_or_default(params, agent_constants, "learning_rate")
@@ -43,7 +53,13 @@ class Agent:
         self.endgame_discount_factor = param_or_default(params, agent_constants, "endgame_discount_factor")
         self.random_action_rate = param_or_default(params, agent_constants, "random_action_rate")
         self.dyna_steps = param_or_default(params, agent_constants, "dyna_steps")
+        self.learning_mode = param_or_default(params, agent_constants, "learning_mode")
+        if self.learning_mode not in ["dyna", "trace"]:
+            raise Exception("Unknown learning mode {}".format(self.learning_mode))
+        self.trace_decay = param_or_default(params, agent_constants, "trace_decay")
+        self.trace_cutoff = param_or_default(params, agent_constants, "trace_cutoff")
         self.verbose = param_or_default(params, agent_constants, "verbose")
+        self.rng = rng if rng != None else np.random
 
         # Current state
         self.s = None
@@ -53,6 +69,13 @@ class Agent:
         self.a = None
         self.a_id = None
 
+        # Eligibility trace, as (state id, action id, trace) of past steps, and
+        # the action recommended for the latest state
+        self.trace_recommended_a_id = None
+        self.trace_s_ids = np.zeros(0, dtype=np.int64)
+        self.trace_a_ids = np.zeros(0, dtype=np.int64)
+        self.traces = np.zeros(0, dtype=np.float64)
+
     '''
     Set the initial state and return an action. The state passed here
     should be mutated in-place so that it never needs to be regenerated
@@ -80,81 +103,160 @@ class Agent:
 
         # The state should be mutated in place, so we don't actually need to be
         # queried with the new state, just check the new state against the old one
-        old_s_id = self.s_id
         new_s_id = self._snapState()
 
+        recommended_a_id = self._learn(self.s_id, self.a_id, reward, new_s_id, game_ended)
+
+        # Update state
+        self.s_id = new_s_id
+
+        # Select new action
+        self.a_id, self.a = self._selectAction(recommended_a_id)
+
+        return self.a
+
+    '''
+    Learn from transitions which were played elsewhere, for example by actors
+    in other processes. transitions is a list of (state key, action id, reward,
+    next state key, game ended, closest state id, similarity), in the order they
+    were played by one player. the closest state is the one the actor found in
+    its snapshot for the state this agent bootstraps from, see ActorAgent
+    '''
+    def replay(self, transitions):
+        for s_key, a_id, reward, new_s_key, game_ended, closest_s_id, similarity in transitions:
+            self._learn(Database.upsertStateKey(s_key), a_id, reward, Database.upsertStateKey(new_s_key), game_ended, (closest_s_id, similarity))
+
+    '''
+    Update the q table for taking action a_id in state old_s_id, remember the
+    transition, and return the recommended action id for the next action.
+    closest is an optional (state id, similarity) to use when the state
+    bootstrapped from has no q values, instead of looking it up
+    '''
+    def _learn(self, old_s_id, a_id, reward, new_s_id, game_ended, closest = None):
+        if self.learning_mode == "trace":
+            return self._learnTrace(old_s_id, a_id, reward, new_s_id, game_ended, closest)
+
         df = self.endgame_discount_factor if game_ended else self.discount_factor
 
         # Update q table for reward
-        closest_s_id, similarity = self._findClosestState(old_s_id)
+        closest_s_id, similarity = self._findClosestState(old_s_id, closest)
         recommended_a_id, best_future_utility = self._recommendAction(closest_s_id)
-        self._updateQ(old_s_id, self.a_id, reward, df, similarity, best_future_utility)
+        self._updateQ(old_s_id, a_id, reward, df, similarity, best_future_utility)
 
         if self.dyna_steps:
             # If the game is over, update all past actions
-            start = len(self.memory) - 1 if game_ended else len(self.memory) - min(self.dyna_steps, len(self.memory)) - 1
-            # Update q for past decisions
-            for i in range(start, -1, -1):
-                _, best_future_utility = self._recommendAction(self.memory[i]["s'"])
-                self._updateQ(self.memory[i]["s"], self.memory[i]["a"], self.memory[i]["r"], df, 1, best_future_utility)
+            end = len(self.memory) if game_ended else len(self.memory) - min(self.dyna_steps, len(self.memory))
+            if end:
+                self._replayMemory(end, df)
 
         # Remember this
-        self.memory.append({
-            "s": old_s_id,
-            "a": self.a_id,
-            "s'": new_s_id,
-            "r": reward
-        })
+        self.memory.append(old_s_id, a_id, new_s_id, reward)
 
-        # Update state
-        self.s_id = new_s_id
+        return recommended_a_id
 
-        # Select new action
-        self.a_id, self.a = self._selectAction(recommended_a_id)
+    '''
+    Update q for the first end remembered steps, latest first, so that every
+    step bootstraps from the values the steps after it were just given. The
+    rows of every state involved are read once and updated locally, then
+    written back with a single setMany and updateQMany, which gives the same
+    values as updating q one step at a time
+    '''
+    def _replayMemory(self, end, discount_factor):
+        s_ids, a_ids, new_s_ids, rewards = [column[::-1] for column in self.memory.slice(0, end)]
+        states, inverse = np.unique(np.concatenate([s_ids, new_s_ids]), return_inverse=True)
+        values = self.q.getRows(states, int(a_ids.max()) + 1)
+        # the expected reward of the best action in each state, like q.best
+        utilities = np.maximum(values.max(axis=1), 0).tolist()
+        values = values.tolist()
 
-        return self.a
+        q_values = []
+        for row, new_row, a_id, reward in zip(inverse[:end].tolist(), inverse[end:].tolist(), a_ids.tolist(), rewards.tolist()):
+            q_value = (1 - self.learning_rate) * values[row][a_id] + self.learning_rate * (reward + discount_factor * utilities[new_row])
+            values[row][a_id] = q_value
+            utilities[row] = max(max(values[row]), 0)
+            q_values.append(q_value)
+
+        q_values = np.array(q_values, dtype=np.float64)
+        self.q.setMany(s_ids, a_ids, q_values)
+        Database.updateQMany(s_ids, a_ids, q_values)
 
     '''
-    Determine the closest state to the given state
+    Determine the closest state to the given state. closest is used instead of
+    looking it up if it is given and found a state
     '''
-    def _findClosestState(self, to_s_id):
-        if not any(self.q[to_s_id]):
-            return Database.getClosestObservedStateId(to_s_id)
-        else:
+    def _findClosestState(self, to_s_id, closest = None):
+        if self.q.hasState(to_s_id):
             return to_s_id, 1
+        if closest != None and closest[0] != None:
+            return closest
+        return Database.getClosestObservedStateId(to_s_id)
 
     '''
     Determine the best possible action id in a given state from the q table
     '''
     def _recommendAction(self, in_s_id):
-        # find the best action in the closest state
-        recommended_a_id = None
-        best_future_utility = 0
-        # in_s_id could be None if no closest states were found, and it could not
-        # be in q if the game ended before querying the agent with that state
-        if in_s_id != None and in_s_id in self.q:
-            for a_id, expected_reward in self.q[in_s_id].items():
-                if expected_reward > best_future_utility:
-                    recommended_a_id = a_id
-                    best_future_utility = expected_reward
-        return recommended_a_id, best_future_utility
+        # find the best action in the closest state. in_s_id could be None if no
+        # closest states were found, in which case nothing is recommended
+        return self.q.best(in_s_id)
 
     '''
     Update the q table with a reward
     '''
     def _updateQ(self, s_id, a_id, reward, discount_factor, similarity, best_future_utility):
-        if s_id not in self.q:
-            self.q[s_id] = {}
-
-        if a_id not in self.q[s_id]:
-            self.q[s_id][a_id] = 0
-
         # this is a typical q-learning except for "similarity," which is factored
         # in to help deal with how big the state space is
-        q_value = (1 - self.learning_rate) * self.q[s_id][a_id] + self.learning_rate * (reward + similarity * discount_factor * best_future_utility)
-        self.q[s_id][a_id] = q_value
+        q_value = (1 - self.learning_rate) * self.q.get(s_id, a_id) + self.learning_rate * (reward + similarity * discount_factor * best_future_utility)
+        self.q.set(s_id, a_id, q_value)
         Database.updateQ(s_id, a_id, q_value)
 
+    '''
+    Learn from a transition through the eligibility trace, instead of replaying
+    memories, and return the recommended action id for the next action. This
+    is Watkins's Q(lambda): the error of the latest step is applied to every
+    step in the trace, scaled by its trace, in a single update of the whole
+    trace. Helpful notes:
+        unlike dyna, the error is against the best action of the new state (or
+        the closest state to it), which is what carries rewards back through
+        the trace. the last step of a game has no future
+        traces replace, a repeated (state, action) restarts at 1 instead of
+        adding up, so the trace never holds a pair twice
+        taking an action other than the recommended one clears the trace, since
+        what follows a random action says little about the steps before it
+        traces decay by trace_decay * discount_factor every step, and the trace
+        is cleared at the end of a game
+    '''
+    def _learnTrace(self, old_s_id, a_id, reward, new_s_id, game_ended, closest = None):
+        if self.trace_recommended_a_id != None and self.trace_recommended_a_id != a_id:
+            keep = np.zeros(len(self.traces), dtype=bool)
+        else:
+            keep = (self.trace_s_ids != old_s_id) | (self.trace_a_ids != a_id)
+        s_ids = np.append(self.trace_s_ids[keep], old_s_id)
+        a_ids = np.append(self.trace_a_ids[keep], a_id)
+        traces = np.append(self.traces[keep], 1.0)
+
+        closest_s_id, similarity = self._findClosestState(new_s_id, closest)
+        recommended_a_id, best_future_utility = self._recommendAction(closest_s_id)
+        if game_ended:
+            target = reward
+        else:
+            target = reward + similarity * self.discount_factor * best_future_utility
+        error = target - self.q.get(old_s_id, a_id)
+        q_values = self.q.getMany(s_ids, a_ids) + self.learning_rate * error * traces
+        self.q.setMany(s_ids, a_ids, q_values)
+        Database.updateQMany(s_ids, a_ids, q_values)
+
+        if game_ended:
+            keep = np.zeros(len(traces), dtype=bool)
+        else:
+            traces *= self.trace_decay * self.discount_factor
+            keep = traces >= self.trace_cutoff
+        self.trace_s_ids = s_ids[keep]
+        self.trace_a_ids = a_ids[keep]
+        self.traces = traces[keep]
+        self.trace_recommended_a_id = recommended_a_id
+
+        return recommended_a_id
+
     '''
     Select the best (id, action), or a random one
     '''
@@ -162,24 +264,20 @@ class Agent:
         # if no action is recommended or we randomly roll below our
         # random_action_rate, select a random action. TODO it might be a good idea
         # to have state similarity here to pick a closest observed action
-        possible_actions = getValidActionsInState(self.s)
-        possible_action_ids = [Database.upsertAction(action) for action in possible_actions]
-        if not recommended_a_id or np.random.random() < self.random_action_rate or recommended_a_id not in possible_action_ids:
-            random_action_index = np.random.randint(len(possible_action_ids))
-            random_action_id = possible_action_ids[random_action_index]
-            self._printIfVerbose("agent randomly chose", possible_actions[random_action_index])
-            return random_action_id, possible_actions[random_action_index]
+        possible_action_ids = ActionMasks.validActionIds(self.s)
+        if not recommended_a_id or self.rng.random() < self.random_action_rate or recommended_a_id not in possible_action_ids:
+            random_action_id = possible_action_ids[self.rng.randint(len(possible_action_ids))]
+            random_action = ActionCatalog.getAction(random_action_id)
+            self._printIfVerbose("agent randomly chose", random_action)
+            return random_action_id, random_action
         else:
-            action = Database.getAction(recommended_a_id)
+            action = ActionCatalog.getAction(recommended_a_id)
             self._printIfVerbose("agent chose", action)
             Stats.recordStat("{}{}".format("chosen_action={}".format(action["action"]), "_id={}".format(action["card_id"]) if "card_id" in action and action["card_id"] != None else ""))
             return recommended_a_id, action
 
     def _snapState(self):
-        s_id = Database.upsertState(self.s)
-        if s_id not in self.q:
-            self.q[s_id] = {}
-        return s_id
+        return Database.upsertState(self.s)
 
     '''
     Print to the console if verbose is True
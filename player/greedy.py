@@ -0,0 +1,52 @@
+from player.agent import Agent
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
+
+'''
+A GreedyAgent plays a frozen policy for evaluation. It chooses the best action
+from a read-only PolicySnapshot, or a random one random_action_rate of the time,
+and never learns, remembers, records stats or touches the database. This is
+what lets evaluation games run as fast as the game logic allows.
+
+Helpful notes:
+    rewards are ignored, a game's outcome is all that is evaluated
+    actions are recommended from the current state, or the closest state in
+    the snapshot if the current state has no q values
+'''
+class GreedyAgent(Agent):
+    '''
+    Initialize a new greedy agent.
+    snapshot: a util.policy_snapshot.PolicySnapshot or
+        util.mapped_policy.MappedPolicy to choose actions from
+    params: the same params as Agent. only random_action_rate and verbose are
+        used
+    rng: the same as Agent
+    '''
+    def __init__(self, snapshot, params, rng = None):
+        super().__init__(snapshot.q, params, rng = rng)
+        self.snapshot = snapshot
+
+    def initialQuery(self, s):
+        self.s = s
+        self.a_id, self.a = self._selectAction(self.snapshot.recommendAction(self.s.key())[0])
+        return self.a
+
+    def query(self, reward, game_ended = False):
+        # its possible that another player won before initialQuery is called, just
+        # return in this case
+        if not self.s:
+            return
+
+        self.a_id, self.a = self._selectAction(self.snapshot.recommendAction(self.s.key())[0])
+        return self.a
+
+    '''
+    Select the recommended (id, action) if it's valid, or a random one
+    '''
+    def _selectAction(self, recommended_a_id = None):
+        possible_action_ids = ActionMasks.validActionIds(self.s)
+        if not recommended_a_id or (self.random_action_rate and self.rng.random() < self.random_action_rate) or recommended_a_id not in possible_action_ids:
+            recommended_a_id = possible_action_ids[self.rng.randint(len(possible_action_ids))]
+        action = ActionCatalog.getAction(recommended_a_id)
+        self._printIfVerbose("agent chose", action)
+        return recommended_a_id, action
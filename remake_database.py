@@ -1,6 +1,21 @@
+import argparse
+
 from util.database import Database
 
-Database.initialize()
+parser = argparse.ArgumentParser(description = "Drop and recreate every table in data/data.db")
+parser.add_argument("--in-memory", action = "store_true",
+	help = "build the database in memory and back it up to disk when done")
+parser.add_argument("--journal-mode", default = None,
+	help = "journal_mode pragma for the database, such as WAL. it's stored in the file, so later connections keep it")
+parser.add_argument("--synchronous", default = None,
+	help = "synchronous pragma for the database, such as NORMAL")
+args = parser.parse_args()
+
+Database.initialize({
+	"in_memory": args.in_memory,
+	"journal_mode": args.journal_mode,
+	"synchronous": args.synchronous,
+})
 Database.destroyDatabase()
 print("Database destroyed")
 Database.createDatabase()
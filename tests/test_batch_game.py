@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from benchmarks.batch_game import scalarActions
+from game.batch_game import BatchGame, DRAW, PLAY, WAIT
+from game.game import Game
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
+from util.card_definitions import CardDefinitions
+from util.constants import game_constants
+from util.q_table import QTable
+
+'''
+Checks that BatchGame follows the same rules as Game. Scalar games are played
+with random valid actions. Before every action the state of the scalar game is
+copied into a single-game BatchGame, both engines apply the action, and the
+resulting hp, sp, statuses, hands, rewards and winners are compared. Cards and
+characters are defined here, so the check doesn't depend on data/.
+
+Run from the repository root:
+	python -m pytest tests
+'''
+
+cards = {
+	"main": [
+		{"name": "Beer", "type": "cocktail", "sp": 1, "damage": 2, "count": 6},
+		{"name": "Whiskey", "type": "cocktail", "sp": 3, "damage": 5, "count": 3},
+		{"name": "Pretzel", "type": "snack", "sp": 1, "heal": 2, "count": 5},
+		{"name": "Pizza", "type": "snack", "sp": 3, "heal": 6, "count": 2},
+	],
+	"treasures": [{"name": "Gem", "type": "treasure", "sp": 0, "count": 2}],
+	"answers": [{"name": "Yes", "type": "answer", "sp": 0, "count": 2}],
+}
+characters = [
+	{"name": "A", "max_hp": 20, "max_sp": 6, "initial_draw_amount": 4},
+	{"name": "B", "max_hp": 16, "max_sp": 8, "initial_draw_amount": 5},
+]
+
+statuses = {"wait": WAIT, "draw": DRAW, "play": PLAY}
+
+@pytest.fixture(scope = "module")
+def params():
+	CardDefinitions.setDefinitions(cards["main"], cards["treasures"], cards["answers"])
+	ActionCatalog.build()
+	ActionMasks.build()
+	deck_params = {
+		"main_cards": CardDefinitions.cards["main"],
+		"treasure_cards": CardDefinitions.cards["treasures"],
+		"answer_cards": CardDefinitions.cards["answers"]
+	}
+	return deck_params, {"characters": list(characters)}
+
+def copyIntoBatch(game, batch, p):
+	for other_p in range(len(game.players)):
+		internal = game.internals[other_p]
+		external = game.externals[other_p]
+		batch.hp[0, other_p] = external.hp
+		batch.hp_until_max[0, other_p] = external.hp_until_max
+		batch.sp[0, other_p] = external.sp
+		batch.max_sp[0, other_p] = external.max_sp
+		batch.status[0, other_p] = statuses[internal.status]
+		batch.hands[0, other_p] = internal.hand
+
+	deck = game.decks["main"]
+	start = len(batch.deck_cards) - len(deck)
+	batch.decks[0, start:] = deck.cards[deck.cursor:]
+	batch.deck_cursor[0] = start
+
+	batch.turn[0] = game.g.turn
+	batch.current_player[0] = p
+	batch.done[0] = False
+	batch.winner[0] = -1
+	batch.takeRewards()
+
+def compare(game, batch, p, deck_was_empty):
+	mismatches = []
+	winner = game.players.index(game.winning_player) if game.winning_player != None else -1
+	if batch.winner[0] != winner:
+		mismatches.append("winner")
+
+	for other_p in range(len(game.players)):
+		internal = game.internals[other_p]
+		external = game.externals[other_p]
+		for field in ["hp", "hp_until_max"]:
+			if getattr(batch, field)[0, other_p] != getattr(external, field):
+				mismatches.append("player {} {}".format(other_p, field))
+		if batch.status[0, other_p] != statuses[internal.status]:
+			mismatches.append("player {} status".format(other_p))
+		# Game._finishGame hands out the win reward while querying players, which
+		# resets their reward, so it is added here instead
+		reward = game.rewards[other_p]
+		if winner != -1:
+			reward += game_constants["win_reward"] if other_p == winner else -game_constants["win_reward"] / (len(game.players) - 1)
+		if not np.isclose(batch.rewards[0, other_p], reward):
+			mismatches.append("player {} reward".format(other_p))
+
+	internal = game.internals[p]
+	if batch.sp[0, p] != game.externals[p].sp:
+		mismatches.append("sp")
+	hand = internal.hand
+	# when the deck ran out, both engines shuffled a new one independently
+	if deck_was_empty:
+		if batch.hands[0, p].sum() != hand.sum():
+			mismatches.append("hand size")
+	elif not (batch.hands[0, p] == hand).all():
+		mismatches.append("hand")
+	return mismatches
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_batch_game_follows_game_rules(params, seed):
+	deck_params, character_params = params
+	action_indices = {ActionCatalog.actionKey(action): i for i, action in enumerate(ActionCatalog.actions)}
+	rng = np.random.RandomState(seed)
+	np.random.seed(seed)
+	for game_number in range(20):
+		game = Game(QTable(), {}, {}, deck_params, character_params, rng = rng)
+		batch = BatchGame(1, {"num_agents": len(game.players)}, deck_params, character_params, seed = game_number)
+		pending = None
+		for step, (p, action) in enumerate(scalarActions(game)):
+			if pending != None:
+				assert compare(game, batch, *pending) == [], "game {} step {}".format(game_number, step)
+			copyIntoBatch(game, batch, p)
+			game.rewards = [0 for _ in game.players]
+			pending = (p, len(game.decks["main"]) == 0)
+			batch.step([action_indices[ActionCatalog.actionKey(action)]])
+		assert compare(game, batch, *pending) == [], "game {} final step".format(game_number)
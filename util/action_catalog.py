@@ -0,0 +1,75 @@
+from util.card_definitions import CardDefinitions
+from util.helpers import getTargetsForCard
+
+'''
+The ActionCatalog holds every action an agent could ever take. The action
+space is fully known once card definitions are set, so it is built once at
+startup and synced to the action table, after which actions never need to be
+looked up in the database. Helpful notes:
+	ids are the ids of the action table. on a fresh database these are dense,
+		starting from 1, in catalog order
+	actions are stored as {"action", "card_id", "target"}, like
+		DatabaseHelpers.rowToAction returns
+'''
+class ActionCatalog:
+	actions = []
+	ids = {}
+	by_id = {}
+
+	'''
+	Enumerate all actions from the card definitions. CardDefinitions must be set
+	'''
+	@classmethod
+	def build(cls):
+		cls.actions = [
+			{"action": "pass", "card_id": None, "target": None},
+			{"action": "draw", "card_id": None, "target": None},
+		]
+		for card in CardDefinitions.definitions:
+			cls.actions.extend([{
+				"action": "card",
+				"card_id": card["id"],
+				"target": target
+			} for target in getTargetsForCard(card)])
+		cls.ids = {}
+		cls.by_id = {}
+
+	'''
+	Assign ids to the catalog, one per action in catalog order
+	'''
+	@classmethod
+	def setIds(cls, ids):
+		for action, a_id in zip(cls.actions, ids):
+			cls.register(action, a_id)
+
+	'''
+	Add a single action to the catalog under the given id
+	'''
+	@classmethod
+	def register(cls, action, a_id):
+		cls.ids[cls.actionKey(action)] = a_id
+		cls.by_id[a_id] = cls.by_id.get(a_id, {
+			"action": action["action"],
+			"card_id": action.get("card_id"),
+			"target": action.get("target"),
+		})
+
+	@classmethod
+	def getId(cls, action):
+		return cls.ids.get(cls.actionKey(action))
+
+	@classmethod
+	def getAction(cls, a_id):
+		return cls.by_id.get(a_id)
+
+	@classmethod
+	def size(cls):
+		return len(cls.by_id)
+
+	'''
+	A hashable identity for an action. Actions from getValidActionsInState omit
+	card_id and target when they don't apply
+	'''
+	@staticmethod
+	def actionKey(action):
+		return (action["action"], action.get("card_id"), action.get("target"))
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from util.action_catalog import ActionCatalog
+from util.card_definitions import CardDefinitions
+from util.constants import action_mask_constants, game_constants, param_or_default
+from util.state_key import statusCodes
+
+'''
+ActionMasks answers which actions are valid in a state, as action ids from the
+ActionCatalog. Valid actions only depend on the player's status, sp and hand,
+so answers are memoized on those in a bounded LRU cache. Helpful notes:
+	these follow the same rules as getValidActionsInState, which stays the
+		reference implementation
+	cards held more than once give their actions once per copy, so random
+		choices keep weighting them like getValidActionsInState does
+	masks computes the same thing for many states at once, as a (states,
+		actions) bool array over catalog indices, for batched engines
+	ActionCatalog must be built and have ids before calling build
+'''
+class ActionMasks:
+	cache = OrderedDict()
+	hits = 0
+	misses = 0
+	evictions = 0
+
+	'''
+	Set up lookups from the ActionCatalog and clear the cache. params is an
+	optional object with the following fields:
+		cache_size: how many distinct (status, sp, hand) answers to keep
+	'''
+	@classmethod
+	def build(cls, params = {}):
+		cls.cache_size = param_or_default(params, action_mask_constants, "cache_size")
+		cls.cache = OrderedDict()
+		cls.hits = 0
+		cls.misses = 0
+		cls.evictions = 0
+
+		actions = ActionCatalog.actions
+		cls.pass_id = ActionCatalog.getId(actions[0])
+		cls.draw_id = ActionCatalog.getId(actions[1])
+		# action ids for playing each card, indexed by card id
+		cls.card_action_ids = [[] for _ in CardDefinitions.definitions]
+		for action in actions[2:]:
+			cls.card_action_ids[action["card_id"]].append(ActionCatalog.getId(action))
+		cls.sp_by_card = CardDefinitions.table["sp"].tolist()
+
+		# catalog properties for masks, indexed by catalog index
+		cls.is_pass = np.array([action["action"] == "pass" for action in actions])
+		cls.is_draw = np.array([action["action"] == "draw" for action in actions])
+		cls.is_card = np.array([action["action"] == "card" for action in actions])
+		cls.cards = np.array([action["card_id"] for action in actions[2:]], dtype=np.int64)
+		cls.card_sp = CardDefinitions.table["sp"][cls.cards]
+
+	'''
+	Return a tuple of the valid action ids in a state, a game.state.StateView
+	'''
+	@classmethod
+	def validActionIds(cls, state):
+		internal = state.internal
+		sp = state.external.sp
+		# the hand fingerprint in state keys can collide, so the hand itself is
+		# part of the key
+		key = (internal.status, sp, internal.hand.tobytes())
+		a_ids = cls.cache.get(key)
+		if a_ids != None:
+			cls.hits += 1
+			cls.cache.move_to_end(key)
+			return a_ids
+
+		cls.misses += 1
+		a_ids = [cls.pass_id]
+		if (internal.status == "draw" or internal.status == "wait") and sp >= game_constants["sp_per_card"]:
+			a_ids.append(cls.draw_id)
+		for card_id, count in enumerate(internal.hand.tolist()):
+			if count and cls.sp_by_card[card_id] <= sp:
+				a_ids.extend(cls.card_action_ids[card_id] * count)
+		a_ids = tuple(a_ids)
+
+		cls.cache[key] = a_ids
+		if len(cls.cache) > cls.cache_size:
+			cls.cache.popitem(last=False)
+			cls.evictions += 1
+		return a_ids
+
+	'''
+	Return a (states, actions) bool array of which catalog actions are valid, for
+	arrays of statuses (coded like util/state_key.py), sp, and hands as
+	(states, cards) count vectors
+	'''
+	@classmethod
+	def masks(cls, status, sp, hands):
+		status = np.asarray(status)
+		sp = np.asarray(sp)
+		mask = np.zeros((len(status), len(cls.is_pass)), dtype=bool)
+		mask[:, cls.is_pass] = True
+		can_draw = ((status == statusCodes["draw"]) | (status == statusCodes["wait"])) & (sp >= game_constants["sp_per_card"])
+		mask[:, cls.is_draw] = can_draw[:, None]
+		mask[:, cls.is_card] = (np.asarray(hands)[:, cls.cards] > 0) & (cls.card_sp[None, :] <= sp[:, None])
+		return mask
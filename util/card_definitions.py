@@ -1,8 +1,25 @@
+import numpy as np
 
 '''
-The purpose of this class is mainly to make querying for cards easy.
+The purpose of this class is mainly to make querying for cards easy. Helpful
+notes:
+	table is a numpy structured array with a row per card, indexed by card id.
+		numpy code should read card properties from its columns
+	definitions are the card dicts, kept for code which reads one card at a time
+	cards without heal or damage have 0 in those columns, see has_heal and
+		has_damage
 '''
 class CardDefinitions:
+	cardTableDtype = np.dtype([
+		("sp", np.int64),
+		("type", np.int64), # an index into CardDefinitions.types
+		("heal", np.int64),
+		("has_heal", bool),
+		("damage", np.int64),
+		("has_damage", bool),
+		("count", np.int64),
+	])
+
 	@classmethod
 	def setDefinitions(cls, main, treasures, answers):
 		cls.definitions = []
@@ -18,9 +35,23 @@ class CardDefinitions:
 				# cards which are duplicated are just multiple references to the same card
 				cls.cards[name].extend([card for _ in range(card["count"])])
 
+		cls.types = sorted(set([card["type"] for card in cls.definitions]))
+		cls.table = np.array([(
+			card["sp"],
+			cls.types.index(card["type"]),
+			card.get("heal", 0),
+			"heal" in card,
+			card.get("damage", 0),
+			"damage" in card,
+			card["count"],
+		) for card in cls.definitions], dtype=cls.cardTableDtype)
+
 	@classmethod
 	def getCardById(cls, card_id):
 		if card_id == None:
 			return None
 		return cls.definitions[card_id]
 
+	@classmethod
+	def size(cls):
+		return len(cls.definitions)
@@ -0,0 +1,116 @@
+import os
+import pickle
+import time
+
+import numpy as np
+
+from util.constants import param_or_default, run_constants
+from util.database import Database
+from util.stats import Stats
+
+'''
+Checkpoints let a training run stop and later continue where it left off. Every
+so many games or seconds, the database is committed along with everything else
+a run needs to continue: the game counter, the learning rate, the numpy RNG
+state, the order of the characters and Stats. Helpful notes:
+	the database commit only writes what changed since the last commit, since q
+		updates and new states are buffered by Database. with in_memory, it also
+		backs the database up to disk
+	the checkpoint is saved in the database, in the same transaction as the
+		updates it covers, so a resumed run never learns from a game twice. see
+		Database.saveCheckpoint for async writes
+	stats are appended to their own file in chunks of what was recorded since
+		the last checkpoint, so a checkpoint never rewrites the whole history.
+		checkpoints only count chunks which were fully written before them, so a
+		crash at any point leaves the last checkpoint usable
+'''
+class Checkpoint:
+	'''
+	Initialize checkpointing for a run. params is an optional object with the
+	following fields:
+		checkpoint_games: checkpoint after this many games
+		checkpoint_interval: checkpoint after this many seconds
+		checkpoint_stats_path: where to save stats
+	'''
+	def __init__(self, params = {}):
+		self.every_games = param_or_default(params, run_constants, "checkpoint_games")
+		self.interval = param_or_default(params, run_constants, "checkpoint_interval")
+		self.stats_path = param_or_default(params, run_constants, "checkpoint_stats_path")
+
+		self.last_games = 0
+		self.last_time = time.time()
+		# how many of each stat have been saved, and how many chunks they took
+		self.stats_saved = {}
+		self.stats_chunks = 0
+
+	'''
+	Checkpoint if enough games or time have passed since the last checkpoint.
+	games: how many games the run has finished
+	'''
+	def update(self, games, agent_params, character_params):
+		if games - self.last_games >= self.every_games or time.time() - self.last_time >= self.interval:
+			self.save(games, agent_params, character_params)
+
+	def save(self, games, agent_params, character_params):
+		new_stats = {}
+		for key, values in Stats.stats.items():
+			if len(values) > self.stats_saved.get(key, 0):
+				new_stats[key] = values[self.stats_saved.get(key, 0):]
+				self.stats_saved[key] = len(values)
+		with open(self.stats_path, "ab") as file:
+			pickle.dump(new_stats, file, protocol=pickle.HIGHEST_PROTOCOL)
+		self.stats_chunks += 1
+
+		Database.saveCheckpoint(pickle.dumps({
+			"games": games,
+			"learning_rate": agent_params["learning_rate"],
+			"rng": np.random.get_state(),
+			# games shuffle the characters in place, so their order is state too
+			"characters": character_params["characters"],
+			"stats_start_time": Stats.start_time,
+			"stats_chunks": self.stats_chunks,
+		}, protocol=pickle.HIGHEST_PROTOCOL))
+
+		self.last_games = games
+		self.last_time = time.time()
+		print("Checkpointed after game {}".format(games))
+
+	'''
+	Restore the RNG state and Stats from the last checkpoint, and set the learning
+	rate in agent_params and the characters in character_params. Returns how many
+	games the run had finished, or 0 if there is no checkpoint
+	'''
+	def load(self, agent_params, character_params):
+		data = Database.loadCheckpoint()
+		if data == None:
+			return 0
+		checkpoint = pickle.loads(data)
+
+		Stats.stats = {}
+		Stats.start_time = checkpoint["stats_start_time"]
+		# without the stats file, stats start over from the checkpoint
+		self.stats_chunks = 0
+		if os.path.exists(self.stats_path):
+			with open(self.stats_path, "r+b") as file:
+				for _ in range(checkpoint["stats_chunks"]):
+					for key, values in pickle.load(file).items():
+						Stats.stats.setdefault(key, []).extend(values)
+				# drop any chunk written after the checkpoint
+				file.truncate(file.tell())
+			self.stats_chunks = checkpoint["stats_chunks"]
+		self.stats_saved = {key: len(values) for key, values in Stats.stats.items()}
+
+		np.random.set_state(checkpoint["rng"])
+		agent_params["learning_rate"] = checkpoint["learning_rate"]
+		character_params["characters"][:] = checkpoint["characters"]
+		self.last_games = checkpoint["games"]
+		self.last_time = time.time()
+		return checkpoint["games"]
+
+	'''
+	Remove any previous checkpoint, for runs which start from scratch
+	'''
+	def clear(self):
+		Database.clearCheckpoint()
+		if os.path.exists(self.stats_path):
+			os.remove(self.stats_path)
@@ -6,12 +6,42 @@ agent_constants = {
 	"endgame_discount_factor": 0.975,
 	"random_action_rate": 0.1,
 	"dyna_steps": 10,
+	# how agents learn from past steps. "dyna" replays the last dyna_steps steps
+	# after every step, and every step at the end of a game. "trace" keeps an
+	# eligibility trace of past steps and updates them all at once, as Q(lambda)
+	"learning_mode": "dyna",
+	# with "trace", how much a step's trace decays every step, on top of the
+	# discount factor
+	"trace_decay": 0.9,
+	# with "trace", steps are dropped from the trace once it falls below this
+	"trace_cutoff": 0.01,
 	"verbose": False,
 }
 
 run_constants = {
 	"num_games": 1000,
 	"verbose_mod": 50,
+	# 0 plays every game in this process. otherwise games are played by this
+	# many worker processes, and this process only learns from them
+	"num_workers": 0,
+	# how many games each worker plays per task
+	"games_per_task": 5,
+	# how many games to learn from before workers get a fresh copy of q
+	"snapshot_refresh_games": 50,
+	# how many recommendations a snapshot remembers before starting over
+	"snapshot_cache_size": 1000000,
+	# training commits the database and saves a checkpoint after this many
+	# games or seconds, whichever comes first. checkpoints are saved in the
+	# database, and the stats recorded so far in this file
+	"checkpoint_games": 50,
+	"checkpoint_interval": 300,
+	"checkpoint_stats_path": "data/checkpoint.stats",
+	# training saves a snapshot of q here when it finishes, which --eval and
+	# --tournament can load with --snapshot instead of reading the database
+	"snapshot_path": "data/snapshot",
+	# and writes it as a single policy file here, which --snapshot can also load.
+	# any number of processes can memory map it without copying it
+	"policy_path": "data/policy.qmap",
 }
 
 game_constants = {
@@ -19,12 +49,106 @@ game_constants = {
 	"num_humans": 0,
 	"sp_per_card": 2,
 	"max_turns": 500,
+	# how many deck shuffles to generate at a time
+	"shuffle_pool_size": 16,
+	"agent_mode": "learn",
 	"win_reward": 500,
 	"verbose": False,
 }
 
+database_constants = {
+	# q updates are buffered in memory and written in batches once either of
+	# these triggers is hit. a size of 1 writes every update immediately
+	"q_flush_size": 1000,
+	# seconds
+	"q_flush_interval": 5.0,
+	# how many distinct states to keep interned in memory. states past this are
+	# looked up in the database instead
+	"state_cache_size": 1000000,
+	# new states are written in batches of this size
+	"state_flush_size": 1000,
+	# write new states and q updates on a background thread, which commits them
+	# as it goes, so that games never wait on sqlite
+	"async_writes": False,
+	# how many batches may wait for the background writer. flushing blocks while
+	# this many are waiting
+	"write_queue_size": 16,
+	# train against a copy of data/data.db in memory, loaded when the database is
+	# opened. it's written back to disk with sqlite's online backup api whenever
+	# the database is committed, which checkpoints do every checkpoint_games
+	# games, and when it is closed. can't be used with async writes
+	"in_memory": False,
+	# journal_mode and synchronous pragmas for data/data.db, such as "WAL" and
+	# "NORMAL". None leaves sqlite's defaults
+	"journal_mode": None,
+	"synchronous": None,
+}
+
+q_table_constants = {
+	# how many megabytes of memory rows of q values may take. 0 means no limit.
+	# once the table is full, the least valuable states are evicted from memory.
+	# the table also takes 5 bytes for every state id seen, outside of the budget
+	"memory_budget_mb": 0,
+	# how much of the table to evict at a time
+	"evict_fraction": 0.1,
+	# how much each factor counts towards keeping a state in memory: how often
+	# its values were written, how recently it was used, and its largest |q|
+	"eviction_weights": {
+		"visits": 1.0,
+		"recency": 1.0,
+		"magnitude": 1.0,
+	},
+}
+
+tournament_constants = {
+	# matchups are played in batches of this many games
+	"games_per_task": 10,
+	# games with a winner needed before a matchup may stop
+	"min_games": 20,
+	# matchups stop here even if their result isn't clear
+	"max_games": 2000,
+	# confidence level of win rate intervals
+	"confidence": 0.95,
+	# a matchup stops once every win rate interval is at most this far either
+	# side of its estimate
+	"interval_half_width": 0.05,
+	# for 2 player matchups, stop once a sequential probability ratio test shows
+	# one character winning 0.5 + sprt_delta of games rather than half of them,
+	# with these error rates. even matchups are left to the interval rule
+	"sprt_delta": 0.05,
+	"sprt_alpha": 0.05,
+	"sprt_beta": 0.05,
+}
+
+action_mask_constants = {
+	# how many distinct (status, sp, hand) combinations to remember valid actions
+	# for
+	"cache_size": 100000,
+}
+
 state_adjacency_constants = {
-	"batch_size": 100
+	# weights for each factor of state similarity. a weight of 0 means the factor
+	# is unimportant, 1 means the factor is extremely important. see
+	# util/state_index.py for the factors themselves
+	"weights": {
+		"status": 0.1,
+		"hp": 0.25,
+		"sp": 0.2,
+		# left and right mimic self, but weights are halved
+		"left_hp": 0.125,
+		"left_sp": 0.1,
+		"right_hp": 0.125,
+		"right_sp": 0.1,
+	},
+	# only consider states which have q values when finding the closest state
+	"only_states_with_q": True,
+	# "exact" scores every state, "bucket" only scores states in nearby buckets
+	"index": "exact",
+	# how many hp points each bucket of the bucket index spans
+	"bucket_width": 4,
+	# how many neighbouring buckets to search, higher is slower but finds closer
+	# states more often
+	"probe_radius": 1,
 }
 
 '''
@@ -1,49 +1,272 @@
 import sqlite3
+import time
+from collections import deque
 
+import numpy as np
+
+from util.action_catalog import ActionCatalog
+from util.constants import database_constants, param_or_default, q_table_constants, state_adjacency_constants
+from util.database_writer import DatabaseWriter
 from util.helpers import DatabaseHelpers
+from util.q_table import QTable
+from util.state_cache import StateCache
+from util.state_index import createStateIndex
+from util.state_key import blobToKey, keyToBlob
+
+# bumped whenever the schema changes, and stored in the database's user_version.
+# databases with an older version are migrated when they are opened
+schemaVersion = 3
 
+'''
+The Database is where states, actions and q values are stored for good. Every
+statement binds its values as parameters instead of formatting them in, so
+statements are always the same text. sqlite3 keeps statements prepared per
+connection, keyed by their text, so each one is only parsed once. Helpful
+notes:
+	states are identified by their packed key, see util/state_key.py. the other
+		columns are typed, and only kept so that the table stays readable
+	lookups by state key, by action fields, and of a state's q values are
+		answered from indexes alone
+	with in_memory, everything runs against a copy of the database in memory,
+		and each commit backs it up to disk. see database_constants
+'''
 class Database:
+	# pending q updates, keyed by (state_id, action_id)
+	q_buffer = {}
+	last_q_flush = 0
+	# with async writes, the background writer and the states handed to it which
+	# may not be committed yet, as (batch number, {key: id})
+	writer = None
+	unwritten_states = deque()
+	# with in_memory, the version of the database in memory last backed up
+	in_memory = False
+	backed_up_version = None
+
 	@classmethod
-	def _tryExecute(cls, clause):
+	def _tryExecute(cls, clause, params = ()):
 		try:
-			cls.c.execute(clause)
+			cls.c.execute(clause, params)
 		except Exception as e:
 			print(clause)
 			raise e
 
+	# statements which are run often, built once
+	_insertState = "INSERT INTO state (id,key,{}) VALUES (?,?,{})".format(
+		DatabaseHelpers.stateFieldsListString,
+		",".join(["?" for _ in DatabaseHelpers.stateFieldsList])
+	)
+	_selectStateIdByKey = "SELECT id FROM state WHERE key = ?"
+	_selectAction = "SELECT {} FROM action WHERE id = ?".format(DatabaseHelpers.actionFieldsListString)
+	_insertAction = "INSERT OR IGNORE INTO action ({}) VALUES ({})".format(
+		DatabaseHelpers.actionFieldsListString,
+		",".join(["?" for _ in DatabaseHelpers.actionFieldsList])
+	)
+	_selectActionId = "SELECT id FROM action WHERE {}".format(
+		" AND ".join(["{} = ?".format(field) for field in DatabaseHelpers.actionFieldsList])
+	)
+	_upsertQ = "INSERT OR REPLACE INTO q (state_id, action_id, q) VALUES (?, ?, ?)"
+	_selectQByStates = "SELECT state_id, action_id, q FROM q WHERE state_id IN ({})"
+	# holds the whole of every q row but its id, so reloading the values of states
+	# never reads the table itself
+	_createQValuesIndex = "CREATE INDEX IF NOT EXISTS q_state_values ON q(state_id, action_id, q)"
+	# a single row, of the last checkpoint. older databases don't have the table
+	# until a checkpoint is saved or loaded
+	_createCheckpoint = "CREATE TABLE IF NOT EXISTS checkpoint(id INTEGER PRIMARY KEY, data BLOB NOT NULL)"
+
 	"""
 	STATES
 	"""
 	@classmethod
 	def printStates(cls):
+		cls.flushStates()
 		cls._tryExecute("SELECT * FROM state")
 		print(cls.c.fetchall())
 
+	'''
+	Returns the id of a state, interning it if it hasn't been seen before. Known
+	states are answered from the state cache, new states are given an id locally
+	and written in bulk by flushStates
+	'''
 	@classmethod
 	def upsertState(cls, state):
-		row_values = DatabaseHelpers.stateToRow(state)
-		cls._tryExecute("""INSERT OR IGNORE INTO state ({}) VALUES (
-			{}
-		)""".format(
-			DatabaseHelpers.stateFieldsListString,
-			",".join(row_values),
-		))
-		cls._tryExecute("""SELECT id FROM state WHERE {} LIMIT 1""".format(
-			" AND ".join(["{}={}".format(DatabaseHelpers.stateFieldsList[i], val) for i, val in enumerate(row_values)])
+		return cls.upsertStateKey(DatabaseHelpers.stateKey(state))
+
+	'''
+	Like upsertState, but for a key from DatabaseHelpers.stateKey
+	'''
+	@classmethod
+	def upsertStateKey(cls, key):
+		s_id = cls.state_cache.get(key)
+		if s_id != None:
+			return s_id
+
+		# the state may have been evicted from the cache, in which case it is
+		# still in the table
+		if not cls.state_cache.complete:
+			s_id = cls._unwrittenStateId(key)
+			if s_id == None:
+				s_id = cls._selectStateId(key)
+			if s_id != None:
+				cls.state_cache.put(key, s_id)
+				return s_id
+
+		s_id = cls.state_cache.add(key)
+		cls.state_index.add(s_id, DatabaseHelpers.keyToFeatures(key))
+		if len(cls.state_cache.pending) >= cls.state_flush_size:
+			cls.flushStates()
+		return s_id
+
+	'''
+	Returns the id of a state which was handed to the writer but may not be in
+	the table yet, or None
+	'''
+	@classmethod
+	def _unwrittenStateId(cls, key):
+		while cls.unwritten_states and cls.unwritten_states[0][0] <= cls.writer.committed:
+			cls.unwritten_states.popleft()
+		for _, states in cls.unwritten_states:
+			s_id = states.get(key)
+			if s_id != None:
+				return s_id
+		return None
+
+	@classmethod
+	def _selectStateId(cls, key):
+		cls.c.execute(cls._selectStateIdByKey, (keyToBlob(key),))
+		row = cls.c.fetchone()
+		return row[0] if row != None else None
+
+	'''
+	Returns a dict of state id to state key for the given ids
+	'''
+	@classmethod
+	def getStateKeys(cls, s_ids):
+		wanted = set(s_ids)
+		keys = {s_id: key for key, s_id in cls.state_cache.ids.items() if s_id in wanted}
+		missing = [s_id for s_id in wanted if s_id not in keys]
+		if missing:
+			# some states were evicted from the cache
+			cls.flushStates()
+			cls._syncWrites()
+			for start in range(0, len(missing), 500):
+				chunk = missing[start:start + 500]
+				cls.c.execute("SELECT id, key FROM state WHERE id IN ({})".format(
+					",".join(["?" for _ in chunk])
+				), chunk)
+				for s_id, blob in cls.c.fetchall():
+					keys[s_id] = blobToKey(blob)
+		return keys
+
+	'''
+	Writes all pending states from the state cache in a single batch
+	'''
+	@classmethod
+	def flushStates(cls):
+		pending = cls.state_cache.takePending()
+		if pending:
+			cls._executeMany(
+				cls._insertState,
+				((s_id, *DatabaseHelpers.keyToParams(key)) for key, s_id in pending)
+			)
+			if cls.writer != None:
+				cls.unwritten_states.append((cls.writer.submitted, dict(pending)))
+
+	'''
+	Fills the state cache and the state index from the state table. Every state
+	is indexed, but only the newest states are cached
+	'''
+	@classmethod
+	def _loadStates(cls):
+		cls.state_index = createStateIndex(cls.state_index_params)
+		cls._tryExecute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'state'")
+		if cls.c.fetchone() == None:
+			# the database hasn't been created yet
+			cls.state_cache = StateCache(cls.state_cache_size)
+			return
+
+		cls._migrateSchema()
+
+		cls._tryExecute("SELECT COUNT(*), MAX(id) FROM state")
+		count, max_id = cls.c.fetchone()
+		cls.state_cache = StateCache(cls.state_cache_size, (max_id or 0) + 1)
+		cls.state_index.reserve((max_id or 0) + 1)
+		cls._tryExecute("SELECT id, key FROM state ORDER BY id")
+		s_ids = []
+		features = []
+		for i, (s_id, blob) in enumerate(cls.c):
+			key = blobToKey(blob)
+			s_ids.append(s_id)
+			features.append(DatabaseHelpers.keyToFeatures(key))
+			# oldest states go first so that the newest states are evicted last
+			if i >= count - cls.state_cache_size:
+				cls.state_cache.put(key, s_id)
+		if s_ids:
+			cls.state_index.addMany(s_ids, features)
+		cls.state_cache.complete = count <= cls.state_cache_size
+
+		cls._tryExecute("SELECT DISTINCT state_id FROM q")
+		for (s_id,) in cls.c.fetchall():
+			cls.state_index.markHasQ(s_id)
+
+	'''
+	Rebuilds the tables of a database from before schemaVersion with the current
+	schema, keeping every id. State keys are rebuilt from their hand and other
+	columns, either typed or as text from before typed columns. Runs in a single
+	transaction, so an interrupted migration leaves the database as it was.
+	Helpful notes:
+		if two old states end up with the same key, their hands had the same
+			fingerprint. the newer state is dropped along with its q values
+	'''
+	@classmethod
+	def _migrateSchema(cls):
+		cls._tryExecute("PRAGMA user_version")
+		if cls.c.fetchone()[0] >= schemaVersion:
+			return
+		print("Migrating the database to schema version {}".format(schemaVersion))
+
+		cls._tryExecute("BEGIN")
+		cls._tryExecute("PRAGMA table_info(state)")
+		if "card_ids" in [row[1] for row in cls.c.fetchall()]:
+			fields = DatabaseHelpers.legacyStateFieldsList
+		else:
+			fields = DatabaseHelpers.byteHandStateFieldsList
+		cls._tryExecute("SELECT id,{} FROM state ORDER BY id".format(",".join(fields)))
+		keys = {}
+		dropped = []
+		for row in cls.c.fetchall():
+			key = DatabaseHelpers.columnsToKey(row[1:])
+			if key in keys:
+				dropped.append((row[0],))
+			else:
+				keys[key] = row[0]
+		if dropped:
+			print("Dropping {} states whose hands have the same fingerprint as another state's".format(len(dropped)))
+			cls.c.executemany("DELETE FROM q WHERE state_id = ?", dropped)
+
+		# old indexes go with their tables, but their names would clash
+		for index in ["state_key", "action_fields", "q_state_action", "q_state_values"]:
+			cls._tryExecute("DROP INDEX IF EXISTS {}".format(index))
+		for table in ["state", "action", "q"]:
+			cls._tryExecute("ALTER TABLE {} RENAME TO old_{}".format(table, table))
+		cls._createTables()
+		cls.c.executemany(cls._insertState, ((s_id, *DatabaseHelpers.keyToParams(key)) for key, s_id in keys.items()))
+		cls._tryExecute("INSERT INTO action (id,{}) SELECT id,{} FROM old_action".format(
+			DatabaseHelpers.actionFieldsListString,
+			DatabaseHelpers.actionFieldsListString
 		))
-		return cls.c.fetchone()[0]
+		cls._tryExecute("INSERT INTO q (id, state_id, action_id, q) SELECT id, state_id, action_id, q FROM old_q")
+		for table in ["state", "action", "q"]:
+			cls._tryExecute("DROP TABLE old_{}".format(table))
+		cls.connection.commit()
 
 	'''
-	Finds the closest state to the state passed in.
-	Works by selecting a random set of already-observed
-	states from q and computing the closest.
+	Finds the closest state to the state passed in, out of all observed states
+	(or only those with q values, see state_adjacency_constants). Returns
+	(state id, similarity)
 	'''
 	@classmethod
 	def getClosestObservedStateId(cls, to_s_id):
-		cls._tryExecute(DatabaseHelpers.buildClosestObservedStateQuery(to_s_id))
-		row = cls.c.fetchone()
-		state_id, similarity = row if row != None else (None, 0)
-		return state_id, similarity
+		return cls.state_index.closest(to_s_id)
 
 
 	"""
@@ -51,101 +274,410 @@ class Database:
 	"""
 	@classmethod
 	def getAction(cls, a_id):
-		cls._tryExecute("SELECT {} FROM action WHERE id = {}".format(DatabaseHelpers.actionFieldsListString, a_id))
-		return DatabaseHelpers.rowToAction(cls.c.fetchone())
+		action = ActionCatalog.getAction(a_id)
+		if action == None:
+			cls._tryExecute(cls._selectAction, (a_id,))
+			action = DatabaseHelpers.rowToAction(cls.c.fetchone())
+			ActionCatalog.register(action, a_id)
+		return action
 
 	@classmethod
 	def printActions(cls):
 		cls._tryExecute("SELECT * FROM action")
 		print(cls.c.fetchall())
 
+	'''
+	Returns the id of an action, from the action catalog if it is there
+	'''
 	@classmethod
 	def upsertAction(cls, action):
-		row_values = DatabaseHelpers.actionToRow(action)
-		cls._tryExecute("""INSERT OR IGNORE INTO action ({}) VALUES ({})""".format(
-			DatabaseHelpers.actionFieldsListString,
-			",".join(row_values),
-		))
-		cls._tryExecute("""SELECT id FROM action WHERE {} LIMIT 1""".format(
-			" AND ".join(["{}={}".format(DatabaseHelpers.actionFieldsList[i], val) for i, val in enumerate(row_values)])
-		))
-		return cls.c.fetchone()[0]
+		a_id = ActionCatalog.getId(action)
+		if a_id == None:
+			a_id = cls._upsertActionRow(action)
+			ActionCatalog.register(action, a_id)
+		return a_id
+
+	@classmethod
+	def _upsertActionRow(cls, action):
+		cls._syncWrites()
+		params = DatabaseHelpers.actionToParams(action)
+		cls._tryExecute(cls._insertAction, params)
+		cls._tryExecute(cls._selectActionId, params)
+		a_id = cls.c.fetchone()[0]
+		if cls.writer != None:
+			# the writer can't write while this connection holds a transaction
+			cls.connection.commit()
+		return a_id
+
+	'''
+	Writes every action in the action catalog to the action table, and gives the
+	catalog the ids from the table. Should be called once ActionCatalog is built
+	'''
+	@classmethod
+	def syncActionCatalog(cls):
+		ActionCatalog.setIds([cls._upsertActionRow(action) for action in ActionCatalog.actions])
+		cls.commit()
 
 
 	"""
 	Q
 	"""
+	'''
+	Load the q table into memory. With a memory budget, the table only keeps what
+	fits, and states it evicts stop being candidates for closest states until
+	they are written again, which reloads their values from the q table
+	'''
 	@classmethod
 	def getQTable(cls):
-		q = {}
-		cls._tryExecute("SELECT state_id, action_id, q FROM q")
-		for state_id, action_id, q_value in cls.c.fetchall():
-			if state_id not in q:
-				q[state_id] = {}
-			q[state_id][action_id] = q_value
+		cls.flushQ()
+		cls._syncWrites()
+		q = QTable(cls.state_cache.next_id, max(ActionCatalog.by_id.keys(), default = 0) + 1, cls.q_table_params)
+		q.on_evict = cls._unmarkEvictedStates
+		q.on_reload = cls._reloadEvictedStates
+		# rows are replaced on update, so newer rows have larger ids and count as
+		# more recently used
+		cls._tryExecute("SELECT state_id, action_id, q FROM q ORDER BY id")
+		rows = cls.c.fetchall()
+		if rows:
+			s_ids, a_ids, values = zip(*rows)
+			q.setMany(s_ids, a_ids, values)
 		return q
 
+	@classmethod
+	def _unmarkEvictedStates(cls, s_ids):
+		cls.state_index.unmarkHasQ(s_ids)
+
+	'''
+	Read the q values of states evicted from the q table, as (state ids, action
+	ids, values)
+	'''
+	@classmethod
+	def _reloadEvictedStates(cls, s_ids):
+		# updates still buffered or queued for the writer have to be written before
+		# they can be read back
+		cls.flushQ()
+		cls._syncWrites()
+		rows = []
+		s_ids = s_ids.tolist()
+		for start in range(0, len(s_ids), 500):
+			chunk = s_ids[start:start + 500]
+			cls.c.execute(cls._selectQByStates.format(",".join(["?" for _ in chunk])), chunk)
+			rows.extend(cls.c.fetchall())
+		if not rows:
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+		s_ids, a_ids, values = [np.array(column) for column in zip(*rows)]
+		cls.state_index.markHasQ(s_ids)
+		return s_ids, a_ids, values
+
+	'''
+	Buffers a q update. Repeated updates to the same (state, action) pair are
+	merged, and the buffer is written out once it is big or old enough
+	'''
 	@classmethod
 	def updateQ(cls, s_id, a_id, q):
-		# on conflict of unique keys, update q
-		cls._tryExecute("""INSERT OR REPLACE INTO q (state_id, action_id, q) VALUES (
-			{}
-		)""".format(
-			",".join([DatabaseHelpers._parseInt(s_id), DatabaseHelpers._parseInt(a_id), DatabaseHelpers._parseFloat(q)]),
-		))
+		cls.q_buffer[(s_id, a_id)] = q
+		cls.state_index.markHasQ(s_id)
+		if len(cls.q_buffer) >= cls.q_flush_size or time.time() - cls.last_q_flush >= cls.q_flush_interval:
+			cls.flushQ()
+
+	'''
+	Buffers q updates for arrays of state ids, action ids and q values, like
+	updateQ
+	'''
+	@classmethod
+	def updateQMany(cls, s_ids, a_ids, qs):
+		if len(s_ids) == 0:
+			return
+		cls.q_buffer.update(zip(zip(s_ids.tolist(), a_ids.tolist()), qs.tolist()))
+		cls.state_index.markHasQ(s_ids)
+		if len(cls.q_buffer) >= cls.q_flush_size or time.time() - cls.last_q_flush >= cls.q_flush_interval:
+			cls.flushQ()
+
+	'''
+	Writes all buffered q updates in a single batch
+	'''
+	@classmethod
+	def flushQ(cls):
+		# q rows reference states, so write any new states first
+		cls.flushStates()
+		if cls.q_buffer:
+			# on conflict of unique keys, update q
+			cls._executeMany(
+				cls._upsertQ,
+				((DatabaseHelpers._bindInt(s_id), DatabaseHelpers._bindInt(a_id), DatabaseHelpers._bindFloat(q)) for (s_id, a_id), q in cls.q_buffer.items())
+			)
+			cls.q_buffer = {}
+		cls.last_q_flush = time.time()
 
 
 	"""
 	MISC
 	"""
+	'''
+	Runs a statement for many rows, on the writer thread with async writes. rows
+	can be a generator, and is only read by whichever thread runs the statement,
+	so anything it reads must not change after this is called
+	'''
+	@classmethod
+	def _executeMany(cls, clause, rows):
+		if cls.writer != None:
+			cls.writer.put(clause, rows)
+		else:
+			cls.c.executemany(clause, rows)
+
+	'''
+	Waits for the writer to commit everything handed to it, so that the
+	connection can read it
+	'''
+	@classmethod
+	def _syncWrites(cls):
+		if cls.writer != None:
+			cls.writer.sync()
+			cls.unwritten_states.clear()
+
+	'''
+	Open the database. params is an optional object with the following fields:
+		q_flush_size: how many distinct q updates to buffer before writing them
+		q_flush_interval: how many seconds q updates may sit in the buffer
+		state_cache_size: how many interned states to keep in memory
+		state_flush_size: how many new states to hold before writing them
+		any field of state_adjacency_constants, to configure the state index
+		any field of q_table_constants, to configure the q table
+		async_writes: write states and q updates on a background thread
+		write_queue_size: with async writes, how many batches may wait to be
+			written before flushing blocks
+		in_memory: train against a copy of the database in memory, which is
+			written back to disk on every commit and when it is closed
+		journal_mode, synchronous: pragmas for the database on disk
+	'''
 	@classmethod
-	def initialize(cls):
-		cls.connection = sqlite3.connect("data/data.db")
+	def initialize(cls, params = {}):
+		cls.q_flush_size = param_or_default(params, database_constants, "q_flush_size")
+		cls.q_flush_interval = param_or_default(params, database_constants, "q_flush_interval")
+		cls.q_buffer = {}
+		cls.last_q_flush = time.time()
+		cls.state_cache_size = param_or_default(params, database_constants, "state_cache_size")
+		cls.state_flush_size = param_or_default(params, database_constants, "state_flush_size")
+		cls.state_index_params = {name: param_or_default(params, state_adjacency_constants, name) for name in state_adjacency_constants}
+		cls.q_table_params = {name: param_or_default(params, q_table_constants, name) for name in q_table_constants}
+
+		cls.path = "data/data.db"
+		cls.journal_mode = param_or_default(params, database_constants, "journal_mode")
+		cls.synchronous = param_or_default(params, database_constants, "synchronous")
+		cls.in_memory = param_or_default(params, database_constants, "in_memory")
+		async_writes = param_or_default(params, database_constants, "async_writes")
+		if cls.in_memory:
+			# the writer's connection couldn't see a database in memory
+			if async_writes:
+				raise Exception("async_writes can't be used with in_memory")
+			cls.connection = sqlite3.connect(":memory:")
+			disk_connection = cls._connectToDisk()
+			disk_connection.backup(cls.connection)
+			disk_connection.close()
+			cls.backed_up_version = cls._version()
+		else:
+			cls.connection = cls._connectToDisk()
 		cls.c = cls.connection.cursor()
 
+		cls._loadStates()
+
+		cls.writer = None
+		cls.unwritten_states = deque()
+		if async_writes:
+			cls.writer = DatabaseWriter(cls._connectToDisk, param_or_default(params, database_constants, "write_queue_size"))
+
+	'''
+	Open a connection to the database on disk, with the configured pragmas
+	'''
+	@classmethod
+	def _connectToDisk(cls):
+		connection = sqlite3.connect(cls.path)
+		# pragma values can't be bound, so they're checked instead
+		if cls.journal_mode != None:
+			if cls.journal_mode.upper() not in ["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"]:
+				raise Exception("Unknown journal_mode {}".format(cls.journal_mode))
+			connection.execute("PRAGMA journal_mode = {}".format(cls.journal_mode))
+		if cls.synchronous != None:
+			if cls.synchronous.upper() not in ["OFF", "NORMAL", "FULL", "EXTRA"]:
+				raise Exception("Unknown synchronous {}".format(cls.synchronous))
+			connection.execute("PRAGMA synchronous = {}".format(cls.synchronous))
+		return connection
+
+	'''
+	Something which changes whenever the database in memory does: rows written,
+	the schema, and the number of pages, which VACUUM changes
+	'''
+	@classmethod
+	def _version(cls):
+		return (
+			cls.connection.total_changes,
+			cls.connection.execute("PRAGMA schema_version").fetchone()[0],
+			cls.connection.execute("PRAGMA page_count").fetchone()[0],
+		)
+
+	'''
+	With in_memory, write what's committed in memory back to disk, if anything
+	changed since the last backup. The backup runs in a single transaction on
+	the disk database, so a crash part way through leaves the last backup whole
+	'''
+	@classmethod
+	def _backup(cls):
+		if not cls.in_memory or cls._version() == cls.backed_up_version:
+			return
+		disk_connection = cls._connectToDisk()
+		cls.connection.backup(disk_connection)
+		disk_connection.close()
+		cls.backed_up_version = cls._version()
+
+	'''
+	Close the database, writing and committing any q updates still buffered.
+	Helpful notes:
+		with async writes, the buffer is handed to the writer, which commits
+			everything queued before it stops
+	'''
 	@classmethod
 	def destroy(cls):
+		cls.flushQ()
+		if cls.writer != None:
+			cls.writer.close()
+			cls.writer = None
+			cls.unwritten_states.clear()
+		cls.connection.commit()
+		cls._backup()
 		cls.connection.close()
 
 	@classmethod
 	def commit(cls):
+		cls.flushQ()
+		cls._syncWrites()
 		cls.connection.commit()
+		cls._backup()
+
+	'''
+	Commit along with data for the last checkpoint, which loadCheckpoint returns.
+	Both go in one transaction, so the database never holds updates which the
+	checkpoint doesn't cover. Helpful notes:
+		with async writes, the writer commits as it goes, so after a crash the
+			database can hold updates from after the last checkpoint
+	'''
+	@classmethod
+	def saveCheckpoint(cls, data):
+		cls.flushQ()
+		cls._syncWrites()
+		cls._tryExecute(cls._createCheckpoint)
+		cls.c.execute("INSERT OR REPLACE INTO checkpoint (id, data) VALUES (1, ?)", (data,))
+		cls.commit()
+
+	'''
+	Return the data of the last checkpoint, or None if there is none
+	'''
+	@classmethod
+	def loadCheckpoint(cls):
+		cls._tryExecute(cls._createCheckpoint)
+		cls._tryExecute("SELECT data FROM checkpoint WHERE id = 1")
+		row = cls.c.fetchone()
+		return row[0] if row != None else None
+
+	@classmethod
+	def clearCheckpoint(cls):
+		cls._tryExecute(cls._createCheckpoint)
+		cls._tryExecute("DELETE FROM checkpoint")
+		cls.commit()
 
 	@classmethod
 	def createDatabase(cls):
+		cls._createTables()
+		cls.commit()
+		cls._loadStates()
+
+	@classmethod
+	def _createTables(cls):
 		cls._tryExecute("""CREATE TABLE state(
 			id INTEGER PRIMARY KEY,
-			{},
-			UNIQUE({})
+			key BLOB NOT NULL,
+			{}
 		)""".format(
 			",".join(["{} {} NOT NULL".format(field, datatype) for field, datatype in DatabaseHelpers.stateFields]),
-			DatabaseHelpers.stateFieldsListString
 		))
+		# holds (key, id), so interning a state never reads the table itself
+		cls._tryExecute("CREATE UNIQUE INDEX state_key ON state(key)")
 
 		cls._tryExecute("""CREATE TABLE action(
 			id INTEGER PRIMARY KEY,
-			{},
-			UNIQUE({})
+			{}
 		)""".format(
 			",".join(["{} {} NOT NULL".format(field, datatype) for field, datatype in DatabaseHelpers.actionFields]),
-			DatabaseHelpers.actionFieldsListString
 		))
+		# holds (fields, id), for finding the id of an action
+		cls._tryExecute("CREATE UNIQUE INDEX action_fields ON action({})".format(DatabaseHelpers.actionFieldsListString))
 
 		cls._tryExecute("""CREATE TABLE q(
 			id INTEGER PRIMARY KEY,
 			state_id INTEGER NOT NULL,
 			action_id INTEGER NOT NULL,
 			q REAL NOT NULL,
-			UNIQUE(state_id, action_id),
 			FOREIGN KEY(state_id) REFERENCES state(id),
 			FOREIGN KEY(action_id) REFERENCES action(id)
 		)""")
+		# updates replace on conflict with this index, and it answers which states
+		# have q values and which actions they have them for. the table itself is
+		# only read in full, in id order
+		cls._tryExecute("CREATE UNIQUE INDEX q_state_action ON q(state_id, action_id)")
+		cls._tryExecute(cls._createQValuesIndex)
+
+		cls._tryExecute(cls._createCheckpoint)
 
+		cls._tryExecute("PRAGMA user_version = {}".format(schemaVersion))
+
+	'''
+	Shrink the database offline. Drops q values which aren't worth keeping,
+	removes states which are left without q values, renumbers states so that
+	their ids are dense again, and vacuums the file. params is an optional object
+	with the following fields:
+		min_abs_q: drop q values closer to 0 than this
+		max_states: keep only the states with the largest |q| values, at most
+			this many
+	Returns (states before, states after)
+	'''
+	@classmethod
+	def compact(cls, params = {}):
 		cls.commit()
+		cls._tryExecute("SELECT COUNT(*) FROM state")
+		states_before = cls.c.fetchone()[0]
+
+		if params.get("min_abs_q"):
+			cls.c.execute("DELETE FROM q WHERE ABS(q) < ?", (params["min_abs_q"],))
+		if params.get("max_states"):
+			cls.c.execute("""DELETE FROM q WHERE state_id NOT IN (
+				SELECT state_id FROM q GROUP BY state_id ORDER BY MAX(ABS(q)) DESC LIMIT ?
+			)""", (params["max_states"],))
+		cls._tryExecute("DELETE FROM state WHERE id NOT IN (SELECT DISTINCT state_id FROM q)")
+
+		# new ids follow the order of the old ones. ids are negated first so that
+		# no two rows ever share an id while they are being updated
+		cls._tryExecute("CREATE TEMP TABLE state_ids(new_id INTEGER PRIMARY KEY, old_id INTEGER UNIQUE)")
+		cls._tryExecute("INSERT INTO state_ids (old_id) SELECT id FROM state ORDER BY id")
+		cls._tryExecute("UPDATE state SET id = -(SELECT new_id FROM state_ids WHERE old_id = state.id)")
+		cls._tryExecute("UPDATE state SET id = -id")
+		cls._tryExecute("UPDATE q SET state_id = -(SELECT new_id FROM state_ids WHERE old_id = q.state_id)")
+		cls._tryExecute("UPDATE q SET state_id = -state_id")
+		cls._tryExecute("DROP TABLE state_ids")
+		cls.connection.commit()
+		cls._tryExecute("VACUUM")
+
+		cls._tryExecute("SELECT COUNT(*) FROM state")
+		states_after = cls.c.fetchone()[0]
+		cls._loadStates()
+		return states_before, states_after
 
 	@classmethod
 	def destroyDatabase(cls):
+		cls._syncWrites()
 		cls._tryExecute("DROP TABLE IF EXISTS state")
 		cls._tryExecute("DROP TABLE IF EXISTS action")
 		cls._tryExecute("DROP TABLE IF EXISTS q")
+		cls._tryExecute("DROP TABLE IF EXISTS checkpoint")
+		cls.state_cache = StateCache(cls.state_cache_size)
+		cls.state_index = createStateIndex(cls.state_index_params)
+		cls.q_buffer = {}
 		cls.commit()
@@ -0,0 +1,89 @@
+import queue
+import threading
+
+'''
+The DatabaseWriter runs writes on a background thread, so that the thread
+playing games never waits on sqlite. Writes are batches of rows for a single
+statement, and go through a bounded queue to a thread which owns its own
+connection. Everything waiting in the queue when the thread picks it up is
+written in one transaction. Helpful notes:
+	put blocks while the queue is full, so a writer that can't keep up slows
+		the caller down instead of holding more and more in memory
+	batches are written in the order they were put
+	the connection belongs to the writer thread, sqlite connections can't be
+		shared between threads
+	an error on the writer thread is raised on the calling thread by the next
+		put, sync or close. batches after the error are dropped
+'''
+class DatabaseWriter:
+	'''
+	Start a writer with room for queue_size batches. connect is called on the
+	writer thread to open its connection
+	'''
+	def __init__(self, connect, queue_size):
+		self.connect = connect
+		self.queue = queue.Queue(queue_size)
+		self.error = None
+		# how many batches have been put, and how many are committed
+		self.submitted = 0
+		self.committed = 0
+		self.thread = threading.Thread(target = self._run, name = "DatabaseWriter", daemon = True)
+		self.thread.start()
+
+	'''
+	Queue a batch of rows for a statement, waiting if the queue is full. Returns
+	the number of the batch, which is committed once committed reaches it
+	'''
+	def put(self, clause, rows):
+		self._raiseError()
+		self.submitted += 1
+		self.queue.put((clause, rows))
+		return self.submitted
+
+	'''
+	Wait until every batch put so far is committed
+	'''
+	def sync(self):
+		self.queue.join()
+		self._raiseError()
+
+	'''
+	Write everything left in the queue and stop the thread
+	'''
+	def close(self):
+		self.queue.put(None)
+		self.thread.join()
+		self._raiseError()
+
+	def _raiseError(self):
+		if self.error != None:
+			error = self.error
+			self.error = None
+			raise error
+
+	def _run(self):
+		connection = self.connect()
+		c = connection.cursor()
+		stopping = False
+		while not stopping:
+			batches = [self.queue.get()]
+			while True:
+				try:
+					batches.append(self.queue.get_nowait())
+				except queue.Empty:
+					break
+
+			try:
+				for batch in batches:
+					if batch == None:
+						stopping = True
+					elif self.error == None:
+						c.executemany(*batch)
+				connection.commit()
+			except Exception as e:
+				connection.rollback()
+				self.error = e
+			self.committed += len([batch for batch in batches if batch != None])
+			for _ in batches:
+				self.queue.task_done()
+		connection.close()
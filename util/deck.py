@@ -1,31 +1,79 @@
 import numpy as np
 
+from util.card_definitions import CardDefinitions
+
 '''
 The Deck class holds logic related to storing, drawing, and shuffling cards.
+Helpful notes:
+	the deck is a list of card ids and a cursor to the top card. card
+		definitions are only looked up when cards are drawn
+	shuffles are generated in batches, so that refilling the deck only copies
+		the next permutation out of the pool
 '''
 class Deck:
 	'''
-	Initialize a new deck. Cards is a list of card definitions
+	Initialize a new deck.
+	cards: a list of card definitions, duplicates included
+	shuffle_pool_size: how many shuffles to generate at a time
+	seed: seed for the deck's generator. by default it is drawn from np.random,
+		so that decks follow np.random.seed
 	'''
-	def __init__(self, cards):
-		# create shallow copy of cards
-		self.original_cards = cards
+	def __init__(self, cards, shuffle_pool_size = 16, seed = None):
+		self.card_ids = np.array([card["id"] for card in cards], dtype=np.int64)
+		self.shuffle_pool_size = shuffle_pool_size
+		# the generator is only created on the first shuffle, since most decks are
+		# never drawn from
+		self.seed = seed if seed != None else np.random.randint(2 ** 31)
+		self.rng = None
+		self.pool = None
+		self.pool_cursor = 0
+
+		# an empty deck, so that the first draw shuffles
 		self.cards = []
+		self.cursor = 0
 
 	'''
-	Return the top card from the deck, refilling the cards if necessary.
+	Return the top card from the deck, refilling the cards if necessary. If n is
+	given, return a list of the top n cards instead
 	'''
-	def draw(self):
-		if len(self.cards) == 0:
-			self.cards = [card for card in self.original_cards]
-			self.shuffle()
-		return self.cards.pop()
+	def draw(self, n = None):
+		if n == None:
+			if self.cursor == len(self.cards):
+				self.shuffle()
+			card_id = self.cards[self.cursor]
+			self.cursor += 1
+			return CardDefinitions.definitions[card_id]
+
+		card_ids = []
+		while len(card_ids) < n:
+			if self.cursor == len(self.cards):
+				self.shuffle()
+			end = min(self.cursor + n - len(card_ids), len(self.cards))
+			card_ids.extend(self.cards[self.cursor:end])
+			self.cursor = end
+		return [CardDefinitions.definitions[card_id] for card_id in card_ids]
 
 	'''
-	Shuffle the deck to get an approximately random ordering.
+	Refill the deck with every card, in the next shuffled order from the pool.
 	'''
 	def shuffle(self):
-		np.random.shuffle(self.cards)
+		if len(self.card_ids) == 0:
+			raise Exception("Can't shuffle a deck with no cards")
+		if self.pool is None or self.pool_cursor == len(self.pool):
+			if self.rng == None:
+				self.rng = np.random.default_rng(self.seed)
+			self.pool = self.rng.permuted(np.tile(self.card_ids, (self.shuffle_pool_size, 1)), axis=1)
+			self.pool_cursor = 0
+		# drawing single cards is faster from a list
+		self.cards = self.pool[self.pool_cursor].tolist()
+		self.pool_cursor += 1
+		self.cursor = 0
+
+	'''
+	Return how many cards are left before the deck is refilled.
+	'''
+	def __len__(self):
+		return len(self.cards) - self.cursor
 
 	'''
 	Return the top card from the deck.
@@ -0,0 +1,51 @@
+import numpy as np
+
+'''
+The EpisodeMemory holds the transitions an agent made during a game, as (state
+id, action id, next state id, reward). Transitions are kept in preallocated
+numpy columns instead of a dict each, so remembering a step allocates nothing
+until the columns are full, and then they double. Helpful notes:
+	slice returns views into the columns, which are only valid until the next
+		append
+	memory is never shrunk, agents only live for a game
+'''
+class EpisodeMemory:
+	'''
+	Initialize an empty memory with room for capacity transitions
+	'''
+	def __init__(self, capacity = 64):
+		self.size = 0
+		self.s_ids = np.zeros(capacity, dtype=np.int64)
+		self.a_ids = np.zeros(capacity, dtype=np.int64)
+		self.new_s_ids = np.zeros(capacity, dtype=np.int64)
+		self.rewards = np.zeros(capacity, dtype=np.float64)
+
+	def __len__(self):
+		return self.size
+
+	def append(self, s_id, a_id, new_s_id, reward):
+		if self.size == len(self.s_ids):
+			self._resize(2 * len(self.s_ids))
+		self.s_ids[self.size] = s_id
+		self.a_ids[self.size] = a_id
+		self.new_s_ids[self.size] = new_s_id
+		self.rewards[self.size] = reward
+		self.size += 1
+
+	'''
+	Return views of (state ids, action ids, next state ids, rewards) for the
+	transitions from start up to end, like slicing a list
+	'''
+	def slice(self, start = 0, end = None):
+		end = self.size if end == None else min(end, self.size)
+		return self.s_ids[start:end], self.a_ids[start:end], self.new_s_ids[start:end], self.rewards[start:end]
+
+	def clear(self):
+		self.size = 0
+
+	def _resize(self, capacity):
+		for name in ["s_ids", "a_ids", "new_s_ids", "rewards"]:
+			column = getattr(self, name)
+			resized = np.zeros(capacity, dtype=column.dtype)
+			resized[:self.size] = column[:self.size]
+			setattr(self, name, resized)
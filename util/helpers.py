@@ -1,10 +1,12 @@
 import pickle
 import json
 
-from util.constants import game_constants, state_adjacency_constants
+from util.card_definitions import CardDefinitions
+from util.constants import game_constants
+from util.state_key import handKey, keyToBlob, masks, packKey, shifts, statusCodes, statuses, unpackKey
 
 '''
-Returns a list of valid actions given a state
+Returns a list of valid actions given a state, a game.state.StateView
 '''
 def getValidActionsInState(state):
 	# can always do nothing
@@ -13,28 +15,34 @@ def getValidActionsInState(state):
 	}]
 
 	# add drawing action based on SP
-	if (state["internal"]["status"] == "draw" or state["internal"]["status"] == "wait") and state["external"]["sp"] >= game_constants["sp_per_card"]:
+	if (state.internal.status == "draw" or state.internal.status == "wait") and state.external.sp >= game_constants["sp_per_card"]:
 		actions.append({
 			"action": "draw"
 		})
 
-	# add actions for playing cards based on SP
-	for card in state["internal"]["cards"]:
+	# add actions for playing cards based on SP, once per copy in hand
+	for card_id, count in enumerate(state.internal.hand.tolist()):
+		card = CardDefinitions.definitions[card_id]
 		# check if the card can be paid for
-		if card["sp"] <= state["external"]["sp"]:
-			targets = []
-			if card["type"] == "cocktail":
-				targets = ["l", "r"]
-			elif card["type"] == "snack":
-				targets = ["s"]
+		if count and card["sp"] <= state.external.sp:
 			actions.extend([{
 				"action": "card",
-				"card_id": card["id"],
+				"card_id": card_id,
 				"target": target
-			} for target in targets])
+			} for _ in range(count) for target in getTargetsForCard(card)])
 
 	return actions
 
+'''
+Returns the targets a card can be played on
+'''
+def getTargetsForCard(card):
+	if card["type"] == "cocktail":
+		return ["l", "r"]
+	elif card["type"] == "snack":
+		return ["s"]
+	return []
+
 cardsTableFileLocation = "data/cards.json"
 '''
 Load the card definitions
@@ -60,30 +68,32 @@ class DatabaseHelpers:
 	"""
 	HELPERS
 	"""
+	# every value is bound as a statement parameter. missing values are stored
+	# as -1 or "", since they are part of unique keys and NULLs never conflict
 	@staticmethod
-	def _parseInt(n):
-		return str(n) if n != None else "\"-1\""
+	def _bindInt(n):
+		return n if n != None else -1
 	@staticmethod
 	def _extractInt(s):
 		return s if s != -1 else None
 
 	@staticmethod
-	def _parseFloat(n):
-		return str(n) if n != None else "\"-1\""
+	def _bindFloat(n):
+		return n if n != None else -1
 	@staticmethod
 	def _extractFloat(s):
 		return s if s != -1 else None
 
 	@staticmethod
-	def _parseBool(b):
-		return "1" if b else "0"
+	def _bindBool(b):
+		return 1 if b else 0
 	@staticmethod
 	def _extractBool(s):
 		return True if s == 1 else False
 
 	@staticmethod
-	def _parseStr(s):
-		return "\"{}\"".format(s) if s != None else "\"\""
+	def _bindStr(s):
+		return s if s != None else ""
 	@staticmethod
 	def _extractStr(s):
 		return s if s != "" else None
@@ -96,8 +106,10 @@ class DatabaseHelpers:
 		# ("musician_card_id", "TINYINT", ""),
 	]
 	internalStateFields = [
-		("card_ids", "VARCHAR(64)"),
-		("status", "VARCHAR(8)"),
+		# the fingerprint of the hand, see util/state_key.py
+		("hand_fingerprint", "INTEGER"),
+		# an index into stateStatuses
+		("status", "TINYINT"),
 	]
 	externalStateFields = [
 		("hp", "TINYINT"),
@@ -120,88 +132,54 @@ class DatabaseHelpers:
 	]
 	stateFieldsList = [field for field, _ in stateFields]
 	stateFieldsListString = ",".join([field for field, _ in stateFields])
-
+	# state tables from before typed columns stored the hand as comma separated
+	# card ids, and the status as text. after, until hand fingerprints, the hand
+	# was stored as the ids of its cards, a byte each
+	legacyStateFieldsList = ["turn", "card_ids", "status", *stateFieldsList[3:]]
+	byteHandStateFieldsList = ["turn", "hand", "status", *stateFieldsList[3:]]
+
+	'''
+	The packed integer identity of a state, see util/state_key.py
+	'''
 	@staticmethod
-	def _globalStateToRow(global_state):
-		return [
-			DatabaseHelpers._parseInt(global_state["turn"]),
-			# DatabaseHelpers._parseInt(global_state["musician"]["id"]) if global_state["musician"] != None else "NULL",
-		]
-	@staticmethod
-	def _internalStateToRow(internal_state):
-		return [
-			"\"{}\"".format(",".join(sorted([DatabaseHelpers._parseInt(card["id"]) for card in internal_state["cards"]]))) if internal_state["cards"].count else "NULL",
-			DatabaseHelpers._parseStr(internal_state["status"]),
-		]
+	def stateKey(state):
+		return state.key()
+
+	'''
+	Convert column values as read from a state table from before hand
+	fingerprints, ordered like legacyStateFieldsList or byteHandStateFieldsList,
+	into a state key
+	'''
 	@staticmethod
-	def _externalStateToRow(external_state):
-		return [
-			DatabaseHelpers._parseInt(external_state["hp"]),
-			DatabaseHelpers._parseInt(external_state["hp_until_max"]),
-			DatabaseHelpers._parseInt(external_state["sp"]),
-			DatabaseHelpers._parseInt(external_state["max_sp"]),
-			# DatabaseHelpers._parseInt(external_state["treasures"]),
-			# DatabaseHelpers._parseInt(external_state["answers"]),
-			# DatabaseHelpers._parseBool(external_state["has_secrets_in_hand"]),
-			# DatabaseHelpers._parseBool(external_state["has_facedown_cards"]),
-			# DatabaseHelpers._parseBool(external_state["is_friend"])
-		]
+	def columnsToKey(columns):
+		turn, hand, status, *externals = columns
+		if isinstance(hand, bytes):
+			card_ids = list(hand)
+		else:
+			card_ids = [int(card_id) for card_id in str(hand).split(",") if card_id != ""]
+		if isinstance(status, str):
+			status = statusCodes[status]
+		return packKey([turn, status, *externals], handKey(card_ids))
+
+	'''
+	Convert a state key into values which can be bound as statement parameters,
+	the key blob followed by stateFields
+	'''
 	@staticmethod
-	def stateToRow(state):
-		return [
-			*DatabaseHelpers._globalStateToRow(state["g"]),
-			*DatabaseHelpers._internalStateToRow(state["internal"]),
-			*DatabaseHelpers._externalStateToRow(state["external"]),
-			*DatabaseHelpers._externalStateToRow(state["left"]),
-			*DatabaseHelpers._externalStateToRow(state["right"]),
-		]
+	def keyToParams(key):
+		(turn, status, *externals), hand_key = unpackKey(key)
+		return [keyToBlob(key), turn, hand_key, status, *externals]
+
+	# statuses are coded as their index, in the state table and in features
+	stateStatuses = statuses
+	stateFeatureFields = [field for field in stateFieldsList if field != "hand_fingerprint"]
 
+	'''
+	Convert a state key into a list of numbers ordered like stateFeatureFields
+	'''
 	@staticmethod
-	def buildClosestObservedStateQuery(state_id):
-		# formulas for factors should be bounded between 0 and 1. 0 means the
-		# states are as different as possible in this metric, 1 means the states
-		# are identical in this metric. weights for factors also range from 0 to 1
-		# and determine how important each factor is. a weight of 0 means the
-		# factor is unimportant, 1 means the factor is extremely important
-		global_factors = [
-			# i dont think global factors are super important
-		]
-		internal_factors = [
-			# TODO cards are important
-			# TODO status should probably scale other factors
-			("r.status = s.status", 0.1)
-		]
-		external_factors = [
-			# SELF
-			# difference in hp, divided by average of max hps
-			("(2.0 * ABS(r.hp - s.hp) / (r.hp + r.hp_until_max + s.hp + s.hp_until_max))", 0.25),
-			# difference in sp, divided by average of max sps
-			("(2.0 * ABS(r.sp - s.sp) / (r.max_sp + s.max_sp))", 0.2),
-
-			# LEFT mimics self, but weight is halved
-			("(2.0 * ABS(r.left_hp - s.left_hp) / (r.left_hp + r.left_hp_until_max + s.left_hp + s.left_hp_until_max))", 0.125),
-			("(2.0 * ABS(r.left_sp - s.left_sp) / (r.left_max_sp + s.left_max_sp))", 0.1),
-
-			# RIGHT mimics self, but weight is halved
-			("(2.0 * ABS(r.right_hp - s.right_hp) / (r.right_hp + r.right_hp_until_max + s.right_hp + s.right_hp_until_max))", 0.125),
-			("(2.0 * ABS(r.right_sp - s.right_sp) / (r.right_max_sp + s.right_max_sp))", 0.1),
-
-			# TODO treasures, answers, has_secrets_in_hand, has_facedown_cards, is_friend
-		]
-		factors = [
-			*global_factors,
-			*internal_factors,
-			*external_factors
-		]
-		random_states_query = "SELECT * FROM state ORDER BY RANDOM() LIMIT {}".format(state_adjacency_constants["batch_size"])
-		state_query = "SELECT * FROM state WHERE id = {}".format(DatabaseHelpers._parseInt(state_id))
-		return """SELECT r.id, (
-			{}
-		) as similarity FROM ({}) r CROSS JOIN ({}) s ORDER BY similarity DESC LIMIT 1""".format(
-			"*".join(["(1.0 - ({}) * {})".format(formula, weight) for formula, weight in factors]),
-			random_states_query,
-			state_query
-		)
+	def keyToFeatures(key):
+		return [(key >> shift) & mask for shift, mask in zip(shifts, masks)]
 
 	"""
 	ACTIONS
@@ -214,12 +192,16 @@ class DatabaseHelpers:
 	actionFieldsList = [field for field, _ in actionFields]
 	actionFieldsListString = ",".join(actionFieldsList)
 
+	'''
+	Convert an action into values which can be bound as statement parameters,
+	ordered like actionFields
+	'''
 	@staticmethod
-	def actionToRow(action):
+	def actionToParams(action):
 		return [
-			DatabaseHelpers._parseStr(action["action"]),
-			DatabaseHelpers._parseInt(action["card_id"]) if "card_id" in action else "\"-1\"",
-			DatabaseHelpers._parseStr(action["target"]) if "target" in action else "\"\"",
+			DatabaseHelpers._bindStr(action["action"]),
+			DatabaseHelpers._bindInt(action.get("card_id")),
+			DatabaseHelpers._bindStr(action.get("target")),
 		]
 	@staticmethod
 	def rowToAction(row):
@@ -0,0 +1,208 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from util.constants import run_constants, state_adjacency_constants
+from util.helpers import DatabaseHelpers
+from util.state_index import stateSimilarity
+
+'''
+A MappedPolicy is a read-only policy in a single file, which is memory mapped
+instead of being loaded. Any number of processes can open the same file, and
+the operating system shares its pages between them, so memory use doesn't grow
+with every process the way it does when each one loads a PolicySnapshot. It
+answers the same questions as a PolicySnapshot, so agents in "act" or "eval"
+mode can play from either. Helpful notes:
+	the file starts with a header of counts and section offsets, see
+		_headerStruct. every section is a flat array, aligned to 64 bytes
+	state keys are sorted, as big-endian bytes all as wide as the longest key,
+		so a state is found by binary search
+	q values are sorted by state, then action, with an offset per state into
+		them. the best action of every state is worked out when the file is
+		written, so recommendations only read a single row
+	states without q values are left out, like in a PolicySnapshot. unknown
+		states use the closest state in the file, compared over the feature
+		section
+	files are written to a temporary path and moved into place, so processes
+		which already have a file open keep reading the old one
+'''
+
+_magic = b"CARDQMAP"
+_version = 1
+# magic, version, key width, number of features, number of states, number of
+# q values, number of action ids, then the offset of every section
+_sections = ["keys", "state_ids", "best_a_ids", "best_values", "offsets", "a_ids", "values", "features", "action_ids"]
+_headerStruct = struct.Struct("<8sIIqqqq" + "q" * len(_sections))
+_alignment = 64
+
+class MappedPolicy:
+	'''
+	Open a policy file written by MappedPolicy.write
+	'''
+	def __init__(self, path):
+		self.path = path
+		with open(path, "rb") as file:
+			# the mapping stays valid once the file is closed
+			self.buffer = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+
+		magic, version, key_width, num_features, num_states, num_entries, num_action_ids, *offsets = _headerStruct.unpack_from(self.buffer)
+		if magic != _magic or version != _version:
+			raise Exception("{} is not a policy file of version {}".format(path, _version))
+		self.key_width = key_width
+		self.size = num_states
+
+		shapes = _sectionShapes(key_width, num_features, num_states, num_entries, num_action_ids)
+		for name, offset in zip(_sections, offsets):
+			dtype, shape = shapes[name]
+			setattr(self, name, np.frombuffer(self.buffer, dtype = dtype, count = int(np.prod(shape)), offset = offset).reshape(shape))
+
+		# nothing is loaded into a q table, agents only need recommendations
+		self.q = None
+		self.action_ids = self.action_ids.tolist()
+		self.weights = state_adjacency_constants["weights"]
+		self.recommendations = {}
+		self.recommendations_size = run_constants["snapshot_cache_size"]
+
+	@staticmethod
+	def load(path):
+		return MappedPolicy(path)
+
+	'''
+	Write a policy file from a util.policy_snapshot.PolicySnapshot
+	'''
+	@staticmethod
+	def write(path, snapshot):
+		keys = sorted(snapshot.state_ids.keys())
+		state_ids = np.array([snapshot.state_ids[key] for key in keys], dtype=np.int64)
+		key_width = max([(key.bit_length() + 7) // 8 for key in keys], default = 1)
+		best_a_ids, best_values = snapshot.q.bestMany(state_ids)
+
+		# q values ordered by the row of their state, then by action
+		s_ids, a_ids, values = snapshot.q.entries()
+		rows_by_id = np.argsort(state_ids)
+		entry_rows = rows_by_id[np.searchsorted(state_ids[rows_by_id], s_ids)]
+		order = np.lexsort((a_ids, entry_rows))
+		offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+		offsets[1:] = np.cumsum(np.bincount(entry_rows, minlength = len(keys)))
+
+		num_features = len(DatabaseHelpers.stateFeatureFields)
+		action_ids = snapshot.action_ids if snapshot.action_ids != None else []
+		shapes = _sectionShapes(key_width, num_features, len(keys), len(s_ids), len(action_ids))
+		sections = {
+			"keys": np.frombuffer(b"".join([key.to_bytes(key_width, "big") for key in keys]), dtype=shapes["keys"][0]),
+			"state_ids": state_ids,
+			"best_a_ids": best_a_ids,
+			"best_values": best_values,
+			"offsets": offsets,
+			"a_ids": a_ids[order],
+			"values": values[order],
+			"features": snapshot.index.features[state_ids],
+			"action_ids": action_ids,
+		}
+
+		section_offsets = []
+		position = _headerStruct.size
+		for name in _sections:
+			position = (position + _alignment - 1) // _alignment * _alignment
+			section_offsets.append(position)
+			position += int(np.prod(shapes[name][1])) * np.dtype(shapes[name][0]).itemsize
+
+		temporary_path = path + ".tmp"
+		with open(temporary_path, "wb") as file:
+			file.write(_headerStruct.pack(_magic, _version, key_width, num_features, len(keys), len(s_ids), len(action_ids), *section_offsets))
+			for name, offset in zip(_sections, section_offsets):
+				dtype, shape = shapes[name]
+				file.write(b"\0" * (offset - file.tell()))
+				file.write(np.asarray(sections[name], dtype = dtype).reshape(shape).tobytes())
+		os.replace(temporary_path, path)
+
+	'''
+	Return the row of the state with the given key, or -1 if it isn't in the
+	file
+	'''
+	def _row(self, key):
+		if self.size == 0 or key.bit_length() > self.key_width * 8:
+			return -1
+		key_bytes = key.to_bytes(self.key_width, "big")
+		row = int(np.searchsorted(self.keys, key_bytes))
+		if row < self.size and self.keys[row] == key_bytes.rstrip(b"\0"):
+			return row
+		return -1
+
+	def _closestRow(self, key):
+		row = self._row(key)
+		if row >= 0:
+			return row, 1
+		if self.size == 0:
+			return -1, 0
+		similarity = stateSimilarity(self.features, np.asarray(DatabaseHelpers.keyToFeatures(key), dtype=np.float32), self.weights)
+		# ties go to the smallest state id, like in the exact state index
+		rows = np.flatnonzero(similarity == similarity.max())
+		row = int(rows[np.argmin(self.state_ids[rows])])
+		return row, float(similarity[row])
+
+	'''
+	Like PolicySnapshot.closestStateId. Returns (state id, similarity), or
+	(None, 0) if the file has no states
+	'''
+	def closestStateId(self, key):
+		row, similarity = self._closestRow(key)
+		if row < 0:
+			return None, 0
+		return int(self.state_ids[row]), similarity
+
+	'''
+	Like PolicySnapshot.lookup
+	'''
+	def lookup(self, key):
+		lookup = self.recommendations.get(key)
+		if lookup == None:
+			row, similarity = self._closestRow(key)
+			if row < 0:
+				lookup = (None, 0, None, 0)
+			elif self.best_a_ids[row] < 0:
+				lookup = (int(self.state_ids[row]), similarity, None, 0)
+			else:
+				lookup = (int(self.state_ids[row]), similarity, int(self.best_a_ids[row]), float(self.best_values[row]))
+			if len(self.recommendations) >= self.recommendations_size:
+				self.recommendations = {}
+			self.recommendations[key] = lookup
+		return lookup
+
+	'''
+	Like PolicySnapshot.recommendAction
+	'''
+	def recommendAction(self, key):
+		return self.lookup(key)[2:]
+
+	'''
+	Return the q value of an action in the state with the given key, 0 if it has
+	none
+	'''
+	def get(self, key, a_id):
+		row = self._row(key)
+		if row < 0:
+			return 0
+		start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+		i = start + int(np.searchsorted(self.a_ids[start:end], a_id))
+		if i < end and self.a_ids[i] == a_id:
+			return float(self.values[i])
+		return 0
+
+'''
+Return (dtype, shape) of every section
+'''
+def _sectionShapes(key_width, num_features, num_states, num_entries, num_action_ids):
+	return {
+		"keys": ("S{}".format(key_width), (num_states,)),
+		"state_ids": (np.int64, (num_states,)),
+		"best_a_ids": (np.int32, (num_states,)),
+		"best_values": (np.float64, (num_states,)),
+		"offsets": (np.int64, (num_states + 1,)),
+		"a_ids": (np.int32, (num_entries,)),
+		"values": (np.float64, (num_entries,)),
+		"features": (np.float32, (num_states, num_features)),
+		"action_ids": (np.int64, (num_action_ids,)),
+	}
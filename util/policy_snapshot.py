@@ -0,0 +1,134 @@
+import os
+import shutil
+
+import numpy as np
+
+from util.constants import run_constants, state_adjacency_constants
+from util.helpers import DatabaseHelpers
+from util.q_table import QTable
+from util.state_index import createStateIndex
+
+'''
+A PolicySnapshot is a read-only copy of the q table, together with everything
+needed to look states up in it without a database: the keys of every state
+which has q values, and an index of their features for finding the closest
+state to an unknown one. Snapshots can be saved to disk and loaded by other
+processes. Helpful notes:
+	states without q values are left out, since they can't recommend anything
+	state ids in a snapshot are the database's state ids
+	snapshots never change, so recommendations are remembered per state key
+	a saved snapshot is a directory of .npy arrays, which are memory mapped on
+		load instead of being parsed. it also holds the action ids it was taken
+		with, so it can be played without ever opening the database
+'''
+class PolicySnapshot:
+	'''
+	Initialize a snapshot.
+	q: a QTable
+	state_keys: a dict of state id to state key, for every state with q values
+	features: optionally, a 2-D array of features for the states in state_keys,
+		in the same order. computed from the keys if not given
+	action_ids: optionally, the ids of ActionCatalog.actions which q is indexed by
+	'''
+	def __init__(self, q, state_keys, features = None, action_ids = None):
+		self.q = q
+		self.state_ids = {key: s_id for s_id, key in state_keys.items()}
+		self.recommendations = {}
+		self.recommendations_size = run_constants["snapshot_cache_size"]
+		self.action_ids = action_ids
+
+		params = dict(state_adjacency_constants)
+		params["only_states_with_q"] = False
+		self.index = createStateIndex(params)
+		if state_keys:
+			s_ids = list(state_keys.keys())
+			if features is None:
+				features = [DatabaseHelpers.keyToFeatures(state_keys[s_id]) for s_id in s_ids]
+			self.index.addMany(s_ids, features)
+
+	'''
+	Take a snapshot of a q table, using the database to find state keys
+	'''
+	@staticmethod
+	def fromDatabase(q):
+		# imported here so that processes which only load snapshots never need a
+		# database connection
+		from util.action_catalog import ActionCatalog
+		from util.database import Database
+		s_ids, _, _ = q.entries()
+		action_ids = [ActionCatalog.getId(action) for action in ActionCatalog.actions]
+		return PolicySnapshot(q, Database.getStateKeys(np.unique(s_ids).tolist()), action_ids = action_ids)
+
+	'''
+	Return the id of the state with the given key, or the id of the closest
+	state with q values if it isn't in the snapshot. Returns (state id,
+	similarity)
+	'''
+	def closestStateId(self, key):
+		s_id = self.state_ids.get(key)
+		if s_id != None:
+			return s_id, 1
+		return self.index.closestToFeatures(DatabaseHelpers.keyToFeatures(key))
+
+	'''
+	Return (closest state id, similarity, action id, expected reward) for the
+	state with the given key: the closest state with q values, as in
+	closestStateId, and its best action, or None and 0 if nothing is recommended
+	'''
+	def lookup(self, key):
+		lookup = self.recommendations.get(key)
+		if lookup == None:
+			s_id, similarity = self.closestStateId(key)
+			lookup = (s_id, similarity, *self.q.best(s_id))
+			if len(self.recommendations) >= self.recommendations_size:
+				self.recommendations = {}
+			self.recommendations[key] = lookup
+		return lookup
+
+	'''
+	Return (action id, expected reward) for the best action in the state with
+	the given key, or (None, 0) if nothing is recommended
+	'''
+	def recommendAction(self, key):
+		return self.lookup(key)[2:]
+
+	'''
+	Save the snapshot to a directory. Keys are saved as rows of little-endian
+	bytes, all as wide as the longest key. An existing snapshot at path is
+	replaced once the new one is fully written
+	'''
+	def save(self, path):
+		s_ids, a_ids, values = self.q.entries()
+		state_ids = np.array(list(self.state_ids.values()), dtype=np.int64)
+		keys = list(self.state_ids.keys())
+		width = max([(key.bit_length() + 7) // 8 for key in keys], default = 0)
+		state_keys = np.frombuffer(b"".join([key.to_bytes(width, "little") for key in keys]), dtype=np.uint8).reshape(len(keys), width)
+
+		temporary_path = path + ".tmp"
+		shutil.rmtree(temporary_path, ignore_errors = True)
+		os.makedirs(temporary_path)
+		for name, array in [
+			("shape", np.array(self.q.shape(), dtype=np.int64)),
+			("s_ids", s_ids.astype(np.int64)),
+			("a_ids", a_ids.astype(np.int64)),
+			("values", values.astype(np.float64)),
+			("state_ids", state_ids),
+			("state_keys", state_keys),
+			("state_features", self.index.features[state_ids]),
+			("action_ids", np.array(self.action_ids if self.action_ids != None else [], dtype=np.int64)),
+		]:
+			np.save(os.path.join(temporary_path, name + ".npy"), array)
+		shutil.rmtree(path, ignore_errors = True)
+		os.replace(temporary_path, path)
+
+	@staticmethod
+	def load(path):
+		data = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode = "r") for name in [
+			"shape", "s_ids", "a_ids", "values", "state_ids", "state_keys", "state_features", "action_ids",
+		]}
+		q = QTable(*data["shape"].tolist())
+		q.setMany(data["s_ids"], data["a_ids"], data["values"])
+		keys = data["state_keys"].tobytes()
+		width = data["state_keys"].shape[1]
+		state_keys = {s_id: int.from_bytes(keys[i * width:(i + 1) * width], "little") for i, s_id in enumerate(data["state_ids"].tolist())}
+		return PolicySnapshot(q, state_keys, data["state_features"], data["action_ids"].tolist())
@@ -0,0 +1,375 @@
+import numpy as np
+
+from util.constants import param_or_default, q_table_constants
+
+'''
+The QTable holds expected rewards for (state, action) pairs. Each state with
+values gets a row of a dense array, with a column per action id, and a slot
+array maps state ids to rows. Entries which have never been written are
+tracked with a visited mask, and read as 0. Helpful notes:
+	the table grows as larger state or action ids are written
+	reading ids outside of the table is allowed, they are simply unvisited
+	with a memory budget, the table stops growing at the number of rows which
+		fit in it. a batch of the least valuable rows is then evicted to make
+		room, scored on how often they were written, how recently they were
+		used and how large their values are
+	evicted states are just unvisited afterwards, so agents fall back to the
+		closest state which still has values. on_evict is called with their ids
+	values of evicted states are kept wherever on_reload reads them from. get,
+		getMany, set and setMany reload them first, so an update never starts
+		from an evicted row's 0s. best and hasState don't, so reads for
+		recommendations still fall back to the closest state
+	rows get wider as actions are added, and states are evicted if fewer rows
+		fit in the budget
+	the budget only covers rows. slots and evicted take 5 bytes for every state
+		id seen, on top of it
+'''
+class QTable:
+	'''
+	Initialize a new, empty q table with room for the given number of states
+	and actions. params is an optional object with any field of
+	q_table_constants
+	'''
+	def __init__(self, num_states = 1024, num_actions = 1, params = {}):
+		self.memory_budget = param_or_default(params, q_table_constants, "memory_budget_mb") * 1024 * 1024
+		self.evict_fraction = param_or_default(params, q_table_constants, "evict_fraction")
+		self.weights = param_or_default(params, q_table_constants, "eviction_weights")
+		self.on_evict = None
+		# called with an array of evicted state ids, returns their values as
+		# (state ids, action ids, values). without it, evicted values are lost
+		self.on_reload = None
+
+		# row of each state id, -1 for states without values
+		self.slots = np.full(num_states, -1, dtype=np.int32)
+		# whether each state id was evicted, and has values to reload
+		self.evicted = np.zeros(num_states, dtype=bool)
+		rows = max(min(num_states, 1024), 1)
+		self.values = np.zeros((rows, num_actions), dtype=np.float64)
+		self.visited = np.zeros((rows, num_actions), dtype=bool)
+		self.row_states = np.full(rows, -1, dtype=np.int64)
+		self.visits = np.zeros(rows, dtype=np.int64)
+		self.last_used = np.zeros(rows, dtype=np.int64)
+		# rows are handed out in order, then reused from free_rows once evicted
+		self.used_rows = 0
+		self.free_rows = []
+		self.tick = 0
+
+		self.evictions = 0
+
+	def shape(self):
+		return len(self.slots), self.values.shape[1]
+
+	def _slot(self, s_id):
+		if s_id == None or s_id >= len(self.slots):
+			return -1
+		return int(self.slots[s_id])
+
+	'''
+	Return whether any action has been written for a state
+	'''
+	def hasState(self, s_id):
+		return self._slot(s_id) >= 0
+
+	def get(self, s_id, a_id):
+		row = self._slot(s_id)
+		if row < 0 and s_id != None and self._reload(np.array([s_id], dtype=np.int64)):
+			row = self._slot(s_id)
+		if row < 0 or a_id >= self.values.shape[1]:
+			return 0
+		return float(self.values[row, a_id])
+
+	def set(self, s_id, a_id, value):
+		# a new tick first, so that rows used by earlier writes can be evicted if
+		# reserving shrinks the table
+		self.tick += 1
+		self.reserve(s_id + 1, a_id + 1)
+		if self.evicted[s_id]:
+			self._reload(np.array([s_id], dtype=np.int64))
+		row = self._row(s_id)
+		self.values[row, a_id] = value
+		self.visited[row, a_id] = True
+		self.visits[row] += 1
+		self.last_used[row] = self.tick
+
+	'''
+	Read many entries at once. s_ids and a_ids are 1-D arrays of equal length
+	'''
+	def getMany(self, s_ids, a_ids):
+		s_ids = np.asarray(s_ids, dtype=np.int64)
+		a_ids = np.asarray(a_ids, dtype=np.int64)
+		rows = self._rows(s_ids)
+		if self._reload(s_ids[rows < 0]):
+			rows = self._rows(s_ids)
+		inside = (rows >= 0) & (a_ids < self.values.shape[1])
+		values = np.zeros(len(s_ids), dtype=np.float64)
+		values[inside] = self.values[rows[inside], a_ids[inside]]
+		return values
+
+	'''
+	Read the whole rows of many states at once, as a 2-D array of (states,
+	actions). The array is at least num_actions wide, and unwritten entries read
+	as 0, like get
+	'''
+	def getRows(self, s_ids, num_actions = 0):
+		s_ids = np.asarray(s_ids, dtype=np.int64)
+		rows = self._rows(s_ids)
+		if self._reload(s_ids[rows < 0]):
+			rows = self._rows(s_ids)
+		values = np.zeros((len(s_ids), max(num_actions, self.values.shape[1])), dtype=np.float64)
+		values[rows >= 0, :self.values.shape[1]] = self.values[rows[rows >= 0]]
+		return values
+
+	'''
+	Write many entries at once. Later duplicates win, like repeated calls to set,
+	and later states count as more recently used
+	'''
+	def setMany(self, s_ids, a_ids, values):
+		s_ids = np.asarray(s_ids, dtype=np.int64)
+		a_ids = np.asarray(a_ids, dtype=np.int64)
+		values = np.asarray(values, dtype=np.float64)
+		if len(s_ids) == 0:
+			return
+		self.tick += 1
+		self.reserve(int(s_ids.max()) + 1, int(a_ids.max()) + 1)
+		self._reload(s_ids[self.evicted[s_ids]])
+
+		# states in the order they first show up
+		unique, first = np.unique(s_ids, return_index=True)
+		unique = unique[np.argsort(first)]
+		# rows given out in one chunk can't be evicted by the same chunk, so chunks
+		# must fit in the table
+		chunk_size = max(self._maxRows() // 2, 1)
+		for start in range(0, len(unique), chunk_size):
+			chunk = unique[start:start + chunk_size]
+			self.tick += 1
+			# mark rows in the chunk as used first, so that giving out new rows can't
+			# evict them
+			rows = self._rows(chunk)
+			self.last_used[rows[rows >= 0]] = self.tick
+			self._addRows(chunk[rows < 0])
+			entries = np.isin(s_ids, chunk) if len(chunk) < len(unique) else slice(None)
+			entry_rows = self.slots[s_ids[entries]]
+			self.values[entry_rows, a_ids[entries]] = values[entries]
+			self.visited[entry_rows, a_ids[entries]] = True
+			np.add.at(self.visits, entry_rows, 1)
+
+	'''
+	Return (action id, expected reward) for the best action in a state. Only
+	actions with a positive expected reward are recommended, otherwise this
+	returns (None, 0)
+	'''
+	def best(self, s_id):
+		row = self._slot(s_id)
+		if row < 0:
+			return None, 0
+		self.tick += 1
+		self.last_used[row] = self.tick
+		values = np.where(self.visited[row], self.values[row], 0)
+		a_id = int(np.argmax(values))
+		if values[a_id] <= 0:
+			return None, 0
+		return a_id, float(values[a_id])
+
+	'''
+	Vectorized best for many states. Returns (action ids, expected rewards),
+	with an action id of -1 where no action is recommended
+	'''
+	def bestMany(self, s_ids):
+		s_ids = np.asarray(s_ids, dtype=np.int64)
+		rows = self._rows(s_ids)
+		inside = rows >= 0
+		a_ids = np.full(len(s_ids), -1, dtype=np.int64)
+		utilities = np.zeros(len(s_ids), dtype=np.float64)
+		values = np.where(self.visited[rows[inside]], self.values[rows[inside]], 0)
+		if len(values):
+			best = np.argmax(values, axis=1)
+			best_values = values[np.arange(len(values)), best]
+			a_ids[inside] = np.where(best_values > 0, best, -1)
+			utilities[inside] = np.maximum(best_values, 0)
+		return a_ids, utilities
+
+	'''
+	Return every visited entry as (state ids, action ids, values)
+	'''
+	def entries(self):
+		rows, a_ids = np.nonzero(self.visited[:self.used_rows])
+		return self.row_states[rows], a_ids, self.values[rows, a_ids]
+
+	def count(self):
+		return int(self.visited.sum())
+
+	def sum(self):
+		return float(self.values[self.visited].sum())
+
+	'''
+	How many states have values in memory
+	'''
+	def residentStates(self):
+		return self.used_rows - len(self.free_rows)
+
+	'''
+	Make sure the table has room for the given number of states and actions
+	'''
+	def reserve(self, num_states, num_actions = 0):
+		if num_states <= len(self.slots) and num_actions <= self.values.shape[1]:
+			return
+		if num_states > len(self.slots):
+			# grow states geometrically, since new states show up all the time
+			slots = np.full(max(num_states, 2 * len(self.slots)), -1, dtype=np.int32)
+			slots[:len(self.slots)] = self.slots
+			self.slots = slots
+			evicted = np.zeros(len(slots), dtype=bool)
+			evicted[:len(self.evicted)] = self.evicted
+			self.evicted = evicted
+		if num_actions > self.values.shape[1]:
+			self._resize(self.values.shape[0], num_actions)
+		# wider rows leave room for fewer rows in the budget
+		if self.values.shape[0] > self._maxRows():
+			self._shrink(self._maxRows())
+
+	'''
+	Reload the values of states which were evicted, out of the given state ids.
+	Returns whether any were reloaded
+	'''
+	def _reload(self, s_ids):
+		s_ids = s_ids[s_ids < len(self.evicted)]
+		s_ids = np.unique(s_ids[self.evicted[s_ids]])
+		if len(s_ids) == 0:
+			return False
+		self.evicted[s_ids] = False
+		if self.on_reload == None:
+			return False
+		reloaded_s_ids, a_ids, values = self.on_reload(s_ids)
+		self.setMany(reloaded_s_ids, a_ids, values)
+		return len(reloaded_s_ids) > 0
+
+	def _rows(self, s_ids):
+		rows = np.full(len(s_ids), -1, dtype=np.int64)
+		inside = s_ids < len(self.slots)
+		rows[inside] = self.slots[s_ids[inside]]
+		return rows
+
+	'''
+	Return the row of a state, giving it one if it has none
+	'''
+	def _row(self, s_id):
+		row = int(self.slots[s_id])
+		if row >= 0:
+			return row
+
+		if not self.free_rows and self.used_rows == self.values.shape[0]:
+			if self.values.shape[0] < self._maxRows():
+				self._resize(min(2 * self.values.shape[0], self._maxRows()), self.values.shape[1])
+			else:
+				self._evict()
+		if self.free_rows:
+			row = self.free_rows.pop()
+		else:
+			row = self.used_rows
+			self.used_rows += 1
+
+		self.slots[s_id] = row
+		self.row_states[row] = s_id
+		self.visits[row] = 0
+		self.last_used[row] = self.tick
+		return row
+
+	'''
+	Give rows to many states without one. Rows are handed out in one go when they
+	fit without evicting, which is what happens when a table is loaded
+	'''
+	def _addRows(self, s_ids):
+		needed = self.used_rows + len(s_ids)
+		if self.free_rows or needed > self._maxRows():
+			for s_id in s_ids.tolist():
+				self._row(s_id)
+			return
+		if needed > self.values.shape[0]:
+			self._resize(min(max(needed, 2 * self.values.shape[0]), self._maxRows()), self.values.shape[1])
+		rows = np.arange(self.used_rows, needed)
+		self.used_rows = needed
+		self.slots[s_ids] = rows
+		self.row_states[rows] = s_ids
+		self.visits[rows] = 0
+		self.last_used[rows] = self.tick
+
+	'''
+	How many rows fit in the memory budget. Only resident rows count against it,
+	slots and evicted grow with every state id seen whether or not its row is
+	kept, so they are sized apart from the budget
+	'''
+	def _maxRows(self):
+		if not self.memory_budget:
+			return np.iinfo(np.int32).max
+		# values and visited, plus row_states, visits and last_used
+		row_bytes = self.values.shape[1] * 9 + 24
+		return max(int(self.memory_budget // row_bytes), 1)
+
+	def _resize(self, rows, num_actions):
+		# rows past the end are dropped, see _shrink
+		old_rows = min(self.values.shape[0], rows)
+		old_actions = self.values.shape[1]
+		values = np.zeros((rows, num_actions), dtype=np.float64)
+		visited = np.zeros((rows, num_actions), dtype=bool)
+		values[:old_rows, :old_actions] = self.values[:old_rows]
+		visited[:old_rows, :old_actions] = self.visited[:old_rows]
+		self.values = values
+		self.visited = visited
+		for name, fill in [("row_states", -1), ("visits", 0), ("last_used", 0)]:
+			array = np.full(rows, fill, dtype=np.int64)
+			array[:old_rows] = getattr(self, name)[:old_rows]
+			setattr(self, name, array)
+
+	'''
+	Cut the table down to the given number of rows, evicting states until the
+	rest fit and moving rows past the end into free rows before it
+	'''
+	def _shrink(self, rows):
+		while self.residentStates() > rows:
+			self._evict(self.residentStates() - rows)
+
+		moved = np.flatnonzero(self.row_states[rows:self.used_rows] >= 0) + rows
+		free = np.setdiff1d(np.arange(min(rows, self.used_rows)), np.flatnonzero(self.row_states[:rows] >= 0))[:len(moved)]
+		for name in ["values", "visited", "row_states", "visits", "last_used"]:
+			array = getattr(self, name)
+			array[free] = array[moved]
+		self.slots[self.row_states[free]] = free
+
+		self.used_rows = min(self.used_rows, rows)
+		used = self.row_states[:self.used_rows] >= 0
+		self.free_rows = np.flatnonzero(~used).tolist()
+		self._resize(rows, self.values.shape[1])
+
+	'''
+	Evict the least valuable rows, count of them or evict_fraction of the table.
+	Rows used at the current tick are kept, since they are being written
+	'''
+	def _evict(self, count = None):
+		rows = np.flatnonzero(self.row_states[:self.used_rows] >= 0)
+		rows = rows[self.last_used[rows] < self.tick]
+		if len(rows) == 0:
+			raise Exception("The q table memory budget is too small to hold a single write")
+
+		# every factor is scaled to be between 0 and 1, higher is more valuable
+		visits = np.log1p(self.visits[rows])
+		last_used = self.last_used[rows].astype(np.float64)
+		magnitude = np.where(self.visited[rows], np.abs(self.values[rows]), 0).max(axis=1)
+		score = (
+			self.weights["visits"] * visits / max(visits.max(), 1e-9)
+			+ self.weights["recency"] * (last_used - last_used.min()) / max(last_used.max() - last_used.min(), 1e-9)
+			+ self.weights["magnitude"] * magnitude / max(magnitude.max(), 1e-9)
+		)
+		num_evicted = count if count != None else int(self.evict_fraction * len(rows))
+		num_evicted = min(max(num_evicted, 1), len(rows))
+		evicted = rows[np.argpartition(score, num_evicted - 1)[:num_evicted]]
+
+		s_ids = self.row_states[evicted].copy()
+		self.slots[s_ids] = -1
+		self.evicted[s_ids] = True
+		self.row_states[evicted] = -1
+		self.values[evicted] = 0
+		self.visited[evicted] = False
+		self.free_rows.extend(evicted.tolist())
+		self.evictions += len(evicted)
+		if self.on_evict != None:
+			self.on_evict(s_ids)
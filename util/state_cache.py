@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+'''
+The StateCache interns states in memory, mapping each distinct state key (as
+built by DatabaseHelpers.stateKey) to its id in the state table. New states
+are given ids locally and held as pending until the database writes them in
+bulk. Helpful notes:
+	ids are the same ids as in the state table
+	pending states are never evicted, since they only exist in memory
+'''
+class StateCache:
+	'''
+	Initialize a new cache.
+	max_size: how many interned states to keep in memory before evicting the
+		least recently used ones
+	next_id: the id to assign to the next new state
+	'''
+	def __init__(self, max_size, next_id = 1):
+		self.max_size = max_size
+		self.next_id = next_id
+		self.ids = OrderedDict()
+		self.pending = {}
+
+		# whether every state in the table is also in the cache. when it is, a
+		# miss means the state is new and the database doesn't need to be checked
+		self.complete = True
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	'''
+	Return the id for a key, or None if it isn't cached
+	'''
+	def get(self, key):
+		s_id = self.ids.get(key)
+		if s_id == None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self.ids.move_to_end(key)
+		return s_id
+
+	'''
+	Cache an id which is already in the database
+	'''
+	def put(self, key, s_id):
+		self.ids[key] = s_id
+		self._evictIfFull()
+
+	'''
+	Assign a new id to a key. The key is held as pending until it's written
+	'''
+	def add(self, key):
+		s_id = self.next_id
+		self.next_id += 1
+		self.ids[key] = s_id
+		self.pending[key] = s_id
+		self._evictIfFull()
+		return s_id
+
+	'''
+	Return and forget pending states as a list of (key, id)
+	'''
+	def takePending(self):
+		pending = list(self.pending.items())
+		self.pending = {}
+		return pending
+
+	def _evictIfFull(self):
+		while len(self.ids) > self.max_size:
+			for key in self.ids:
+				if key not in self.pending:
+					del self.ids[key]
+					self.evictions += 1
+					self.complete = False
+					break
+			else:
+				# everything left is pending, it'll be evictable once written
+				return
+
+	def __len__(self):
+		return len(self.ids)
@@ -0,0 +1,238 @@
+import numpy as np
+
+from util.helpers import DatabaseHelpers
+
+_columns = {field: i for i, field in enumerate(DatabaseHelpers.stateFeatureFields)}
+
+'''
+Compute the similarity between a target state and many states at once.
+features: a 2-D array of state features, one row per state, ordered like
+	DatabaseHelpers.stateFeatureFields
+target: a 1-D array of features for the state to compare against
+weights: an object mapping factor names to weights, as in
+	state_adjacency_constants
+Returns a 1-D array of similarities between 0 and 1, 1 meaning identical.
+'''
+def stateSimilarity(features, target, weights):
+	# formulas for factors are bounded between 0 and 1. 0 means the states are
+	# identical in this metric, 1 means they are as different as possible.
+	# similarity is the product of (1 - factor * weight) over all factors
+	similarity = np.ones(len(features), dtype=np.float32)
+
+	def applyFactor(name, difference):
+		weight = weights.get(name, 0)
+		if weight:
+			similarity[:] *= 1.0 - difference * weight
+
+	def relativeDifference(field, *max_fields):
+		# difference in a field, divided by the average of the maximums
+		numerator = 2.0 * np.abs(features[:, _columns[field]] - target[_columns[field]])
+		denominator = sum([features[:, _columns[f]] + target[_columns[f]] for f in max_fields])
+		return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+	# TODO cards are important
+	# TODO status should probably scale other factors
+	applyFactor("status", features[:, _columns["status"]] != target[_columns["status"]])
+	for prefix in ["", "left_", "right_"]:
+		applyFactor(prefix + "hp", relativeDifference(prefix + "hp", prefix + "hp", prefix + "hp_until_max"))
+		applyFactor(prefix + "sp", relativeDifference(prefix + "sp", prefix + "max_sp"))
+	# TODO treasures, answers, has_secrets_in_hand, has_facedown_cards, is_friend
+
+	return similarity
+
+'''
+The StateIndex holds the features of every observed state in memory, so that
+the closest state to any other can be found exactly in a single vectorized
+pass. Helpful notes:
+	rows are indexed by state id
+	states are added as they are interned by Database.upsertState
+'''
+class StateIndex:
+	'''
+	Initialize a new, empty index.
+	weights: an object mapping similarity factors to weights
+	only_states_with_q: whether closest states must have q values
+	'''
+	def __init__(self, weights, only_states_with_q = True, capacity = 1024):
+		self.weights = weights
+		self.only_states_with_q = only_states_with_q
+
+		self.features = np.zeros((capacity, len(DatabaseHelpers.stateFeatureFields)), dtype=np.float32)
+		self.known = np.zeros(capacity, dtype=bool)
+		self.has_q = np.zeros(capacity, dtype=bool)
+		# one past the largest state id in the index
+		self.size = 0
+
+	'''
+	Add a state's features to the index
+	'''
+	def add(self, s_id, features):
+		self.reserve(s_id + 1)
+		self.features[s_id] = features
+		self.known[s_id] = True
+		self.size = max(self.size, s_id + 1)
+
+	'''
+	Add many states at once. s_ids is a 1-D array of ids, features a 2-D array
+	with one row per id
+	'''
+	def addMany(self, s_ids, features):
+		s_ids = np.asarray(s_ids, dtype=np.int64)
+		if len(s_ids) == 0:
+			return
+		self.reserve(int(s_ids.max()) + 1)
+		self.features[s_ids] = features
+		self.known[s_ids] = True
+		self.size = max(self.size, int(s_ids.max()) + 1)
+
+	'''
+	Record that a state, or an array of states, has q values
+	'''
+	def markHasQ(self, s_ids):
+		s_ids = np.asarray(s_ids, dtype=np.int64)
+		self.reserve(int(s_ids.max()) + 1)
+		self.has_q[s_ids] = True
+
+	def unmarkHasQ(self, s_ids):
+		s_ids = np.asarray(s_ids, dtype=np.int64)
+		self.has_q[s_ids[s_ids < len(self.has_q)]] = False
+
+	'''
+	Find the most similar state to the given state, other than itself. Returns
+	(state id, similarity), or (None, 0) if there are no candidates
+	'''
+	def closest(self, to_s_id):
+		if to_s_id == None or to_s_id >= self.size or not self.known[to_s_id]:
+			return None, 0
+		return self.closestToFeatures(self.features[to_s_id], exclude = to_s_id)
+
+	'''
+	Find the most similar state to a set of features
+	'''
+	def closestToFeatures(self, features, exclude = None):
+		candidates = self._candidateMask()
+		if exclude != None and exclude < self.size:
+			candidates[exclude] = False
+		if not candidates.any():
+			return None, 0
+
+		similarity = stateSimilarity(self.features[:self.size], np.asarray(features, dtype=np.float32), self.weights)
+		similarity[~candidates] = -1
+		s_id = int(np.argmax(similarity))
+		return s_id, float(similarity[s_id])
+
+	def _candidateMask(self):
+		if self.only_states_with_q:
+			return self.known[:self.size] & self.has_q[:self.size]
+		return self.known[:self.size].copy()
+
+	def reserve(self, capacity):
+		if capacity <= len(self.known):
+			return
+		new_capacity = max(capacity, 2 * len(self.known))
+		features = np.zeros((new_capacity, self.features.shape[1]), dtype=np.float32)
+		features[:len(self.features)] = self.features
+		self.features = features
+		for name in ["known", "has_q"]:
+			mask = np.zeros(new_capacity, dtype=bool)
+			mask[:len(getattr(self, name))] = getattr(self, name)
+			setattr(self, name, mask)
+
+	def __len__(self):
+		return int(self.known[:self.size].sum())
+
+'''
+The BucketStateIndex is an approximate StateIndex. States are hashed into
+buckets by their status, their own hp and sp and their neighbours' hp, and a
+query only scores the states in the target's bucket and the buckets around it.
+Helpful notes:
+	bucket_width: how many hp points each bucket spans. sp buckets span half
+		as many points
+	probe_radius: how many neighbouring buckets to search in each direction.
+		this is the recall vs latency knob, 0 only searches the target's bucket
+	if no candidates are found in the probed buckets, all states are searched
+'''
+class BucketStateIndex(StateIndex):
+	# values past the last bucket share it
+	bins = 32
+
+	def __init__(self, weights, only_states_with_q = True, capacity = 1024, bucket_width = 4, probe_radius = 1):
+		super().__init__(weights, only_states_with_q, capacity)
+		self.bucket_width = bucket_width
+		self.buckets = {}
+
+		# every combination of offsets for the hp and sp dimensions
+		offsets = np.arange(-probe_radius, probe_radius + 1)
+		self.probe_offsets = np.array(np.meshgrid(offsets, offsets, offsets, offsets)).reshape(4, -1).T
+
+	def add(self, s_id, features):
+		self.addMany([s_id], np.asarray(features, dtype=np.float32).reshape(1, -1))
+
+	def addMany(self, s_ids, features):
+		s_ids = np.asarray(s_ids, dtype=np.int64)
+		features = np.asarray(features, dtype=np.float32)
+		# states may be re-added, so drop them from their old buckets first
+		if self.size:
+			existing = s_ids[s_ids < self.size]
+			existing = existing[self.known[existing]]
+			for s_id, code in zip(existing.tolist(), self._bucketCodes(self.features[existing]).tolist()):
+				self.buckets[code].remove(s_id)
+
+		super().addMany(s_ids, features)
+		for s_id, code in zip(s_ids.tolist(), self._bucketCodes(features).tolist()):
+			if code not in self.buckets:
+				self.buckets[code] = []
+			self.buckets[code].append(s_id)
+
+	def closestToFeatures(self, features, exclude = None):
+		features = np.asarray(features, dtype=np.float32)
+		bins = self._bucketBins(features.reshape(1, -1))[0]
+		probed = np.clip(bins[1:] + self.probe_offsets, 0, self.bins - 1)
+		codes = set(self._codesFromBins(np.column_stack([np.full(len(probed), bins[0]), probed])).tolist())
+
+		candidates = []
+		for code in codes:
+			candidates.extend(self.buckets.get(code, []))
+		candidates = np.array(candidates, dtype=np.int64)
+		if len(candidates):
+			mask = self._candidateMask()[candidates]
+			if exclude != None:
+				mask &= candidates != exclude
+			candidates = candidates[mask]
+		if len(candidates) == 0:
+			return super().closestToFeatures(features, exclude)
+
+		similarity = stateSimilarity(self.features[candidates], features, self.weights)
+		best = int(np.argmax(similarity))
+		return int(candidates[best]), float(similarity[best])
+
+	def _bucketBins(self, features):
+		def quantize(field, width):
+			return np.clip((features[:, _columns[field]] // width).astype(np.int64), 0, self.bins - 1)
+
+		return np.column_stack([
+			features[:, _columns["status"]].astype(np.int64),
+			quantize("hp", self.bucket_width),
+			quantize("sp", max(self.bucket_width // 2, 1)),
+			quantize("left_hp", self.bucket_width),
+			quantize("right_hp", self.bucket_width),
+		])
+
+	def _codesFromBins(self, bins):
+		codes = bins[:, 0]
+		for column in range(1, bins.shape[1]):
+			codes = codes * self.bins + bins[:, column]
+		return codes
+
+	def _bucketCodes(self, features):
+		return self._codesFromBins(self._bucketBins(features))
+
+'''
+Create the state index described by params, see state_adjacency_constants
+'''
+def createStateIndex(params):
+	if params["index"] == "exact":
+		return StateIndex(params["weights"], params["only_states_with_q"])
+	if params["index"] == "bucket":
+		return BucketStateIndex(params["weights"], params["only_states_with_q"], bucket_width = params["bucket_width"], probe_radius = params["probe_radius"])
+	raise Exception("Unknown state index {}".format(params["index"]))
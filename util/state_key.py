@@ -0,0 +1,99 @@
+'''
+States are identified by a single packed 128 bit integer. The fields of
+DatabaseHelpers.stateFields are packed into fixed-width bit fields with integer
+shifts, lowest bits first, and a fingerprint of the hand fills the bits above
+them. Helpful notes:
+	the numeric fields can be unpacked from a key, the hand can't. two hands
+		with the same fingerprint are the same state, which is rare enough
+		with handBits bits not to matter for learning. anything which must be
+		exact about the hand, like valid actions, reads the hand itself
+	the fingerprint of a hand is the sum of its cards' fingerprints, modulo
+		2 ** handBits, so it is updated in place as cards are added or removed
+	card fingerprints are derived from card ids alone, so keys are the same in
+		every process and every run
+	keys are keyBytes wide big-endian blobs in the database
+'''
+
+# (field, bits) for every field except hand, in stateFields order. turn only
+# needs to reach max_turns, hp fields the largest max_hp, and sp fields the
+# largest max_sp
+numericFields = [
+	("turn", 9),
+	("status", 2),
+	*[
+		("{}{}".format(prefix, field), bits)
+		for prefix in ["", "left_", "right_"]
+		for field, bits in [("hp", 7), ("hp_until_max", 7), ("sp", 6), ("max_sp", 6)]
+	],
+]
+numericFieldsList = [field for field, _ in numericFields]
+
+# where each numeric field starts
+shifts = []
+_shift = 0
+for _, bits in numericFields:
+	shifts.append(_shift)
+	_shift += bits
+masks = [(1 << bits) - 1 for _, bits in numericFields]
+
+# the hand fingerprint starts above every numeric field, and fills the key
+handShift = _shift
+keyBits = 128
+keyBytes = keyBits // 8
+handBits = keyBits - handShift
+handMask = (1 << handBits) - 1
+
+statuses = ["wait", "draw", "play"]
+statusCodes = {status: code for code, status in enumerate(statuses)}
+
+'''
+Return the fingerprint of a single card, a splitmix64 hash of its id cut down to
+handBits
+'''
+def _cardFingerprint(card_id):
+	x = (card_id + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+	x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+	x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+	return (x ^ (x >> 31)) & handMask
+
+_cardFingerprints = [_cardFingerprint(card_id) for card_id in range(256)]
+
+'''
+Return the fingerprint of a single card. Hands are the sum of these over their
+cards, masked with handMask
+'''
+def cardKey(card_id):
+	if card_id < len(_cardFingerprints):
+		return _cardFingerprints[card_id]
+	return _cardFingerprint(card_id)
+
+'''
+Return the fingerprint of a hand, given as a list of card ids
+'''
+def handKey(card_ids):
+	return sum([cardKey(card_id) for card_id in card_ids]) & handMask
+
+'''
+Pack numeric field values, ordered like numericFields, and a hand fingerprint
+'''
+def packKey(values, hand_key):
+	key = hand_key << handShift
+	for value, shift, mask in zip(values, shifts, masks):
+		# catches negative values too, which have bits above mask set
+		if value & mask != value:
+			raise Exception("State values {} do not fit the state key layout".format(values))
+		key |= value << shift
+	return key
+
+'''
+Unpack a key into (numeric field values ordered like numericFields, hand
+fingerprint)
+'''
+def unpackKey(key):
+	return [(key >> shift) & mask for shift, mask in zip(shifts, masks)], key >> handShift
+
+def keyToBlob(key):
+	return key.to_bytes(keyBytes, "big")
+
+def blobToKey(blob):
+	return int.from_bytes(blob, "big")
@@ -1,4 +1,5 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import time
 
 class Stats:
@@ -25,14 +26,67 @@ class Stats:
 	def printQStats(q):
 		print("")
 		print("--- Q ----")
-		ct = 0
-		s = 0
-		for s_id in q.keys():
-			for a_id in q[s_id].keys():
-				ct += 1
-				s += q[s_id][a_id]
+		ct = q.count()
+		s = q.sum()
 		print("sum", s)
-		print("average", s / ct)
+		print("average", s / ct if ct else 0)
+		print("states in memory", q.residentStates())
+		print("evicted states", q.evictions)
+		print("")
+
+	@staticmethod
+	def printStateCacheStats(cache):
+		print("")
+		print("--- STATE CACHE ----")
+		print("size", len(cache))
+		print("hits", cache.hits)
+		print("misses", cache.misses)
+		print("hit rate", cache.hits / max(cache.hits + cache.misses, 1))
+		print("evictions", cache.evictions)
+		print("")
+
+	@staticmethod
+	def printActionMaskStats(masks):
+		print("")
+		print("--- ACTION MASKS ----")
+		print("size", len(masks.cache))
+		print("hits", masks.hits)
+		print("misses", masks.misses)
+		print("hit rate", masks.hits / max(masks.hits + masks.misses, 1))
+		print("evictions", masks.evictions)
+		print("")
+
+	@staticmethod
+	def printEvaluationStats(results):
+		games = results["games"]
+		turns = results["turns"]
+		print("")
+		print("--- EVALUATION ----")
+		print("games", games)
+		print("timeouts", results["timeouts"])
+		if games:
+			print("turns mean {:.1f} median {:.0f} p90 {:.0f} max {}".format(turns.mean(), np.percentile(turns, 50), np.percentile(turns, 90), turns.max()))
+		for name in sorted(results["characters"].keys()):
+			character = results["characters"][name]
+			print("{}: won {} of {} ({:.3f})".format(name, character["wins"], character["games"], character["wins"] / max(character["games"], 1)))
+		print("")
+
+	@staticmethod
+	def printTournamentStats(results):
+		print("")
+		print("--- TOURNAMENT ----")
+		for matchup in results:
+			print("{}: {} games, {} timeouts, {:.1f} turns on average, stopped by {}{}".format(
+				" vs ".join(matchup["characters"]),
+				matchup["games"],
+				matchup["timeouts"],
+				matchup["mean_turns"],
+				matchup["decision"],
+				" favouring {}".format(matchup["favoured"]) if matchup["favoured"] != None else ""
+			))
+			for name in matchup["characters"]:
+				low, high = matchup["intervals"][name]
+				print("  {}: won {} ({:.3f}, interval {:.3f} to {:.3f})".format(name, matchup["wins"][name], matchup["win_rates"][name], low, high))
 		print("")
 
 	@staticmethod
@@ -0,0 +1,27 @@
+from util.action_catalog import ActionCatalog
+from util.action_masks import ActionMasks
+from util.card_definitions import CardDefinitions
+
+'''
+Set up a worker process to play games, for the pools of game/self_play.py and
+game/tournament.py. Card definitions, the action catalog and action masks are
+rebuilt in the worker, and worker, the dict of state which lives in the worker
+process, is given the params games are played with. Helpful notes:
+	action_ids are the ids of ActionCatalog.actions in the parent, so that action ids match
+		the ones in q
+	card definitions are copied into the worker, so decks need the worker's own
+		references to them, in worker["deck_params"]
+'''
+def initializeWorker(worker, cards, action_ids, game_params, agent_params):
+	CardDefinitions.setDefinitions(cards["main"], cards["treasures"], cards["answers"])
+	ActionCatalog.build()
+	ActionCatalog.setIds(action_ids)
+	ActionMasks.build()
+
+	worker["game_params"] = game_params
+	worker["agent_params"] = agent_params
+	worker["deck_params"] = {
+		"main_cards": CardDefinitions.cards["main"],
+		"treasure_cards": CardDefinitions.cards["treasures"],
+		"answer_cards": CardDefinitions.cards["answers"]
+	}